@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import configargparse
+
+from dgt.bluetooth import BtConnector
+
+# bluetoothctl with the (colored) output of a DGT board found after the scan delay
+FAKE_BTCTL = r'''
+import sys, time, threading
+delay, scan_secs, pair_secs = float(sys.argv[1]), float(sys.argv[2]), float(sys.argv[3])
+def out(text, end='\n'):
+    sys.stdout.write(text + end)
+    sys.stdout.flush()
+def found():
+    time.sleep(scan_secs)
+    out('\x1b[0;93m[CHG]\x1b[0m Device 00:1B:10:00:0F:EE RSSI: -60')
+    out('[bluetooth]# \x1b[0;92m[NEW]\x1b[0m Device 00:1B:10:00:0F:EE DGT_BT_22334')
+for line in sys.stdin:
+    command = line.split()
+    time.sleep(delay)
+    if not command:
+        continue
+    if command[0] == 'quit':
+        break
+    if command[0] == 'power':
+        out('Changing power on succeeded')
+    elif command[0] == 'agent':
+        out('Agent registered')
+    elif command[0] == 'default-agent':
+        out('Default agent request successful')
+    elif command[0] == 'scan':
+        out('Discovery started')
+        out('\x1b[0;93m[CHG]\x1b[0m Controller B8:27:EB:00:00:01 Discovering: yes')
+        threading.Thread(target=found, daemon=True).start()
+    elif command[0] == 'pair':
+        out('Attempting to pair with ' + command[1])
+        out('\x1b[0;94m[agent]\x1b[0m Enter PIN code: ', end='')
+    elif command[0] in ('0000', '1234'):
+        time.sleep(pair_secs)
+        out('Pairing successful')
+'''
+
+# rfcomm creating the device file (connect blocks like the real one)
+FAKE_RFCOMM = r'''
+import os, sys, time
+device = os.path.join(sys.argv[1], 'rfcomm' + sys.argv[4])
+if sys.argv[3] == 'bind':
+    open(device, 'w').close()
+elif sys.argv[3] == 'connect':
+    time.sleep(float(sys.argv[2]))
+    open(device, 'w').close()
+    time.sleep(3600)
+elif sys.argv[3] == 'release' and os.path.exists(device):
+    os.remove(device)
+'''
+
+
+def write_script(folder: str, name: str, source: str, *args):
+    """Write an executable python script calling source with the given (first) arguments."""
+    with open(os.path.join(folder, name + '.py'), 'w') as file:
+        file.write(source)
+    script = os.path.join(folder, name)
+    with open(script, 'w') as file:
+        file.write('#!/bin/sh\nexec {} {} {} "$@"\n'.format(sys.executable, os.path.join(folder, name + '.py'),
+                                                            ' '.join(str(arg) for arg in args)))
+    os.chmod(script, 0o755)
+    return script
+
+
+def connect(connector: BtConnector, board_there: bool, timeout: float):
+    """Poll the connector like DgtBoard does and return the secs until a connection (None = timeout)."""
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        device = connector.poll()
+        if device:
+            if connector.state != 'direct' or board_there:
+                connector.connected()
+                return time.monotonic() - start
+            connector.failed()  # the board of the cache is switched off
+        time.sleep(0.1)
+    return None
+
+
+def main():
+    """Measure the bluetooth (re)connect time with a scripted fake bluetoothctl & rfcomm."""
+    parser = configargparse.ArgParser()
+    parser.add_argument('-r', '--runs', type=int, default=3, help='connects per scenario')
+    parser.add_argument('--delay', type=float, default=0.1, help='secs bluetoothctl needs for a command')
+    parser.add_argument('--scan', type=float, default=5.0, help='secs until the scan finds the board')
+    parser.add_argument('--pair', type=float, default=1.0, help='secs for the pairing')
+    parser.add_argument('--connect', type=float, default=1.5, help='secs for a rfcomm connect')
+    parser.add_argument('-t', '--timeout', type=float, default=60.0, help='secs to wait for a connection')
+    parser.add_argument('-l', '--log-level', choices=['notset', 'debug', 'info', 'warning', 'error', 'critical'],
+                        default='warning', help='logging level')
+    args = parser.parse_args()
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()))
+
+    with tempfile.TemporaryDirectory(prefix='btbench') as folder:
+        btctl = write_script(folder, 'bluetoothctl', FAKE_BTCTL, args.delay, args.scan, args.pair)
+        rfcomm = write_script(folder, 'rfcomm', FAKE_RFCOMM, folder, args.connect)
+        cache_file = os.path.join(folder, 'bt_cache.json')
+        connector = BtConnector(cache_file=cache_file, btctl=btctl, rfcomm=rfcomm, dev_dir=folder)
+        for scenario in ('scan', 'cached', 'stale cache'):
+            times = []
+            for _ in range(args.runs):
+                if scenario == 'scan' and os.path.exists(cache_file):
+                    os.remove(cache_file)
+                connector.direct_after = 0.0
+                times.append(connect(connector, scenario != 'stale cache', args.timeout))
+            print('{:12s} {}'.format(scenario, ' '.join('timeout' if secs is None else '{:6.2f}s'.format(secs)
+                                                         for secs in times)), flush=True)
+
+
+if __name__ == '__main__':
+    main()
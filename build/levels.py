@@ -0,0 +1,33 @@
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import os
+import platform
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from uci.write import write_nodes_ini
+
+# usage: levels.py [engine_folder] [weak_share] - run it on the target host, the nodes depend on the engine build
+engine_path = sys.argv[1] if len(sys.argv) > 1 else os.path.abspath(
+    os.path.join(os.path.dirname(__file__), os.pardir, 'engines', platform.machine()))
+weak_share = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+for engine_file_name in sorted(os.listdir(engine_path)):
+    engine_file = engine_path + os.sep + engine_file_name
+    if os.path.isfile(engine_file + '.uci') and os.access(engine_file, os.X_OK):
+        table = write_nodes_ini(engine_file, weak_share)
+        print(engine_file_name, table)
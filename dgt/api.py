@@ -20,6 +20,9 @@ class BaseClass(object):
 
     """Used for creating event, message, dgt classes."""
 
+    trace_id = None  # correlation id, set by the tracer when the object is queued
+    fired = None  # time.monotonic() of DispatchDgt.fire() - the start of the time to display
+
     def __init__(self, classtype):
         self._type = classtype
 
@@ -27,7 +30,8 @@ class BaseClass(object):
         return self._type
 
     def __hash__(self):
-        return hash(str(self.__class__) + ": " + str(self.__dict__))
+        values = {key: value for key, value in self.__dict__.items() if key not in ('trace_id', 'fired')}
+        return hash(str(self.__class__) + ": " + str(values))
 
 
 def ClassFactory(name, argnames, BaseClass=BaseClass):
@@ -70,6 +74,8 @@ class EventApi():
     # Keyboard events
     KEYBOARD_BUTTON = 'EVT_KEYBOARD_BUTTON'  # User pressed a button at the virtual clock
     KEYBOARD_FEN = 'EVT_KEYBOARD_FEN'  # Virtual board sends a fen
+    FIELD_FEN = 'EVT_FIELD_FEN'  # User is moving pieces, the fen is not stable yet
+    IDLE = 'EVT_IDLE'  # Nobody used picochess for some time (or woke it up again)
     # Engine events
     BEST_MOVE = 'EVT_BEST_MOVE'  # Engine has found a move
     NEW_PV = 'EVT_NEW_PV'  # Engine sends a new principal variation
@@ -104,6 +110,7 @@ class MessageApi():
 
     DGT_BUTTON = 'MSG_DGT_BUTTON'  # Clock button pressed
     DGT_FEN = 'MSG_DGT_FEN'  # DGT Board sends a fen
+    DGT_FIELD_FEN = 'MSG_DGT_FIELD_FEN'  # DGT Board sends the (unstable) fen after a field update
     DGT_CLOCK_VERSION = 'MSG_DGT_CLOCK_VERSION'  # DGT Board sends the clock version
     DGT_CLOCK_TIME = 'MSG_DGT_CLOCK_TIME'  # DGT Clock time message
     DGT_SERIAL_NR = 'MSG_DGT_SERIAL_NR'  # DGT Clock serial_nr (used for watchdog only)
@@ -167,7 +174,7 @@ class Dgt():
     DISPLAY_MOVE = ClassFactory(DgtApi.DISPLAY_MOVE, ['move', 'fen', 'uci960', 'side', 'lang', 'capital',
                                                       'beep', 'maxtime', 'devs', 'wait', 'ld', 'rd'])
     DISPLAY_TEXT = ClassFactory(DgtApi.DISPLAY_TEXT, ['l', 'm', 's',
-                                                      'beep', 'maxtime', 'devs', 'wait', 'ld', 'rd'])
+                                                      'beep', 'maxtime', 'devs', 'wait', 'ld', 'rd', 'info'])
     DISPLAY_TIME = ClassFactory(DgtApi.DISPLAY_TIME, ['wait', 'force', 'devs'])
     LIGHT_CLEAR = ClassFactory(DgtApi.LIGHT_CLEAR, ['devs'])
     LIGHT_SQUARES = ClassFactory(DgtApi.LIGHT_SQUARES, ['uci_move', 'devs'])
@@ -197,6 +204,7 @@ class Message():
 
     DGT_BUTTON = ClassFactory(MessageApi.DGT_BUTTON, ['button', 'dev'])
     DGT_FEN = ClassFactory(MessageApi.DGT_FEN, ['fen', 'raw'])
+    DGT_FIELD_FEN = ClassFactory(MessageApi.DGT_FIELD_FEN, ['fen'])
     DGT_CLOCK_VERSION = ClassFactory(MessageApi.DGT_CLOCK_VERSION, ['main', 'sub', 'dev', 'text'])
     DGT_CLOCK_TIME = ClassFactory(MessageApi.DGT_CLOCK_TIME, ['time_left', 'time_right' , 'connect', 'dev'])
     DGT_SERIAL_NR = ClassFactory(MessageApi.DGT_SERIAL_NR, ['number'])
@@ -262,6 +270,8 @@ class Event():
     # Keyboard events
     KEYBOARD_BUTTON = ClassFactory(EventApi.KEYBOARD_BUTTON, ['button', 'dev'])
     KEYBOARD_FEN = ClassFactory(EventApi.KEYBOARD_FEN, ['fen'])
+    FIELD_FEN = ClassFactory(EventApi.FIELD_FEN, ['fen'])
+    IDLE = ClassFactory(EventApi.IDLE, ['state'])
     # Engine events
     BEST_MOVE = ClassFactory(EventApi.BEST_MOVE, ['move', 'ponder', 'inbook'])
     NEW_PV = ClassFactory(EventApi.NEW_PV, ['pv'])
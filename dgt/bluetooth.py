@@ -0,0 +1,259 @@
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import json
+import time
+import logging
+import subprocess
+from fcntl import fcntl, F_GETFL, F_SETFL
+from os import O_NONBLOCK, read, path
+
+from utilities import metrics
+
+CACHE_FILE = 'bt_cache.json'  # mac, name & rfcomm channel of the last connected board
+
+ansi_escape = re.compile(r'\x1b\[[0-9;]*m|\r')
+device_line = re.compile(r'\[(NEW|CHG)\] Device ([0-9A-F:]{17}) (DGT_BT_\S*|PCS-REVII\S*)')
+
+
+class BtConnector(object):
+
+    """Connect a BT or Revelation II board over rfcomm - the last board is bound directly, scanning is the fallback."""
+
+    def __init__(self, cache_file=CACHE_FILE, btctl='/usr/bin/bluetoothctl', rfcomm='rfcomm', dev_dir='/dev',
+                 timeout=20):
+        super(BtConnector, self).__init__()
+        self.cache_file = cache_file
+        self.btctl_file = btctl
+        self.rfcomm_file = rfcomm
+        self.device = path.join(dev_dir, 'rfcomm123')
+        self.timeout = timeout  # secs for a step (power on, pairing, rfcomm...) before bluetoothctl is restarted
+        self.state = 'idle'
+        self.direct_after = 0.0  # no direct bind before (after a failed one)
+        self.deadline = None
+        self.start = None  # begin of the current connection attempt
+        self.btctl = None
+        self.rfcomm = None
+        self.buffer = ''
+        self.devices = []  # (mac, name) of the found boards
+        self.current = -1
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_file) as file:
+                cache = json.load(file)
+            return cache['mac'], cache['name'], cache['channel']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_cache(self, mac: str, name: str, channel: int):
+        try:
+            with open(self.cache_file, 'w') as file:
+                json.dump({'mac': mac, 'name': name, 'channel': channel}, file)
+        except OSError as error:
+            logging.warning('BT cache not written: %s', error)
+
+    def _set_state(self, state: str):
+        self.state = state
+        self.deadline = time.monotonic() + self.timeout
+
+    def _send(self, command: str):
+        self.btctl.stdin.write(command + '\n')
+        self.btctl.stdin.flush()
+
+    def _release(self):
+        if self.rfcomm and self.rfcomm.poll() is None:
+            self.rfcomm.kill()
+            self.rfcomm.wait()
+        self.rfcomm = None
+        if path.exists(self.device):
+            logging.debug('BT releasing %s', self.device)
+            subprocess.call([self.rfcomm_file, 'release', '123'], stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+
+    def _quit_btctl(self):
+        if self.btctl:
+            try:
+                self._send('quit')
+                self.btctl.wait(timeout=1)
+            except (OSError, subprocess.TimeoutExpired):
+                self.btctl.kill()
+                self.btctl.wait()
+            self.btctl = None
+
+    def _bind_direct(self):
+        cache = self._read_cache()
+        if not cache:
+            return False
+        mac, name, channel = cache
+        logging.debug('BT binding the last board: %s %s channel %i', mac, name, channel)
+        try:
+            res = subprocess.call([self.rfcomm_file, 'bind', '123', mac, str(channel)], stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.DEVNULL, timeout=self.timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            res = -1
+        if res == 0 and path.exists(self.device):
+            self.devices = [(mac, name)]
+            self.current = 0
+            self._set_state('direct')
+            return True
+        logging.debug('BT binding failed')
+        self.direct_after = time.monotonic() + self.timeout
+        return False
+
+    def _start_btctl(self):
+        logging.debug('BT starting bluetoothctl')
+        self.devices = []
+        self.current = -1
+        self.buffer = ''
+        self.btctl = subprocess.Popen(self.btctl_file, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                      stderr=subprocess.STDOUT, universal_newlines=True)
+        # set the O_NONBLOCK flag of file descriptor:
+        flags = fcntl(self.btctl.stdout, F_GETFL)  # get current flags
+        fcntl(self.btctl.stdout, F_SETFL, flags | O_NONBLOCK)
+        self._set_state('power')
+        self._send('power on')
+
+    def _read_lines(self):
+        try:
+            while True:
+                data = read(self.btctl.stdout.fileno(), 4096)
+                if not data:
+                    break
+                self.buffer += ansi_escape.sub('', data.decode(encoding='UTF-8', errors='ignore'))
+        except OSError:
+            pass  # no more data (EAGAIN)
+        lines = self.buffer.split('\n')
+        self.buffer = lines.pop()  # maybe an incomplete line (or a prompt waiting for input)
+        return lines
+
+    def _process_line(self, line: str):
+        if False:  # switch-case
+            pass
+        elif 'Changing power on succeeded' in line:
+            self._set_state('agent')
+            self._send('agent on')
+        elif 'Agent registered' in line:
+            self._set_state('default')
+            self._send('default-agent')
+        elif 'Default agent request successful' in line:
+            self._set_state('scan')
+            self._send('scan on')
+        elif 'Discovering: yes' in line:
+            self.state = 'discover'
+            self.deadline = None  # waiting for a board has no timeout
+        elif 'Pairing successful' in line:
+            self.state = 'paired'
+            logging.debug('BT pairing successful')
+        elif 'Failed to pair: org.bluez.Error.AlreadyExists' in line:
+            self.state = 'paired'
+            logging.debug('BT already paired')
+        elif 'Failed to pair' in line:
+            self.state = 'discover'  # try the next
+            logging.debug('BT pairing failed')
+        elif 'not available' in line:
+            self.state = 'discover'  # remove and try the next
+            self._remove_current()
+            logging.debug('BT pairing failed, unknown device')
+        else:
+            match = device_line.search(line)
+            if match and 'DEL' not in line and match.group(2) not in [mac for mac, _ in self.devices]:
+                self.devices.append((match.group(2), match.group(3)))
+                logging.debug('BT found device: %s %s', match.group(2), match.group(3))
+
+    def _process_prompt(self):
+        if 'PIN code' in self.buffer:
+            self._send('1234' if 'PCS-REVII' in self.devices[self.current][1] else '0000')
+            self.buffer = ''
+        if 'Confirm passkey' in self.buffer:
+            self._send('yes')
+            self.buffer = ''
+
+    def _remove_current(self):
+        self.devices.pop(self.current)
+        self.current -= 1
+
+    def poll(self):
+        """Advance the connection - return the rfcomm device once it exists, else None."""
+        if self.state == 'idle':
+            self.start = time.monotonic()
+            self._release()
+            if time.monotonic() >= self.direct_after and self._bind_direct():
+                return self.device
+            if path.exists(self.btctl_file):  # only for jessie upwards
+                self._start_btctl()
+            return None
+        if self.state == 'direct':
+            return self.device
+
+        for line in self._read_lines():
+            self._process_line(line)
+        self._process_prompt()
+
+        # if there are devices in the list try one
+        if self.state == 'discover' and self.devices:
+            self.current = (self.current + 1) % len(self.devices)
+            logging.debug('BT pairing to: %s %s', *self.devices[self.current])
+            self._set_state('pair')
+            self._send('pair ' + self.devices[self.current][0])
+
+        # pair successful, try rfcomm
+        if self.state == 'paired':
+            self._set_state('connect')
+            self.rfcomm = subprocess.Popen([self.rfcomm_file, 'connect', '123', self.devices[self.current][0]],
+                                           stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                           stderr=subprocess.DEVNULL)
+
+        # wait for rfcomm to fail or succeed
+        if self.state == 'connect':
+            if path.exists(self.device):
+                return self.device
+            if self.rfcomm.poll() is not None:
+                logging.debug('BT rfcomm failed')
+                self._send('remove ' + self.devices[self.current][0])
+                self._remove_current()
+                self.state = 'discover'
+
+        if self.deadline and self.state != 'discover' and time.monotonic() > self.deadline:
+            logging.warning('BT timeout in state %s - restarting bluetoothctl', self.state)
+            metrics.inc('picochess_bt_timeouts_total', state=self.state)
+            self._quit_btctl()
+            self._release()
+            self.state = 'idle'
+        return None
+
+    def connected(self):
+        """The device is open - remember the board for a direct reconnect and return its name."""
+        mac, name = self.devices[self.current]
+        secs = time.monotonic() - self.start
+        logging.info('BT connected to %s %s in %.1f secs (%s)', mac, name, secs, self.state)
+        metrics.observe('picochess_bt_connect_seconds', secs, mode=self.state)
+        if self.state != 'direct':
+            self._write_cache(mac, name, 1)  # "rfcomm connect" uses channel 1
+        self._quit_btctl()
+        self.state = 'idle'
+        self.direct_after = 0.0
+        return name
+
+    def failed(self):
+        """The device cant be opened - after a direct bind fall back to scanning."""
+        if self.state == 'direct':
+            logging.debug('BT direct connection failed - scanning')
+            self._release()
+            self.state = 'idle'
+            self.direct_after = time.monotonic() + self.timeout
@@ -17,16 +17,22 @@
 
 import struct
 import logging
-import subprocess
 from threading import Timer, Lock
-from fcntl import fcntl, F_GETFL, F_SETFL
-from os import O_NONBLOCK, read, path, listdir
+from os import path, listdir
 from serial import Serial, SerialException, STOPBITS_ONE, PARITY_NONE, EIGHTBITS
 import time
 
 from dgt.util import DgtAck, DgtClk, DgtCmd, DgtMsg, ClockIcons, ClockSide, enum
 from dgt.api import Message, Dgt
-from utilities import RepeatedTimer, DisplayMsg, hms_time
+from dgt.bluetooth import BtConnector
+from utilities import RepeatedTimer, DisplayMsg, hms_time, tracer, metrics, idle_manager
+
+
+piece_to_char = {
+    0x01: 'P', 0x02: 'R', 0x03: 'N', 0x04: 'B', 0x05: 'K', 0x06: 'Q',
+    0x07: 'p', 0x08: 'r', 0x09: 'n', 0x0a: 'b', 0x0b: 'k', 0x0c: 'q',
+    0x0d: '$', 0x0e: '%', 0x0f: '&', 0x00: '.'
+}
 
 
 class DgtBoard(object):
@@ -46,20 +52,17 @@ class DgtBoard(object):
         self.serial = None
         self.lock = Lock()  # inside setup_serial_port()
         self.incoming_board_thread = None
+        self.stopped = False  # set by stop() => the incoming board thread ends
         self.lever_pos = None
         # the next three are only used for "not dgtpi" mode
         self.clock_lock = False  # serial connected clock is locked
         self.last_clock_command = []  # Used for resend last (failed) clock command
+        self.clock_stats = {'sent': 0, 'acked': 0, 'ack_errors': 0, 'timeouts': 0, 'start': time.time()}
         self.enable_ser_clock = None  # None = "unknown status" False="only board found" True="clock also found"
         self.watchdog_timer = RepeatedTimer(1, self._watchdog)
-        # bluetooth vars for Jessie & autoconnect
-        self.btctl = None
-        self.bt_rfcomm = None
-        self.bt_state = -1
-        self.bt_line = ''
-        self.bt_current_device = -1
-        self.bt_mac_list = []
-        self.bt_name_list = []
+        idle_manager.add_timer(self.watchdog_timer, 10)
+        # bluetooth connection for Jessie & autoconnect
+        self.bt_connector = BtConnector()
         self.bt_name = ''
         self.wait_counter = 0
         # keep the last time to find out errorous DGT_MSG_BWTIME messages (error: current time > last time)
@@ -71,15 +74,33 @@ class DgtBoard(object):
         self.field_timer = None
         self.field_timer_running = False
         self.channel = None
+        # incremental board model out of the field updates (dgt order: 0=a8) - None = unknown => ask for a dump
+        self.fields = None
+        self.dump_check = False  # the requested dump only verifies the model
+        self.stable_counter = 0
+        self.check_interval = 20  # verify the model with a full dump every n stable positions
+        self.last_field_update = None
 
         self.in_settime = False  # this is true between set_clock and clock_start => use set values instead of clock
         self.low_time = False  # This is set from picochess.py and used to limit the field timer
+        metrics.add_collector(self._get_gauges)
 
     def expired_field_timer(self):
         """Board position hasnt changed for some time."""
-        logging.debug('board position now stable => ask for complete board')
         self.field_timer_running = False
-        self.write_command([DgtCmd.DGT_SEND_BRD])  # Ask for the board when a piece moved
+        fields = self.fields
+        if fields is None:
+            logging.debug('board position now stable => ask for complete board')
+            metrics.inc('picochess_board_dumps_total', reason='unknown')
+            self.write_command([DgtCmd.DGT_SEND_BRD])  # Ask for the board when a piece moved
+            return
+        logging.debug('board position now stable => use the field updates')
+        self._publish_fen(list(fields))
+        self.stable_counter = (self.stable_counter + 1) % self.check_interval
+        if self.stable_counter == 0:
+            metrics.inc('picochess_board_dumps_total', reason='check')
+            self.dump_check = True
+            self.write_command([DgtCmd.DGT_SEND_BRD])  # from time to time check the model against the board
 
     def stop_field_timer(self):
         """Stop the field timer cause another field change been send."""
@@ -104,7 +125,7 @@ class DgtBoard(object):
         mes = message[3] if message[0].value == DgtCmd.DGT_CLOCK_MESSAGE.value else message[0]
         if not mes == DgtCmd.DGT_RETURN_SERIALNR:
             logging.debug('(ser) board put [%s] length: %i', mes, len(message))
-            if mes.value == DgtClk.DGT_CMD_CLOCK_ASCII.value:
+            if mes.value == DgtClk.DGT_CMD_CLOCK_ASCII.value and logging.getLogger().isEnabledFor(logging.DEBUG):
                 logging.debug('sending text [%s] to (ser) clock', ''.join([chr(elem) for elem in message[4:12]]))
 
         array = []
@@ -127,35 +148,48 @@ class DgtBoard(object):
                 logging.error('type not supported [%s]', type(item))
                 return False
 
+        is_clock = message[0] == DgtCmd.DGT_CLOCK_MESSAGE
+        if is_clock:  # lock before writing - the ACK can be read before write() returns
+            self.last_clock_command = message
+            if self.clock_lock:
+                logging.warning('(ser) clock is already locked. Maybe a "resend"?')
+            else:
+                logging.debug('(ser) clock is locked now')
+            self.clock_lock = time.time()
+
         while True:
             if self.serial:
                 try:
                     self.serial.write(bytearray(array))
+                    metrics.inc('picochess_serial_bytes_total', len(array), direction='sent')
                     break
                 except ValueError:
+                    metrics.inc('picochess_serial_errors_total', kind='invalid_bytes')
                     logging.error('invalid bytes sent %s', message)
+                    if is_clock:
+                        self.clock_lock = False  # no ACK will come
                     return False
                 except SerialException as write_expection:
+                    metrics.inc('picochess_serial_errors_total', kind='write')
                     logging.error(write_expection)
                     self.serial.close()
                     self.serial = None
                 except IOError as write_expection:
+                    metrics.inc('picochess_serial_errors_total', kind='write')
                     logging.error(write_expection)
                     self.serial.close()
                     self.serial = None
             if mes == DgtCmd.DGT_RETURN_SERIALNR:
                 break
+            if self.stopped:
+                self.clock_lock = False
+                return False
             time.sleep(0.1)
 
         if message[0] == DgtCmd.DGT_SET_LEDS:
             logging.debug('(rev) leds turned %s', 'on' if message[2] else 'off')
-        if message[0] == DgtCmd.DGT_CLOCK_MESSAGE:
-            self.last_clock_command = message
-            if self.clock_lock:
-                logging.warning('(ser) clock is already locked. Maybe a "resend"?')
-            else:
-                logging.debug('(ser) clock is locked now')
-            self.clock_lock = time.time()
+        if is_clock:
+            self.clock_stats['sent'] += 1
         else:
             time.sleep(0.1)  # give the board some time to process the command
         return True
@@ -205,6 +239,7 @@ class DgtBoard(object):
                 ack2 = ((message[4]) & 0x7f) | ((message[0] << 3) & 0x80)
                 ack3 = ((message[5]) & 0x7f) | ((message[0] << 2) & 0x80)
                 if ack0 != 0x10:
+                    self.clock_stats['ack_errors'] += 1
                     logging.warning('(ser) clock ACK error %s', (ack0, ack1, ack2, ack3))
                     if self.last_clock_command:
                         logging.debug('(ser) clock resending failed message [%s]', self.last_clock_command)
@@ -212,6 +247,7 @@ class DgtBoard(object):
                         self.last_clock_command = []  # only resend once
                     return
                 else:
+                    self.clock_stats['acked'] += 1
                     logging.debug('(ser) clock ACK okay [%s]', DgtAck(ack1))
                     if self.last_clock_command:
                         cmd = self.last_clock_command[3]  # type: DgtClk
@@ -321,43 +357,35 @@ class DgtBoard(object):
         elif message_id == DgtMsg.DGT_MSG_BOARD_DUMP:
             if message_length != 64:
                 logging.warning('illegal length in data')
-            piece_to_char = {
-                0x01: 'P', 0x02: 'R', 0x03: 'N', 0x04: 'B', 0x05: 'K', 0x06: 'Q',
-                0x07: 'p', 0x08: 'r', 0x09: 'n', 0x0a: 'b', 0x0b: 'k', 0x0c: 'q',
-                0x0d: '$', 0x0e: '%', 0x0f: '&', 0x00: '.'
-            }
-            board = ''
-            for character in message:
-                board += piece_to_char[character & 0x0f]
-            logging.debug('\n' + '\n'.join(board[0 + i:8 + i] for i in range(0, len(board), 8)))  # Show debug board
-            # Create fen from board
-            fen = ''
-            empty = 0
-            for square in range(0, 64):
-                if message[square] != 0 and message[square] < 0x0d:  # @todo for the moment ignore the special pieces
-                    if empty > 0:
-                        fen += str(empty)
-                        empty = 0
-                    fen += piece_to_char[message[square] & 0x0f]
-                else:
-                    empty += 1
-                if (square + 1) % 8 == 0:
-                    if empty > 0:
-                        fen += str(empty)
-                        empty = 0
-                    if square < 63:
-                        fen += '/'
-
-            # Attention! This fen is NOT flipped
-            logging.debug('raw fen [%s]', fen)
-            DisplayMsg.show(Message.DGT_FEN(fen=fen, raw=True))
+                self.fields = None
+                return
+            fields = list(message)
+            if self.dump_check:
+                self.dump_check = False
+                if fields == self.fields:
+                    logging.debug('board model verified')
+                    return
+            if self.fields is not None and fields != self.fields:
+                logging.warning('board model out of sync => use the board dump')
+                metrics.inc('picochess_board_desyncs_total')
+            self.fields = fields
+            self._publish_fen(fields)
 
         elif message_id == DgtMsg.DGT_MSG_FIELD_UPDATE:
             if message_length != 2:
                 logging.warning('illegal length in data')
+            tracer.start('board:field_update')
+            self.last_field_update = time.time()
+            field, piece = message[:2] if message_length == 2 else (64, None)
+            if self.fields is not None and field < 64 and piece in piece_to_char:
+                self.fields[field] = piece
+            else:
+                self.fields = None
             if self.field_timer_running:
                 self.stop_field_timer()
             self.start_field_timer()
+            if self.fields is not None:  # let picochess guess the move before the position is stable
+                DisplayMsg.show(Message.DGT_FIELD_FEN(fen=self._get_fen(self.fields)))
 
         elif message_id == DgtMsg.DGT_MSG_SERIALNR:
             if message_length != 5:
@@ -372,6 +400,43 @@ class DgtBoard(object):
         else:  # Default
             logging.warning('message not handled [%s]', DgtMsg(message_id))
 
+    @staticmethod
+    def _get_fen(fields: list):
+        """Create the (NOT flipped) fen out of the fields."""
+        fen = ''
+        empty = 0
+        for square in range(0, 64):
+            if fields[square] != 0 and fields[square] < 0x0d:  # @todo for the moment ignore the special pieces
+                if empty > 0:
+                    fen += str(empty)
+                    empty = 0
+                fen += piece_to_char[fields[square] & 0x0f]
+            else:
+                empty += 1
+            if (square + 1) % 8 == 0:
+                if empty > 0:
+                    fen += str(empty)
+                    empty = 0
+                if square < 63:
+                    fen += '/'
+        return fen
+
+    def _publish_fen(self, fields: list):
+        if logging.getLogger().isEnabledFor(logging.DEBUG):  # skip building the debug board
+            board = ''.join(piece_to_char[field & 0x0f] for field in fields)
+            logging.debug('\n' + '\n'.join(board[0 + i:8 + i] for i in range(0, len(board), 8)))
+        fen = self._get_fen(fields)
+        # Attention! This fen is NOT flipped
+        logging.debug('raw fen [%s]', fen)
+        if self.last_field_update:
+            metrics.observe('picochess_board_fen_seconds', time.time() - self.last_field_update)
+            self.last_field_update = None
+        DisplayMsg.show(Message.DGT_FEN(fen=fen, raw=True))
+
+    def _lost_data(self, kind: str):
+        metrics.inc('picochess_serial_errors_total', kind=kind)
+        self.fields = None  # a field update might be lost
+
     def _read_board_message(self, head: bytes):
         message = ()
         header_len = 3
@@ -379,11 +444,13 @@ class DgtBoard(object):
         try:
             header = struct.unpack('>BBB', header)
         except struct.error:
+            self._lost_data('timeout')
             logging.warning('timeout in header reading')
             return message
         message_id = header[0]
         message_length = counter = (header[1] << 7) + header[2] - header_len
         if message_length <= 0 or message_length > 64:
+            self._lost_data('illegal_header')
             logging.warning('illegal length in message header %i length: %i', message_id, message_length)
             return message
 
@@ -391,6 +458,7 @@ class DgtBoard(object):
             if not message_id == DgtMsg.DGT_MSG_SERIALNR:
                 logging.debug('(ser) board get [%s] length: %i', DgtMsg(message_id), message_length)
         except ValueError:
+            self._lost_data('illegal_header')
             logging.warning('illegal id in message header %i length: %i', message_id, message_length)
             return message
 
@@ -400,20 +468,23 @@ class DgtBoard(object):
                 data = struct.unpack('>B', byte)
                 counter -= 1
                 if data[0] & 0x80:
+                    self._lost_data('illegal_data')
                     logging.warning('illegal data in message %i found', message_id)
                     logging.warning('ignore collected message data %s', message)
                     return self._read_board_message(byte)
                 message += data
             else:
+                self._lost_data('timeout')
                 logging.warning('timeout in data reading')
 
+        metrics.inc('picochess_serial_bytes_total', header_len + message_length, direction='received')
         self._process_board_message(message_id, message, message_length)
         return message
 
     def _process_incoming_board_forever(self):
         counter = 0
         logging.info('incoming_board ready')
-        while True:
+        while not self.stopped:
             try:
                 byte = None
                 if self.serial:
@@ -431,13 +502,13 @@ class DgtBoard(object):
                     counter = (counter + 1) % 10
                     if counter == 0:  # issue 150 - check for alive connection
                         self._watchdog()  # force to write something to the board
-                    time.sleep(0.1)
+                    idle_manager.wait(0.1, 1.0)
             except SerialException:
-                pass
+                metrics.inc('picochess_serial_errors_total', kind='read')
             except TypeError:
                 pass
             except struct.error:  # can happen, when plugin board-cable again
-                pass
+                metrics.inc('picochess_serial_errors_total', kind='read')
 
     def ask_battery_status(self):
         """Ask the BT board for the battery status."""
@@ -452,163 +523,26 @@ class DgtBoard(object):
         self.write_command(command)  # Get clock version
 
     def _startup_serial_board(self):
+        self.fields = None  # the version answer asks for a complete board
         self.write_command([DgtCmd.DGT_SEND_UPDATE_NICE])  # Set the board update mode
         self.write_command([DgtCmd.DGT_SEND_VERSION])  # Get board version
 
     def _watchdog(self):
         if self.clock_lock and not self.is_pi:
             if time.time() - self.clock_lock > 2:
+                self.clock_stats['timeouts'] += 1
                 logging.warning('(ser) clock is locked over 2secs')
                 self.clock_lock = False  # display no warning
                 self.write_command(self.last_clock_command)
         self.write_command([DgtCmd.DGT_RETURN_SERIALNR])  # ask for this AFTER cause of - maybe - old board hardware
 
     def _open_bluetooth(self):
-        if self.bt_state == -1:
-            # only for jessie upwards
-            if path.exists('/usr/bin/bluetoothctl'):
-                self.bt_state = 0
-
-                # get rid of old rfcomm
-                if path.exists('/dev/rfcomm123'):
-                    logging.debug('BT releasing /dev/rfcomm123')
-                    subprocess.call(['rfcomm', 'release', '123'])
-                self.bt_current_device = -1
-                self.bt_mac_list = []
-                self.bt_name_list = []
-
-                logging.debug('BT starting bluetoothctl')
-                self.btctl = subprocess.Popen('/usr/bin/bluetoothctl',
-                                              stdin=subprocess.PIPE,
-                                              stdout=subprocess.PIPE,
-                                              stderr=subprocess.STDOUT,
-                                              universal_newlines=True,
-                                              shell=True)
-
-                # set the O_NONBLOCK flag of file descriptor:
-                flags = fcntl(self.btctl.stdout, F_GETFL)  # get current flags
-                fcntl(self.btctl.stdout, F_SETFL, flags | O_NONBLOCK)
-
-                self.btctl.stdin.write("power on\n")
-                self.btctl.stdin.flush()
-        else:  # state >= 0 so bluetoothctl is running
-            try:  # check for new data from bluetoothctl
-                while True:
-                    bt_byte = read(self.btctl.stdout.fileno(), 1).decode(encoding='UTF-8', errors='ignore')
-                    self.bt_line += bt_byte
-                    if bt_byte == '' or bt_byte == '\n':
-                        break
-            except OSError:
-                time.sleep(0.1)
-
-            # complete line
-            if '\n' in self.bt_line:
-                if False:  # switch-case
-                    pass
-                elif 'Changing power on succeeded' in self.bt_line:
-                    self.bt_state = 1
-                    self.btctl.stdin.write("agent on\n")
-                    self.btctl.stdin.flush()
-                elif 'Agent registered' in self.bt_line:
-                    self.bt_state = 2
-                    self.btctl.stdin.write("default-agent\n")
-                    self.btctl.stdin.flush()
-                elif 'Default agent request successful' in self.bt_line:
-                    self.bt_state = 3
-                    self.btctl.stdin.write("scan on\n")
-                    self.btctl.stdin.flush()
-                elif 'Discovering: yes' in self.bt_line:
-                    self.bt_state = 4
-                elif 'Pairing successful' in self.bt_line:
-                    self.bt_state = 6
-                    logging.debug('BT pairing successful')
-                elif 'Failed to pair: org.bluez.Error.AlreadyExists' in self.bt_line:
-                    self.bt_state = 6
-                    logging.debug('BT already paired')
-                elif 'Failed to pair' in self.bt_line:
-                    # try the next
-                    self.bt_state = 4
-                    logging.debug('BT pairing failed')
-                elif 'not available' in self.bt_line:
-                    # remove and try the next
-                    self.bt_state = 4
-                    self.bt_mac_list.remove(self.bt_mac_list[self.bt_current_device])
-                    self.bt_name_list.remove(self.bt_name_list[self.bt_current_device])
-                    self.bt_current_device -= 1
-                    logging.debug('BT pairing failed, unknown device')
-                elif ('DGT_BT_' in self.bt_line or 'PCS-REVII' in self.bt_line) and \
-                        ('NEW' in self.bt_line or 'CHG' in self.bt_line) and 'DEL' not in self.bt_line:
-                    # New e-Board found add to list
-                    try:
-                        if not self.bt_line.split()[3] in self.bt_mac_list:
-                            self.bt_mac_list.append(self.bt_line.split()[3])
-                            self.bt_name_list.append(self.bt_line.split()[4])
-                            logging.debug('BT found device: %s %s', self.bt_line.split()[3], self.bt_line.split()[4])
-                    except IndexError:
-                        logging.error('BT wrong line [%s]', self.bt_line)
-                # clear the line
-                self.bt_line = ''
-
-            # if 'Enter PIN code:' in self.bt_line:
-            if 'PIN code' in self.bt_line:
-                if 'DGT_BT_' in self.bt_name_list[self.bt_current_device]:
-                    self.btctl.stdin.write("0000\n")
-                    self.btctl.stdin.flush()
-                if 'PCS-REVII' in self.bt_name_list[self.bt_current_device]:
-                    self.btctl.stdin.write("1234\n")
-                    self.btctl.stdin.flush()
-                self.bt_line = ''
-
-            if 'Confirm passkey' in self.bt_line:
-                self.btctl.stdin.write("yes\n")
-                self.btctl.stdin.flush()
-                self.bt_line = ''
-
-            # if there are devices in the list try one
-            if self.bt_state == 4:
-                if len(self.bt_mac_list) > 0:
-                    self.bt_state = 5
-                    self.bt_current_device += 1
-                    if self.bt_current_device >= len(self.bt_mac_list):
-                        self.bt_current_device = 0
-                    logging.debug('BT pairing to: %s %s',
-                                  self.bt_mac_list[self.bt_current_device],
-                                  self.bt_name_list[self.bt_current_device])
-                    self.btctl.stdin.write('pair ' + self.bt_mac_list[self.bt_current_device] + "\n")
-                    self.btctl.stdin.flush()
-
-            # pair successful, try rfcomm
-            if self.bt_state == 6:
-                # now try rfcomm
-                self.bt_state = 7
-                self.bt_rfcomm = subprocess.Popen('rfcomm connect 123 ' + self.bt_mac_list[self.bt_current_device],
-                                                  stdin=subprocess.PIPE,
-                                                  stdout=subprocess.PIPE,
-                                                  stderr=subprocess.PIPE,
-                                                  universal_newlines=True,
-                                                  shell=True)
-
-            # wait for rfcomm to fail or succeed
-            if self.bt_state == 7:
-                # rfcomm succeeded
-                if path.exists('/dev/rfcomm123'):
-                    logging.debug('BT connected to: %s', self.bt_name_list[self.bt_current_device])
-                    if self._open_serial('/dev/rfcomm123'):
-                        self.btctl.stdin.write("quit\n")
-                        self.btctl.stdin.flush()
-                        self.bt_name = self.bt_name_list[self.bt_current_device]
-
-                        self.bt_state = -1
-                        return True
-                # rfcomm failed
-                if self.bt_rfcomm.poll() is not None:
-                    logging.debug('BT rfcomm failed')
-                    self.btctl.stdin.write('remove ' + self.bt_mac_list[self.bt_current_device] + "\n")
-                    self.bt_mac_list.remove(self.bt_mac_list[self.bt_current_device])
-                    self.bt_name_list.remove(self.bt_name_list[self.bt_current_device])
-                    self.bt_current_device -= 1
-                    self.btctl.stdin.flush()
-                    self.bt_state = 4
+        device = self.bt_connector.poll()
+        if device:
+            if self._open_serial(device):
+                self.bt_name = self.bt_connector.connected()
+                return True
+            self.bt_connector.failed()
         return False
 
     def _open_serial(self, device: str):
@@ -653,6 +587,17 @@ class DgtBoard(object):
             self.wait_counter = (self.wait_counter + 1) % len(waitchars)
         return False
 
+    def get_clock_stats(self):
+        """Return the (ser) clock command statistic with throughput (commands/sec) and ACK error rate."""
+        stats = self.clock_stats.copy()
+        secs = time.time() - stats.pop('start')
+        stats['throughput'] = stats['sent'] / secs if secs > 0 else 0.0
+        stats['error_rate'] = (stats['ack_errors'] + stats['timeouts']) / stats['sent'] if stats['sent'] else 0.0
+        return stats
+
+    def _get_gauges(self):
+        return [('picochess_clock_' + name, {'device': 'ser'}, value) for name, value in self.get_clock_stats().items()]
+
     # dgtHw functions start
     def _wait_for_clock(self, func: str):
         has_to_wait = False
@@ -664,6 +609,7 @@ class DgtBoard(object):
             time.sleep(0.1)
             counter += 1
             if counter > 20:
+                self.clock_stats['timeouts'] += 1
                 logging.warning('(ser) clock is locked over 2secs')
                 logging.debug('resending locked (ser) clock message [%s]', self.last_clock_command)
                 has_to_wait = False
@@ -740,3 +686,16 @@ class DgtBoard(object):
         """NOT called from threading.Thread instead inside the __init__ function from hw.py."""
         self.incoming_board_thread = Timer(0, self._process_incoming_board_forever)
         self.incoming_board_thread.start()
+
+    def stop(self):
+        """Stop the incoming board thread & the timers and close the serial connection."""
+        self.stopped = True
+        if self.watchdog_timer.is_running():
+            self.watchdog_timer.stop()
+        if self.field_timer_running:
+            self.stop_field_timer()
+        if self.incoming_board_thread:
+            self.incoming_board_thread.join()
+        if self.serial:
+            self.serial.close()
+            self.serial = None
@@ -22,7 +22,7 @@ import queue
 import threading
 
 import chess
-from utilities import DisplayMsg, Observable, DispatchDgt, write_picochess_ini
+from utilities import DisplayMsg, Observable, DispatchDgt, write_picochess_ini, tracer, idle_manager
 from dgt.translate import DgtTranslate
 from dgt.menu import DgtMenu
 from dgt.util import ClockSide, ClockIcons, BeepLevel, Mode, GameResult, TimeMode, PlayMode
@@ -555,7 +555,9 @@ class DgtDisplay(DisplayMsg, threading.Thread):
             text = self.dgttranslate.text('N10_mate', str(message.mate))
         self.score = text
         if message.mode == Mode.KIBITZ and not self._inside_main_menu():
-            DispatchDgt.fire(self._combine_depth_and_score())
+            text = self._combine_depth_and_score()
+            text.info = True  # a stream of analysis texts => the dispatcher may coalesce them
+            DispatchDgt.fire(text)
 
     def _process_new_pv(self, message):
         self.hint_move = message.pv[0]
@@ -576,7 +578,8 @@ class DgtDisplay(DisplayMsg, threading.Thread):
         self.dgtmenu.all_books = message.info['books']
         tc_init = message.info['tc_init']
         timectrl = self.time_control = TimeControl(**tc_init)
-        self.dgtmenu.set_time_mode(timectrl.mode)
+        if timectrl.mode in (TimeMode.FIXED, TimeMode.BLITZ, TimeMode.FISCHER):  # the others arent inside the menu
+            self.dgtmenu.set_time_mode(timectrl.mode)
         # try to find the index from the given time_control (timectrl)
         # if user gave a non-existent timectrl value update map & list
         index = 0
@@ -758,14 +761,22 @@ class DgtDisplay(DisplayMsg, threading.Thread):
             DispatchDgt.fire(Dgt.CLOCK_STOP(devs=message.devs, wait=True))
 
         elif isinstance(message, Message.DGT_BUTTON):
+            idle_manager.touch('button')
             self._process_button(message)
 
         elif isinstance(message, Message.DGT_FEN):
+            idle_manager.touch('board')
             if self.dgtmenu.inside_updt_menu():
                 logging.debug('inside update menu => ignore fen %s', message.fen)
             else:
                 self._process_fen(message.fen, message.raw)
 
+        elif isinstance(message, Message.DGT_FIELD_FEN):
+            idle_manager.touch('board')
+            if not self.dgtmenu.inside_updt_menu():
+                fen = message.fen[::-1] if self.dgtmenu.get_flip_board() else message.fen
+                Observable.fire(Event.FIELD_FEN(fen=fen))
+
         elif isinstance(message, Message.DGT_CLOCK_VERSION):
             DispatchDgt.fire(Dgt.CLOCK_VERSION(main=message.main, sub=message.sub, devs={message.dev}))
             text = self.dgttranslate.text('Y21_picochess', devs={message.dev})
@@ -857,6 +868,7 @@ class DgtDisplay(DisplayMsg, threading.Thread):
             # Check if we have something to display
             try:
                 message = self.msg_queue.get()
+                tracer.enter(message, 'display')
                 if not isinstance(message, Message.DGT_SERIAL_NR):
                     logging.debug('received message from msg_queue: %s', message)
                 self._process_message(message)
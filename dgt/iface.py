@@ -17,16 +17,48 @@
 
 import logging
 import queue
-from threading import Thread
+from collections import OrderedDict
+from threading import Thread, Lock
 
 from chess import Board
-from utilities import hms_time, DisplayDgt, DispatchDgt
+from utilities import hms_time, DisplayDgt, DispatchDgt, tracer, metrics
 from dgt.util import ClockIcons, ClockSide
 from dgt.api import Dgt
 from dgt.translate import DgtTranslate
 from dgt.board import DgtBoard
 
 
+class SanCache(object):
+
+    """LRU cache of the rendered move texts - shared by all clocks, so a move is rendered once for ser, i2c & web."""
+
+    def __init__(self, size=64):
+        super(SanCache, self).__init__()
+        self.size = size
+        self.lock = Lock()
+        self.cache = OrderedDict()  # (fen, move, uci960, language, capital, width, is_xl) => (board, text)
+
+    def get(self, key: tuple):
+        """Return the cached (board, text) or None."""
+        with self.lock:
+            value = self.cache.get(key)
+            if value is not None:
+                self.cache.move_to_end(key)
+        metrics.inc('picochess_san_cache_total', result='hit' if value else 'miss')
+        return value
+
+    def put(self, key: tuple, value: tuple):
+        """Add the rendered (board, text) - dropping the least recently used one if full."""
+        with self.lock:
+            self.cache[key] = value
+            self.cache.move_to_end(key)
+            if len(self.cache) > self.size:
+                self.cache.popitem(last=False)
+
+
+san_cache = SanCache()
+
+
 class DgtIface(DisplayDgt, Thread):
 
     """An Interface class for DgtHw, DgtPi, DgtVr."""
@@ -81,7 +113,7 @@ class DgtIface(DisplayDgt, Thread):
         raise NotImplementedError()
 
     def get_san(self, message, is_xl=False):
-        """Create a chess.board plus a text ready to display on clock."""
+        """Create a chess.board plus a text ready to display on clock - the board is shared, dont change it."""
 
         def move(text: str, language: str, capital: bool):
             """Return move text for clock display."""
@@ -104,6 +136,13 @@ class DgtIface(DisplayDgt, Thread):
             else:
                 return text
 
+        capital = message.capital and not is_xl
+        width = (6 if is_xl else 8) if message.side == ClockSide.RIGHT else 0
+        key = (message.fen, message.move, message.uci960, message.lang, capital, width, is_xl)
+        cached = san_cache.get(key)
+        if cached:
+            return cached
+
         bit_board = Board(message.fen, message.uci960)
         if bit_board.is_legal(message.move):
             move_text = bit_board.san(message.move)
@@ -113,9 +152,11 @@ class DgtIface(DisplayDgt, Thread):
             move_text = 'er{}' if is_xl else 'err {}'
             move_text = move_text.format(message.move.uci()[:4])
 
-        if message.side == ClockSide.RIGHT:
-            move_text = move_text.rjust(6 if is_xl else 8)
-        return bit_board, move(move_text, message.lang, message.capital and not is_xl)
+        if width:
+            move_text = move_text.rjust(width)
+        result = (bit_board, move(move_text, message.lang, capital))
+        san_cache.put(key, result)
+        return result
 
     def _process_message(self, message):
         if self.get_name() not in message.devs:
@@ -169,6 +210,8 @@ class DgtIface(DisplayDgt, Thread):
             # Check if we have something to display
             try:
                 message = self.dgt_queue.get()
+                tracer.enter(message, self.get_name())
                 self._create_task(message)
+                tracer.enter(message, self.get_name() + ' done')
             except queue.Empty:
                 pass
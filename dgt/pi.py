@@ -18,10 +18,10 @@
 import logging
 import time
 from threading import Lock, Timer
-from ctypes import cdll, c_byte, create_string_buffer, pointer
+from ctypes import cdll, c_byte, c_char_p, create_string_buffer, byref, POINTER
 from platform import machine
 
-from utilities import DisplayMsg, hms_time
+from utilities import DisplayMsg, hms_time, idle_manager
 from dgt.api import Message
 from dgt.util import ClockIcons, ClockSide
 from dgt.translate import DgtTranslate
@@ -33,11 +33,32 @@ class DgtPi(DgtIface):
 
     """Handle the DgtPi communication."""
 
-    def __init__(self, dgtboard: DgtBoard):
+    fast_poll = 0.1  # secs between the i2c polls while the clock runs or the user presses buttons
+    slow_poll = 0.25  # secs between the i2c polls of a standing clock
+    button_awake = 5  # secs of fast polling after a button press
+
+    button_texts = {0x01: 'button 0', 0x02: 'button 1', 0x04: 'button 2', 0x08: 'button 3', 0x10: 'button 4',
+                    0x20: 'button on/off', 0x11: 'button 0+4',
+                    0x40: 'lever pressed > right side down', -0x40: 'lever pressed > left side down'}
+    button_numbers = {0x01: 0, 0x02: 1, 0x04: 2, 0x08: 3, 0x10: 4, 0x20: 0x11, 0x11: 0x11, 0x40: 0x40, -0x40: -0x40}
+
+    def __init__(self, dgtboard: DgtBoard, lib_file=None):
         super(DgtPi, self).__init__(dgtboard)
 
         self.lib_lock = Lock()
-        self.lib = cdll.LoadLibrary('etc/dgtpicom.x86.so' if machine() == 'x86_64' else 'etc/dgtpicom.so')
+        if lib_file is None:
+            lib_file = 'etc/dgtpicom.x86.so' if machine() == 'x86_64' else 'etc/dgtpicom.so'
+        self.lib = cdll.LoadLibrary(lib_file)
+        # setup the polled functions once - ctypes then doesnt need to guess the argument types on each call
+        self._get_button_message = self.lib.dgtpicom_get_button_message
+        self._get_button_message.argtypes = [POINTER(c_byte), POINTER(c_byte)]
+        self._get_time = self.lib.dgtpicom_get_time
+        self._get_time.argtypes = [c_char_p]
+        self.but = c_byte(0)
+        self.buttime = c_byte(0)
+        self.but_ref = byref(self.but)
+        self.buttime_ref = byref(self.buttime)
+        self.clktime = create_string_buffer(6)
 
         # keep the last time to find out errorous DGT_MSG_BWTIME messages (error: current time > last time)
         self.r_time = 3600 * 10  # max value cause 10h cant be reached by clock
@@ -59,70 +80,49 @@ class DgtPi(DgtIface):
             DisplayMsg.show(Message.DGT_JACK_CONNECTED_ERROR())
         DisplayMsg.show(Message.DGT_CLOCK_VERSION(main=2, sub=2, dev='i2c', text=None))
 
+    def _process_button(self, ack3: int):
+        if ack3 not in self.button_texts:
+            return
+        logging.info('(i2c) clock %s pressed', self.button_texts[ack3])
+        if ack3 == 0x20:
+            with self.lib_lock:
+                self.lib.dgtpicom_configure()  # restart the clock - cause its OFF
+        DisplayMsg.show(Message.DGT_BUTTON(button=self.button_numbers[ack3], dev='i2c'))
+
     def _process_incoming_clock_forever(self):
-        but = c_byte(0)
-        buttime = c_byte(0)
-        clktime = create_string_buffer(6)
-        counter = 0
+        last_button = 0.0
+        last_times = None
         logging.info('incoming_clock ready')
         while True:
+            # one lock & round trip per tick - the time is only read while the clock counts down
             with self.lib_lock:
-                # get button events
-                res = self.lib.dgtpicom_get_button_message(pointer(but), pointer(buttime))
-                if res > 0:
-                    ack3 = but.value
-                    if ack3 == 0x01:
-                        logging.info('(i2c) clock button 0 pressed')
-                        DisplayMsg.show(Message.DGT_BUTTON(button=0, dev='i2c'))
-                    if ack3 == 0x02:
-                        logging.info('(i2c) clock button 1 pressed')
-                        DisplayMsg.show(Message.DGT_BUTTON(button=1, dev='i2c'))
-                    if ack3 == 0x04:
-                        logging.info('(i2c) clock button 2 pressed')
-                        DisplayMsg.show(Message.DGT_BUTTON(button=2, dev='i2c'))
-                    if ack3 == 0x08:
-                        logging.info('(i2c) clock button 3 pressed')
-                        DisplayMsg.show(Message.DGT_BUTTON(button=3, dev='i2c'))
-                    if ack3 == 0x10:
-                        logging.info('(i2c) clock button 4 pressed')
-                        DisplayMsg.show(Message.DGT_BUTTON(button=4, dev='i2c'))
-                    if ack3 == 0x20:
-                        logging.info('(i2c) clock button on/off pressed')
-                        self.lib.dgtpicom_configure()  # restart the clock - cause its OFF
-                        DisplayMsg.show(Message.DGT_BUTTON(button=0x11, dev='i2c'))
-                    if ack3 == 0x11:
-                        logging.info('(i2c) clock button 0+4 pressed')
-                        DisplayMsg.show(Message.DGT_BUTTON(button=0x11, dev='i2c'))
-                    if ack3 == 0x40:
-                        logging.info('(i2c) clock lever pressed > right side down')
-                        DisplayMsg.show(Message.DGT_BUTTON(button=0x40, dev='i2c'))
-                    if ack3 == -0x40:
-                        logging.info('(i2c) clock lever pressed > left side down')
-                        DisplayMsg.show(Message.DGT_BUTTON(button=-0x40, dev='i2c'))
-                if res < 0:
-                    logging.warning('GetButtonMessage returned error %i', res)
-
-                # get time events
-                self.lib.dgtpicom_get_time(clktime)
-
-            times = list(clktime.raw)
-            counter = (counter + 1) % 10
-            if counter == 0:
-                l_hms = times[:3]
-                r_hms = times[3:]
-                logging.info('(i2c) clock new time received l:%s r:%s', l_hms, r_hms)
-                if self.in_settime:
-                    logging.info('(i2c) clock still not finished set time, sending old time')
-                else:
-                    # DgtPi needs 2secs for a stopped clock to return the correct(!) time
-                    # we make it easy here and just set the time from the side counting down
-                    if self.side_running == ClockSide.LEFT:
-                        self.l_time = l_hms[0] * 3600 + l_hms[1] * 60 + l_hms[2]
-                    if self.side_running == ClockSide.RIGHT:
-                        self.r_time = r_hms[0] * 3600 + r_hms[1] * 60 + r_hms[2]
+                res = self._get_button_message(self.but_ref, self.buttime_ref)
+                running = self.side_running != ClockSide.NONE and not self.in_settime
+                if running:
+                    self._get_time(self.clktime)
+
+            if res > 0:
+                last_button = time.monotonic()
+                self._process_button(self.but.value)
+            if res < 0:
+                logging.warning('GetButtonMessage returned error %i', res)
+
+            if running:
+                # DgtPi needs 2secs for a stopped clock to return the correct(!) time
+                # we make it easy here and just set the time from the side counting down
+                hms = list(self.clktime.raw)
+                if self.side_running == ClockSide.LEFT:
+                    self.l_time = hms[0] * 3600 + hms[1] * 60 + hms[2]
+                if self.side_running == ClockSide.RIGHT:
+                    self.r_time = hms[3] * 3600 + hms[4] * 60 + hms[5]
+            if (self.l_time, self.r_time) != last_times:
+                last_times = (self.l_time, self.r_time)
+                logging.info('(i2c) clock new time l:%s r:%s', hms_time(self.l_time), hms_time(self.r_time))
                 text = Message.DGT_CLOCK_TIME(time_left=self.l_time, time_right=self.r_time, connect=True, dev='i2c')
                 DisplayMsg.show(text)
-            time.sleep(0.1)
+
+            fast = running or time.monotonic() - last_button < self.button_awake
+            idle_manager.wait(self.fast_poll if fast else self.slow_poll, 1.0)
 
     def _run_configure(self):
         res = self.lib.dgtpicom_configure()
@@ -897,6 +897,27 @@ class DgtTranslate(object):
             frtxt = entxt
             estxt = entxt
             ittxt = entxt
+        if text_id == 'tc_brons':
+            entxt = Dgt.DISPLAY_TEXT(l='Brnstn' + msg, m='Brn' + msg, s='b' + msg)
+            detxt = entxt
+            nltxt = entxt
+            frtxt = entxt
+            estxt = entxt
+            ittxt = entxt
+        if text_id == 'tc_delay':
+            entxt = Dgt.DISPLAY_TEXT(l='Delay ' + msg, m='Dly' + msg, s='d' + msg)
+            detxt = entxt
+            nltxt = entxt
+            frtxt = entxt
+            estxt = entxt
+            ittxt = entxt
+        if text_id == 'tc_stage':
+            entxt = Dgt.DISPLAY_TEXT(l='Stage ' + msg, m='Stg' + msg, s='s' + msg)
+            detxt = entxt
+            nltxt = entxt
+            frtxt = entxt
+            estxt = entxt
+            ittxt = entxt
         if text_id == 'noboard':
             wait = True
             entxt = Dgt.DISPLAY_TEXT(l='no e-' + msg, m='no' + msg, s=msg)
@@ -160,6 +160,9 @@ class TimeMode(MyEnum):
     FIXED = 'B00_timemode_fixed_menu'  # Fixed seconds per move
     BLITZ = 'B00_timemode_blitz_menu'  # Fixed time per game
     FISCHER = 'B00_timemode_fischer_menu'  # Fischer increment
+    BRONSTEIN = 'B00_timemode_bronstein_menu'  # Bronstein delay (the used time up to delay is given back)
+    DELAY = 'B00_timemode_delay_menu'  # Simple (US) delay (the clock starts counting after delay)
+    STAGES = 'B00_timemode_stages_menu'  # Moves per period like 40/90 followed by 30 (with optional increment)
 
 
 class TimeModeLoop(object):
@@ -0,0 +1,276 @@
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tty
+import time
+import random
+import logging
+from threading import Thread, Lock
+
+import chess
+import chess.pgn
+
+from dgt.util import DgtCmd, DgtClk, DgtMsg, ClockSide
+
+piece_to_dgt = {
+    'P': 0x01, 'R': 0x02, 'N': 0x03, 'B': 0x04, 'K': 0x05, 'Q': 0x06,
+    'p': 0x07, 'r': 0x08, 'n': 0x09, 'b': 0x0a, 'k': 0x0b, 'q': 0x0c
+}
+
+
+def dgt_field(square: int):
+    """Return the dgt field (0=a8) of a python-chess square (0=a1)."""
+    return (7 - chess.square_rank(square)) * 8 + chess.square_file(square)
+
+
+class VirtualDgt(object):
+
+    """Emulate a DGT e-board with a XL/3000 clock on a pseudo terminal."""
+
+    def __init__(self, clock_version=(2, 2), slide_rate=0.0, noise_rate=0.0, seed=None):
+        super(VirtualDgt, self).__init__()
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+        self.clock_version = clock_version
+        self.slide_rate = slide_rate  # chance a piece is dropped on a neighbour square first
+        self.noise_rate = noise_rate  # chance garbage bytes are written in front of a message
+        self.random = random.Random(seed)
+
+        self.lock = Lock()
+        self.fields = [0] * 64  # index 0 = a8 (unflipped dgt order)
+        self.update_mode = False
+        self.serialnr = '12345'
+
+        self.clock_times = [0, 0]  # secs left & right
+        self.clock_running = ClockSide.NONE
+        self.lever_right_down = False
+        self.tick = None
+
+        self.last_placed = None  # time of the last field update of a move
+        self.stats = {'bytes_in': 0, 'bytes_out': 0, 'commands': 0, 'clock_commands': 0, 'dumps': 0,
+                      'field_updates': 0, 'time_messages': 0, 'noise': 0, 'slides': 0, 'unknown': 0}
+        self.latency = []  # secs between a completed move and the next clock set&run
+        self.clock_runs = []  # running side of each clock set&run received (NONE = stopped)
+
+        self.running = True
+        self.reader = Thread(target=self._read_forever, daemon=True)
+        self.clock = Thread(target=self._clock_forever, daemon=True)
+
+    def start(self):
+        """Start the reader and clock threads."""
+        self.set_position(chess.Board())
+        self.reader.start()
+        self.clock.start()
+        logging.info('virtual board listening on %s', self.port)
+
+    def stop(self):
+        """Stop the threads and close the pty."""
+        self.running = False
+        os.close(self.slave)
+        os.close(self.master)
+
+    def _write(self, data: list):
+        if self.noise_rate and self.random.random() < self.noise_rate:
+            self.stats['noise'] += 1
+            if self.random.random() < 0.5:
+                garbage = [self.random.randrange(0x00, 0x80)]  # no message bit => skipped by the reader
+            else:
+                garbage = [DgtMsg.DGT_MSG_BOARD_DUMP, 0x00, 0x00]  # illegal length
+            data = garbage + data
+        with self.lock:
+            try:
+                os.write(self.master, bytes(data))
+            except OSError:
+                return
+            self.stats['bytes_out'] += len(data)
+
+    def _send_message(self, message_id: DgtMsg, data: list):
+        length = len(data) + 3
+        self._write([message_id, (length >> 7) & 0x7f, length & 0x7f] + data)
+
+    def _send_ack(self, ack1: int, ack2=0, ack3=0):
+        ack0 = 0x10
+        message = [0x0a | ((ack2 & 0x80) >> 3) | ((ack3 & 0x80) >> 2), ack0 & 0x7f, ack1 & 0x7f,
+                   0x0a | ((ack0 & 0x80) >> 3) | ((ack1 & 0x80) >> 2), ack2 & 0x7f, ack3 & 0x7f, 0x00]
+        self._send_message(DgtMsg.DGT_MSG_BWTIME, message)
+
+    def _send_time(self):
+        def _bcd(value: int):
+            return ((value // 10) << 4) | (value % 10)
+
+        message = []
+        for secs in reversed(self.clock_times):  # right side first
+            hours, rest = divmod(max(secs, 0), 3600)
+            message += [hours & 0x0f, _bcd(rest // 60), _bcd(rest % 60)]
+        status = 0x01 if self.clock_running != ClockSide.NONE else 0x00
+        if self.lever_right_down:
+            status |= 0x02
+        self.stats['time_messages'] += 1
+        self._send_message(DgtMsg.DGT_MSG_BWTIME, message + [status])
+
+    def send_board(self):
+        """Send a complete board dump."""
+        self.stats['dumps'] += 1
+        self._send_message(DgtMsg.DGT_MSG_BOARD_DUMP, list(self.fields))
+
+    def set_field(self, field: int, piece: int):
+        """Change one field and report it like the hardware does."""
+        self.fields[field] = piece
+        if self.update_mode:
+            self.stats['field_updates'] += 1
+            self._send_message(DgtMsg.DGT_MSG_FIELD_UPDATE, [field, piece])
+
+    def set_position(self, board: chess.Board):
+        """Put the pieces of a board silently on the fields."""
+        self.fields = [0] * 64
+        for square, piece in board.piece_map().items():
+            self.fields[dgt_field(square)] = piece_to_dgt[piece.symbol()]
+
+    def play_move(self, board: chess.Board, move: chess.Move, lift_delay=0.05):
+        """Lift and place the pieces of a move on the fields (the board is pushed afterwards)."""
+        before = {dgt_field(sq): piece_to_dgt[p.symbol()] for sq, p in board.piece_map().items()}
+        board.push(move)
+        after = {dgt_field(sq): piece_to_dgt[p.symbol()] for sq, p in board.piece_map().items()}
+        lifts = [field for field in before if before[field] != after.get(field)]
+        places = [field for field in after if before.get(field) != after[field]]
+        # captured pieces first, like a human player does
+        lifts.sort(key=lambda field: field not in places)
+        for field in lifts:
+            self.set_field(field, 0)
+            time.sleep(lift_delay)
+        for field in places:
+            if self.slide_rate and self.random.random() < self.slide_rate:
+                neighbour = self._neighbour(field)
+                if neighbour is not None:
+                    self.stats['slides'] += 1
+                    self.set_field(neighbour, after[field])
+                    time.sleep(lift_delay)
+                    self.set_field(neighbour, 0)
+            self.set_field(field, after[field])
+            time.sleep(lift_delay)
+        self.last_placed = time.monotonic()
+
+    def _neighbour(self, field: int):
+        candidates = [f for f in (field - 1, field + 1, field - 8, field + 8)
+                      if 0 <= f < 64 and abs(f % 8 - field % 8) <= 1 and not self.fields[f]]
+        return self.random.choice(candidates) if candidates else None
+
+    def replay(self, pgn_file: str, move_delay=2.0, speed=1.0):
+        """Replay all games of a pgn file, move_delay secs per move divided by speed."""
+        with open(pgn_file) as file:
+            while self.running:
+                game = chess.pgn.read_game(file)
+                if game is None:
+                    break
+                board = game.board()
+                self.set_position(board)
+                self.send_board()
+                time.sleep(move_delay / speed)
+                for move in game.main_line():
+                    if not self.running:
+                        break
+                    self.play_move(board, move)
+                    time.sleep(move_delay / speed)
+
+    def _process_clock(self, payload: list):
+        self.stats['clock_commands'] += 1
+        if len(payload) < 2 or payload[0] != DgtClk.DGT_CMD_CLOCK_START_MESSAGE.value:
+            logging.warning('illegal clock message %s', payload)
+            return
+        command = payload[1]
+        if command == DgtClk.DGT_CMD_CLOCK_VERSION.value:
+            main, sub = self.clock_version
+            self._send_ack(command, (main << 4) | sub)
+            return
+        if command == DgtClk.DGT_CMD_CLOCK_SETNRUN.value and len(payload) >= 9:
+            l_hours, l_mins, l_secs, r_hours, r_mins, r_secs, side = payload[2:9]
+            self.clock_times = [l_hours * 3600 + l_mins * 60 + l_secs, r_hours * 3600 + r_mins * 60 + r_secs]
+            self.clock_running = ClockSide(side) if side in (0x01, 0x02, 0x04) else ClockSide.NONE
+            self.clock_runs.append(self.clock_running)
+            self.tick = time.monotonic() + 1
+            if self.last_placed:
+                self.latency.append(time.monotonic() - self.last_placed)
+                self.last_placed = None
+        self._send_ack(command)
+
+    def _read_bytes(self, count: int):
+        data = b''
+        while len(data) < count and self.running:
+            try:
+                data += os.read(self.master, count - len(data))
+            except OSError:
+                self.running = False
+        self.stats['bytes_in'] += len(data)
+        return data
+
+    def _read_forever(self):
+        while self.running:
+            byte = self._read_bytes(1)
+            if not byte:
+                continue
+            command = byte[0]
+            self.stats['commands'] += 1
+            if False:  # switch-case
+                pass
+            elif command == DgtCmd.DGT_SEND_BRD.value:
+                self.send_board()
+            elif command in (DgtCmd.DGT_SEND_UPDATE.value, DgtCmd.DGT_SEND_UPDATE_BRD.value,
+                             DgtCmd.DGT_SEND_UPDATE_NICE.value):
+                self.update_mode = True
+            elif command == DgtCmd.DGT_SEND_RESET.value:
+                self.update_mode = False
+            elif command == DgtCmd.DGT_SEND_VERSION.value:
+                self._send_message(DgtMsg.DGT_MSG_VERSION, [1, 9])
+            elif command == DgtCmd.DGT_RETURN_SERIALNR.value:
+                self._send_message(DgtMsg.DGT_MSG_SERIALNR, [ord(char) for char in self.serialnr])
+            elif command == DgtCmd.DGT_SEND_BATTERY_STATUS.value:
+                self._send_message(DgtMsg.DGT_MSG_BATTERY_STATUS, [100] + [0] * 8)
+            elif command == DgtCmd.DGT_SEND_CLK.value:
+                self._send_time()
+            elif command == DgtCmd.DGT_SET_LEDS.value:
+                self._read_bytes(3)
+            elif command == DgtCmd.DGT_CLOCK_MESSAGE.value:
+                length = self._read_bytes(1)
+                if length:
+                    self._process_clock(list(self._read_bytes(length[0])))
+            else:
+                self.stats['unknown'] += 1
+                logging.warning('unknown command %x', command)
+
+    def _clock_forever(self):
+        while self.running:
+            time.sleep(0.05)
+            if self.clock_running == ClockSide.NONE or time.monotonic() < self.tick:
+                continue
+            self.tick += 1
+            index = 0 if self.clock_running == ClockSide.LEFT else 1
+            self.clock_times[index] = max(self.clock_times[index] - 1, 0)
+            if self.update_mode:
+                self._send_time()
+
+    def get_stats(self):
+        """Return the counters and the move->clock latency percentiles in ms."""
+        stats = dict(self.stats)
+        samples = sorted(self.latency)
+        if samples:
+            for name, quantile in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+                stats['latency_' + name] = round(samples[min(int(len(samples) * quantile), len(samples) - 1)] * 1000, 1)
+        stats['latency_samples'] = len(samples)
+        return stats
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import logging
+import configargparse
+
+from dgt.virtual import VirtualDgt
+
+
+def main():
+    """Run a virtual DGT board & clock. Start picochess with --dgt-port set to the printed device."""
+    parser = configargparse.ArgParser()
+    parser.add_argument('-pgn', '--pgn-file', type=str, help='replay the games of this pgn file')
+    parser.add_argument('-md', '--move-delay', type=float, default=2.0, help='secs between two moves')
+    parser.add_argument('-sp', '--speed', type=float, default=1.0, help='replay speed factor')
+    parser.add_argument('-sd', '--start-delay', type=float, default=10.0,
+                        help='secs to wait before the replay starts (let picochess connect)')
+    parser.add_argument('-sr', '--slide-rate', type=float, default=0.0,
+                        help='chance (0..1) a piece is dropped on a neighbour square first')
+    parser.add_argument('-nr', '--noise-rate', type=float, default=0.0,
+                        help='chance (0..1) garbage bytes are sent in front of a message')
+    parser.add_argument('-cv', '--clock-version', type=str, default='2.2',
+                        help='clock version to report: 2.x = DGT3000, 1.x = DGT XL')
+    parser.add_argument('-s', '--seed', type=int, help='random seed for reproducible noise')
+    parser.add_argument('-l', '--log-level', choices=['notset', 'debug', 'info', 'warning', 'error', 'critical'],
+                        default='warning', help='logging level')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()),
+                        format='%(asctime)s.%(msecs)03d %(levelname)7s %(module)10s - %(funcName)s: %(message)s',
+                        datefmt="%Y-%m-%d %H:%M:%S")
+
+    main_version, sub_version = (int(part) for part in args.clock_version.split('.'))
+    board = VirtualDgt(clock_version=(main_version, sub_version), slide_rate=args.slide_rate,
+                       noise_rate=args.noise_rate, seed=args.seed)
+    board.start()
+    print(board.port, flush=True)
+    try:
+        if args.pgn_file:
+            time.sleep(args.start_delay)
+            board.replay(args.pgn_file, move_delay=args.move_delay, speed=args.speed)
+        else:
+            while True:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(board.get_stats(), flush=True)
+        board.stop()
+
+
+if __name__ == '__main__':
+    main()
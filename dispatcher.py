@@ -17,13 +17,26 @@
 
 import logging
 import queue
-from threading import Timer, Thread, Lock
-from copy import deepcopy
+import time
+import itertools
+from collections import deque
+from threading import Thread
+from copy import copy
 
-from utilities import DisplayDgt, DispatchDgt, dispatch_queue
+from utilities import DisplayDgt, DispatchDgt, dispatch_queue, tracer, metrics
 from dgt.api import Dgt, DgtApi
 from dgt.menu import DgtMenu
 
+# priorities of the delayed tasks - lower values are processed first
+PRIO_ERROR = 0  # eBoard errors
+PRIO_MOVE = 1  # moves
+PRIO_MENU = 2  # all other texts
+PRIO_TIME = 3  # time display and clock commands - these keep their order against all other tasks
+PRIOS = (PRIO_ERROR, PRIO_MOVE, PRIO_MENU, PRIO_TIME)
+
+# commands changing the clock display - they replace a pending (governed) text
+DISPLAY_CHANGES = (DgtApi.DISPLAY_MOVE, DgtApi.DISPLAY_TEXT, DgtApi.DISPLAY_TIME, DgtApi.CLOCK_START, DgtApi.CLOCK_STOP)
+
 
 class Dispatcher(DispatchDgt, Thread):
 
@@ -34,25 +47,34 @@ class Dispatcher(DispatchDgt, Thread):
 
         self.dgtmenu = dgtmenu
         self.devices = set()
-        self.maxtimer = {}
-        self.maxtimer_running = {}
+        self.maxtimer = {}  # time.monotonic() deadline of the running maxtime or None
         self.clock_connected = {}
         self.time_factor = 1  # This is for testing the duration - remove it lateron!
-        self.tasks = {}  # delayed task array
+        self.task_expiry = 10  # secs a delayed (temporary) text stays valid
+        self.tasks = {}  # delayed tasks - one deque per priority holding (seq, expiry, received, message)
+        self.task_seq = itertools.count()
 
         self.display_hash = {}  # Hash value of clock's display
-        self.process_lock = {}
+        self.metrics = {}
+
+        # output governor: (coalesce window, min dwell time) secs for the texts flagged as info (like kibitz scores)
+        self.governor = {'ser': (0.3, 1.0), 'i2c': (0.3, 1.0), 'web': (0.0, 0.0)}
+        self.pending = {}  # (governed) texts waiting for output - per device: slot => (flush, received, message)
+        self.last_shown = {}  # time.monotonic() of the last display change
+        metrics.add_collector(self._get_gauges)
 
     def register(self, device: str):
         """Register new device to send DgtApi messsages."""
         logging.debug('device %s registered', device)
         self.devices.add(device)
         self.maxtimer[device] = None
-        self.maxtimer_running[device] = False
         self.clock_connected[device] = False
-        self.process_lock[device] = Lock()
-        self.tasks[device] = []
+        self.tasks[device] = {prio: deque() for prio in PRIOS}
         self.display_hash[device] = None
+        self.pending[device] = {}
+        self.last_shown[device] = 0.0
+        self.metrics[device] = {'depth': 0, 'depth_max': 0, 'shown': 0, 'hashed': 0, 'expired': 0, 'coalesced': 0,
+                                'clock_in': 0, 'clock_out': 0, 'ttd_avg': 0.0, 'ttd_max': 0.0}
 
     def is_prio_device(self, dev, connect):
         """Return the most prio registered device."""
@@ -65,36 +87,94 @@ class Dispatcher(DispatchDgt, Thread):
             return 'ser' == dev
         return 'web' == dev
 
+    def get_metrics(self):
+        """Return the queue depth and time-to-display (secs) metrics per device."""
+        return {dev: metric.copy() for dev, metric in self.metrics.items()}
+
+    def _get_gauges(self):
+        return [('picochess_dispatch_' + name, {'device': dev}, value)
+                for dev, metric in self.get_metrics().items() for name, value in metric.items()]
+
+    @staticmethod
+    def _get_prio(message):
+        if repr(message) == DgtApi.DISPLAY_TEXT:
+            return PRIO_ERROR if message.maxtime == 0.1 else PRIO_MENU  # 0.1=eBoard error
+        if repr(message) == DgtApi.DISPLAY_MOVE:
+            return PRIO_MOVE
+        return PRIO_TIME
+
+    @staticmethod
+    def _get_slot(message):
+        """Return the display slot of an info text the governor may coalesce or None (never for moves or clock)."""
+        if repr(message) == DgtApi.DISPLAY_TEXT and hasattr(message, 'info') and message.info and not message.beep:
+            return 'main'
+        return None
+
+    def _maxtimer_running(self, dev: str):
+        return self.maxtimer[dev] is not None
+
+    def _task_count(self, dev: str):
+        return sum(len(tasks) for tasks in self.tasks[dev].values())
+
+    def _add_task(self, message, dev: str, received: float):
+        expiry = None
+        if repr(message) == DgtApi.DISPLAY_TEXT and message.maxtime > 0:  # only temporary texts get stale
+            expiry = received + self.task_expiry
+        self.tasks[dev][self._get_prio(message)].append((next(self.task_seq), expiry, received, message))
+        metric = self.metrics[dev]
+        metric['depth'] = self._task_count(dev)
+        metric['depth_max'] = max(metric['depth_max'], metric['depth'])
+        logging.debug('(%s) tasks delayed: %i', dev, metric['depth'])
+
+    def _pop_task(self, dev: str):
+        # a clock command (like "stop" before showing the computer move) cant be overtaken by the other tasks
+        tasks = self.tasks[dev]
+        barrier = tasks[PRIO_TIME][0][0] if tasks[PRIO_TIME] else None
+        for prio in PRIOS:
+            if tasks[prio] and (prio == PRIO_TIME or barrier is None or tasks[prio][0][0] < barrier):
+                task = tasks[prio].popleft()
+                self.metrics[dev]['depth'] = self._task_count(dev)
+                return task[1:]
+        return None
+
+    def _clear_tasks(self, dev: str):
+        for prio in PRIOS:
+            self.tasks[dev][prio].clear()
+        self.metrics[dev]['depth'] = 0
+
     def _stopped_maxtimer(self, dev: str):
-        self.maxtimer_running[dev] = False
+        self.maxtimer[dev] = None
         self.dgtmenu.disable_picochess_displayed(dev)
 
         if dev not in self.devices:
             logging.debug('delete not registered (%s) tasks', dev)
-            self.tasks[dev] = []
+            self._clear_tasks(dev)
             return
-        if self.tasks[dev]:
-            logging.debug('processing delayed (%s) tasks: %s', dev, self.tasks[dev])
+        if self._task_count(dev):
+            logging.debug('processing delayed (%s) tasks: %i', dev, self._task_count(dev))
         else:
             logging.debug('(%s) max timer finished - returning to time display', dev)
-            DisplayDgt.show(Dgt.DISPLAY_TIME(force=False, wait=True, devs={dev}))
-        while self.tasks[dev]:
-            logging.debug('(%s) tasks has %i members', dev, len(self.tasks[dev]))
-            try:
-                message = self.tasks[dev].pop(0)
-            except IndexError:
+            self._show(Dgt.DISPLAY_TIME(force=False, wait=True, devs={dev}), dev, time.monotonic())
+        now = time.monotonic()
+        while True:
+            task = self._pop_task(dev)
+            if task is None:
                 break
-            with self.process_lock[dev]:
-                self._process_message(message, dev)
-            if self.maxtimer_running[dev]:  # run over the task list until a maxtime command was processed
-                remaining = len(self.tasks[dev])
+            expiry, received, message = task
+            if expiry is not None and now > expiry:
+                logging.debug('(%s) stale task expired: %s', dev, message)
+                self.metrics[dev]['expired'] += 1
+                continue
+            self._process_message(message, dev, received)
+            if self._maxtimer_running(dev):  # run over the task list until a maxtime command was processed
+                remaining = self._task_count(dev)
                 if remaining:
                     logging.debug('(%s) tasks stopped on %i remaining members', dev, remaining)
                 else:
                     logging.debug('(%s) tasks completed', dev)
                 break
 
-    def _process_message(self, message, dev: str):
+    def _process_message(self, message, dev: str, received: float):
         do_handle = True
         if repr(message) in (DgtApi.CLOCK_START, DgtApi.CLOCK_STOP, DgtApi.DISPLAY_TIME):
             self.display_hash[dev] = None  # Cant know the clock display if command changing the running status
@@ -116,73 +196,136 @@ class Dispatcher(DispatchDgt, Thread):
             if repr(message) in clk and not self.clock_connected[dev]:
                 logging.debug('(%s) clock still not registered => ignore %s', dev, message)
                 return
-            if hasattr(message, 'maxtime') and message.maxtime > 0:
-                if repr(message) == DgtApi.DISPLAY_TEXT:
-                    if message.maxtime == 2.1:  # 2.1=picochess message
-                        self.dgtmenu.enable_picochess_displayed(dev)
-                    if self.dgtmenu.inside_updt_menu():
-                        if message.maxtime == 0.1:  # 0.1=eBoard error
-                            logging.debug('(%s) inside update menu => board errors not displayed', dev)
-                            return
-                        if message.maxtime == 1.1:  # 1.1=eBoard connect
-                            logging.debug('(%s) inside update menu => board connect not displayed', dev)
-                            return
-                self.maxtimer[dev] = Timer(message.maxtime * self.time_factor, self._stopped_maxtimer, [dev])
-                self.maxtimer[dev].start()
-                logging.debug('(%s) showing %s for %.1f secs', dev, message, message.maxtime * self.time_factor)
-                self.maxtimer_running[dev] = True
-            if repr(message) == DgtApi.CLOCK_START and self.dgtmenu.inside_updt_menu():
-                logging.debug('(%s) inside update menu => clock not started', dev)
-                return
-            message.devs = {dev}  # on new system, we only have ONE device each message - force this!
-            DisplayDgt.show(message)
+            self._govern(message, dev, received)
         else:
+            self.metrics[dev]['hashed'] += 1
             logging.debug('(%s) hash ignore DgtApi: %s', dev, message)
 
+    def _output(self, message, dev: str, received: float):
+        if hasattr(message, 'maxtime') and message.maxtime > 0:
+            if repr(message) == DgtApi.DISPLAY_TEXT:
+                if message.maxtime == 2.1:  # 2.1=picochess message
+                    self.dgtmenu.enable_picochess_displayed(dev)
+                if self.dgtmenu.inside_updt_menu():
+                    if message.maxtime == 0.1:  # 0.1=eBoard error
+                        logging.debug('(%s) inside update menu => board errors not displayed', dev)
+                        return
+                    if message.maxtime == 1.1:  # 1.1=eBoard connect
+                        logging.debug('(%s) inside update menu => board connect not displayed', dev)
+                        return
+            self.maxtimer[dev] = time.monotonic() + message.maxtime * self.time_factor
+            logging.debug('(%s) showing %s for %.1f secs', dev, message, message.maxtime * self.time_factor)
+        if repr(message) == DgtApi.CLOCK_START and self.dgtmenu.inside_updt_menu():
+            logging.debug('(%s) inside update menu => clock not started', dev)
+            return
+        if repr(message) in DISPLAY_CHANGES and self.pending[dev]:
+            logging.debug('(%s) pending texts replaced by %s', dev, message)
+            self.metrics[dev]['coalesced'] += len(self.pending[dev])
+            self.pending[dev] = {}
+        self._show(message, dev, received)
+
+    def _govern(self, message, dev: str, received: float):
+        slot = self._get_slot(message)
+        window, dwell = self.governor.get(dev, (0.0, 0.0))
+        if slot and (window or dwell):
+            now = time.monotonic()
+            if slot in self.pending[dev]:  # keep the flush time, so a text stream cant starve the output
+                flush = self.pending[dev][slot][0]
+                self.metrics[dev]['coalesced'] += 1
+            else:
+                flush = max(now + window, self.last_shown[dev] + dwell)
+            self.pending[dev][slot] = (flush, received, message)
+            return
+        self._output(message, dev, received)
+
+    def _flush_pending(self, dev: str, now: float):
+        for slot, (flush, received, message) in list(self.pending[dev].items()):
+            if now >= flush:
+                del self.pending[dev][slot]
+                self._output(message, dev, received)
+
+    def _show(self, message, dev: str, received: float):
+        message = copy(message)  # the devices only read the message, so a flat copy is enough
+        message.devs = {dev}  # on new system, we only have ONE device each message - force this!
+        DisplayDgt.show_dev(message, dev)
+
+        now = time.monotonic()
+        if repr(message) in DISPLAY_CHANGES:
+            self.last_shown[dev] = now
+        metric = self.metrics[dev]
+        if repr(message) in (DgtApi.CLOCK_START, DgtApi.CLOCK_STOP):
+            metric['clock_out'] += 1
+        ttd = now - received
+        metric['shown'] += 1
+        metric['ttd_avg'] += (ttd - metric['ttd_avg']) / min(metric['shown'], 100)  # avg over the last ~100
+        metric['ttd_max'] = max(metric['ttd_max'], ttd)
+
     def stop_maxtimer(self, dev):
         """Stop the maxtimer."""
-        if self.maxtimer_running[dev]:
-            self.maxtimer[dev].cancel()
-            self.maxtimer[dev].join()
-            self.maxtimer_running[dev] = False
+        if self._maxtimer_running(dev):
+            self.maxtimer[dev] = None
             self.dgtmenu.disable_picochess_displayed(dev)
 
+    def _dispatch(self, msg, received: float):
+        logging.debug('received command from dispatch_queue: %s devs: %s', msg, ','.join(msg.devs))
+
+        for dev in msg.devs & self.devices:
+            if repr(msg) in (DgtApi.CLOCK_START, DgtApi.CLOCK_STOP):
+                self.metrics[dev]['clock_in'] += 1
+            if self._maxtimer_running(dev):
+                if hasattr(msg, 'wait'):
+                    if msg.wait:
+                        self._add_task(msg, dev, received)
+                        continue
+                    else:
+                        logging.debug('ignore former maxtime - dev: %s', dev)
+                        self.stop_maxtimer(dev)
+                        if self._task_count(dev):
+                            logging.debug('delete following (%s) tasks: %i', dev, self._task_count(dev))
+                            for _, _, task_received, command in self.tasks[dev][PRIO_TIME]:
+                                if repr(command) in (DgtApi.CLOCK_START, DgtApi.CLOCK_STOP):  # but never drop these
+                                    logging.debug('processing delayed clock command %s', command)
+                                    self._process_message(command, dev, task_received)
+                            self._clear_tasks(dev)
+                else:
+                    logging.debug('command doesnt change the clock display => (%s) max timer ignored', dev)
+            else:
+                logging.debug('(%s) max timer not running => processing command: %s', dev, msg)
+
+            self._process_message(msg, dev, received)
+
+    def _get_next_deadline(self):
+        deadlines = [deadline for deadline in self.maxtimer.values() if deadline is not None]
+        deadlines.extend(flush for pending in self.pending.values() for flush, _, _ in pending.values())
+        return min(deadlines) if deadlines else None
+
+    def _process_deadlines(self, now: float):
+        for dev in list(self.maxtimer):
+            if self.maxtimer[dev] is not None and now >= self.maxtimer[dev]:
+                self._stopped_maxtimer(dev)
+            if self.pending[dev]:
+                self._flush_pending(dev, now)
+
+    def _step(self):
+        """Wait for the next command or deadline and process it."""
+        # the maxtimers are deadlines inside this loop - so all device handling runs on this thread
+        deadline = self._get_next_deadline()
+        timeout = max(deadline - time.monotonic(), 0) if deadline is not None else None
+        try:
+            msg = dispatch_queue.get(timeout=timeout)
+        except queue.Empty:
+            msg = None
+
+        now = time.monotonic()
+        self._process_deadlines(now)
+
+        # Check if we have something to display
+        if msg is not None:
+            tracer.enter(msg, 'dispatch')
+            self._dispatch(msg, now if msg.fired is None else msg.fired)  # time to display counts from the fire
+
     def run(self):
         """Call by threading.Thread start() function."""
         logging.info('dispatch_queue ready')
         while True:
-            # Check if we have something to display
-            try:
-                msg = dispatch_queue.get()
-                logging.debug('received command from dispatch_queue: %s devs: %s', msg, ','.join(msg.devs))
-
-                for dev in msg.devs & self.devices:
-                    message = deepcopy(msg)
-                    if self.maxtimer_running[dev]:
-                        if hasattr(message, 'wait'):
-                            if message.wait:
-                                self.tasks[dev].append(message)
-                                logging.debug('(%s) tasks delayed: %s', dev, self.tasks[dev])
-                                continue
-                            else:
-                                logging.debug('ignore former maxtime - dev: %s', dev)
-                                self.stop_maxtimer(dev)
-                                if self.tasks[dev]:
-                                    logging.debug('delete following (%s) tasks: %s', dev, self.tasks[dev])
-                                    while self.tasks[dev]:  # but do the last CLOCK_START()
-                                        command = self.tasks[dev].pop()
-                                        if repr(command) == DgtApi.CLOCK_START:  # clock might be in set mode
-                                            logging.debug('processing (last) delayed clock start command')
-                                            with self.process_lock[dev]:
-                                                self._process_message(command, dev)
-                                            break
-                                    self.tasks[dev] = []
-                        else:
-                            logging.debug('command doesnt change the clock display => (%s) max timer ignored', dev)
-                    else:
-                        logging.debug('(%s) max timer not running => processing command: %s', dev, message)
-
-                    with self.process_lock[dev]:
-                        self._process_message(message, dev)
-            except queue.Empty:
-                pass
+            self._step()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import platform
+import logging
+import configargparse
+
+from uci.tcp import EngineServer
+
+
+def main():
+    """Serve the engines of this machine to picochess clients (see --engine-remote-tcp-port)."""
+    program_path = os.path.dirname(os.path.abspath(__file__))
+    parser = configargparse.ArgParser()
+    parser.add_argument('-p', '--port', type=int, default=9200, help='tcp port the engine server listens on')
+    parser.add_argument('-ep', '--engine-path', type=str, help='folder with the engines and their engines.ini',
+                        default=program_path + os.sep + 'engines' + os.sep + platform.machine())
+    parser.add_argument('-mi', '--max-idle', type=int, default=2,
+                        help='idle processes kept running per engine for reuse by the next client')
+    parser.add_argument('-l', '--log-level', choices=['notset', 'debug', 'info', 'warning', 'error', 'critical'],
+                        default='warning', help='logging level')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()),
+                        format='%(asctime)s.%(msecs)03d %(levelname)7s %(module)10s - %(funcName)s: %(message)s',
+                        datefmt="%Y-%m-%d %H:%M:%S")
+
+    server = EngineServer(args.port, args.engine_path, max_idle=args.max_idle)
+    logging.info('serving engines of [%s] on port %i', args.engine_path, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+/*
+ * Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+ *                         Shivkumar Shivaji ()
+ *                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program. If not, see <http://www.gnu.org/licenses/>.
+ */
+
+/*
+ * Mock of the dgtpicom library for benchmarking DgtPi without the hardware.
+ *
+ *   gcc -shared -fPIC -O2 -o etc/dgtpicom.mock.so etc/dgtpicom_mock.c
+ *
+ * DGTPICOM_MOCK_LATENCY_US sets the usecs each call blocks like an i2c transfer (default 300).
+ * dgtpicom_mock_buttons(secs) presses button 0 every secs (0 = never) and dgtpicom_mock_calls() counts the calls.
+ */
+
+#include <stdlib.h>
+#include <time.h>
+#include <unistd.h>
+
+static long calls = 0;
+static long latency_us = -1;
+static double button_secs = 0;
+static double last_button = 0;
+static int run[2] = {0, 0};
+static double left[2] = {0, 0};  /* secs left at the last clock change */
+static double since = 0;  /* time of the last clock change */
+
+static double now(void)
+{
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + ts.tv_nsec / 1e9;
+}
+
+static void transfer(void)
+{
+    if (latency_us < 0) {
+        const char *env = getenv("DGTPICOM_MOCK_LATENCY_US");
+        latency_us = env ? atol(env) : 300;
+    }
+    calls++;
+    if (latency_us)
+        usleep(latency_us);
+}
+
+static double time_left(int side)
+{
+    double secs = left[side] - (run[side] ? now() - since : 0);
+    return secs > 0 ? secs : 0;
+}
+
+static void freeze(void)
+{
+    left[0] = time_left(0);
+    left[1] = time_left(1);
+    since = now();
+}
+
+long dgtpicom_mock_calls(void) { return calls; }
+
+void dgtpicom_mock_buttons(double secs)
+{
+    button_secs = secs;
+    last_button = now();
+}
+
+int dgtpicom_init(void) { transfer(); return 0; }
+int dgtpicom_configure(void) { transfer(); return 0; }
+int dgtpicom_set_text(char *text, char beep, char ld, char rd) { transfer(); return 0; }
+int dgtpicom_end_text(void) { transfer(); return 0; }
+int dgtpicom_get_button_state(void) { transfer(); return 0; }
+int dgtpicom_off(char returnToCR) { transfer(); return 0; }
+void dgtpicom_stop(void) { transfer(); }
+
+int dgtpicom_run(char lr, char rr)
+{
+    transfer();
+    freeze();
+    run[0] = lr;
+    run[1] = rr;
+    return 0;
+}
+
+int dgtpicom_set_and_run(char lr, char lh, char lm, char ls, char rr, char rh, char rm, char rs)
+{
+    transfer();
+    left[0] = lh * 3600 + lm * 60 + ls;
+    left[1] = rh * 3600 + rm * 60 + rs;
+    since = now();
+    run[0] = lr;
+    run[1] = rr;
+    return 0;
+}
+
+void dgtpicom_get_time(char time[])
+{
+    int side;
+    transfer();
+    for (side = 0; side < 2; side++) {
+        int secs = (int) time_left(side);
+        time[side * 3] = secs / 3600;
+        time[side * 3 + 1] = secs / 60 % 60;
+        time[side * 3 + 2] = secs % 60;
+    }
+}
+
+int dgtpicom_get_button_message(char *buttons, char *time)
+{
+    transfer();
+    if (button_secs > 0 && now() - last_button >= button_secs) {
+        last_button = now();
+        *buttons = 0x01;
+        *time = 0;
+        return 1;
+    }
+    return 0;
+}
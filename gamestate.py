@@ -0,0 +1,327 @@
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import random
+from collections import Counter
+
+import chess
+
+_random = random.Random(0x5eed)  # fixed seed => the same keys on every start
+ZOBRIST_PIECES = [[_random.getrandbits(64) for _ in range(64)] for _ in range(12)]
+ZOBRIST_CASTLING = [_random.getrandbits(64) for _ in range(64)]  # per rook square with castling right
+ZOBRIST_EP = [_random.getrandbits(64) for _ in range(8)]  # per file of a (legal) en passant square
+ZOBRIST_TURN = _random.getrandbits(64)
+
+
+def _piece_boards(board: chess.Board):
+    """Return the 12 bitboards (white pawns ... black kings) of the position."""
+    boards = []
+    for color in (board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK]):
+        boards.extend((board.pawns & color, board.knights & color, board.bishops & color,
+                       board.rooks & color, board.queens & color, board.kings & color))
+    return boards
+
+
+def _ep_file(board: chess.Board):
+    return chess.square_file(board.ep_square) if board.ep_square is not None and board.has_legal_en_passant() else None
+
+
+def _capture(board: chess.Board):
+    """Return the position (without move stack) as a tuple - O(1)."""
+    return (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings,
+            board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK], board.promoted,
+            board.turn, board.castling_rights, board.ep_square, board.halfmove_clock, board.fullmove_number)
+
+
+def _restore(position: tuple, chess960: bool, board_type=chess.Board):
+    """Return a new board of the captured position (without move stack)."""
+    board = board_type(None, chess960)
+    (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings,
+     board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK], board.promoted,
+     board.turn, board.castling_rights, board.ep_square, board.halfmove_clock, board.fullmove_number) = position
+    board.occupied = board.occupied_co[chess.WHITE] | board.occupied_co[chess.BLACK]
+    board.clear_stack()  # a GameBoard takes the position as its root
+    return board
+
+
+def _xor_squares(key: int, bitboard: int, table: list):
+    while bitboard:
+        square = (bitboard & -bitboard).bit_length() - 1
+        key ^= table[square]
+        bitboard &= bitboard - 1
+    return key
+
+
+class GameState(object):
+
+    """Repetition counts, halfmove clock & legal move count of a game - updated once per push and pop."""
+
+    def __init__(self, board: chess.Board):
+        super(GameState, self).__init__()
+        self.counts = Counter()  # zobrist key => occurrences in this game
+        self.repeated = 0  # number of keys occurring more than once (no claim possible without)
+        self.entries = []  # per ply: [key, piece boards, castling rights, ep file, legal move count (lazy)]
+        self._append(self._entry(board, [0] * 12, 0, None, 0 if board.turn == chess.WHITE else ZOBRIST_TURN))
+
+    @staticmethod
+    def _entry(board: chess.Board, boards: list, castling: int, ep_file, key: int):
+        new_boards = _piece_boards(board)
+        for index, (old, new) in enumerate(zip(boards, new_boards)):
+            if old != new:
+                key = _xor_squares(key, old ^ new, ZOBRIST_PIECES[index])
+        new_castling = board.clean_castling_rights()
+        key = _xor_squares(key, castling ^ new_castling, ZOBRIST_CASTLING)
+        new_ep_file = _ep_file(board)
+        if ep_file is not None:
+            key ^= ZOBRIST_EP[ep_file]
+        if new_ep_file is not None:
+            key ^= ZOBRIST_EP[new_ep_file]
+        return [key, new_boards, new_castling, new_ep_file, None]
+
+    def _append(self, entry: list):
+        self.entries.append(entry)
+        self.counts[entry[0]] += 1
+        if self.counts[entry[0]] == 2:
+            self.repeated += 1
+
+    def push(self, board: chess.Board):
+        """Add the position after the move just pushed on the board."""
+        _, boards, castling, ep_file, _ = last = self.entries[-1]
+        self._append(self._entry(board, boards, castling, ep_file, last[0] ^ ZOBRIST_TURN))
+
+    def pop(self):
+        """Remove the position of the move just popped from the board."""
+        key = self.entries.pop()[0]
+        self.counts[key] -= 1
+        if self.counts[key] == 1:
+            self.repeated -= 1
+        elif not self.counts[key]:
+            del self.counts[key]
+
+    @staticmethod
+    def _create(entries: list, counts: Counter):
+        state = GameState.__new__(GameState)
+        state.counts = counts
+        state.repeated = sum(1 for count in counts.values() if count > 1)
+        state.entries = entries
+        return state
+
+    def copy(self):
+        """Return a copy (the entries are shared - they only change by their lazy legal move count)."""
+        return self._create(list(self.entries), self.counts.copy())
+
+    @staticmethod
+    def from_entries(entries: list):
+        """Return the state out of the entries of all plies."""
+        return GameState._create(entries, Counter(entry[0] for entry in entries))
+
+    def get_key(self):
+        """Return the zobrist key of the current position."""
+        return self.entries[-1][0]
+
+    def get_count(self):
+        """Return how often the current position occurred."""
+        return self.counts[self.entries[-1][0]]
+
+    def get_legal_count(self, board: chess.Board):
+        """Return the number of legal moves of the current position (generated once)."""
+        entry = self.entries[-1]
+        if entry[4] is None:
+            entry[4] = len(board.legal_moves)
+        return entry[4]
+
+
+class GameBoard(chess.Board):
+
+    """A chess.Board answering the game termination checks out of its GameState instead of replaying the moves."""
+
+    def __init__(self, fen=chess.STARTING_FEN, chess960=False):
+        self.state = None
+        self.root_position = None
+        self.history = None  # persistent list (move, board state before, game state entry, history before)
+        super(GameBoard, self).__init__(fen, chess960)
+
+    def clear_stack(self):
+        """Clear the move stack (also called on every new position)."""
+        super(GameBoard, self).clear_stack()
+        self.state = GameState(self)
+        self.root_position = _capture(self)
+        self.history = None
+
+    def push(self, move):
+        """Push the move and update the game state."""
+        super(GameBoard, self).push(move)
+        self.state.push(self)
+        self.history = (move, self.stack[-1], self.state.entries[-1], self.history)
+
+    def pop(self):
+        """Pop the last move and update the game state."""
+        move = super(GameBoard, self).pop()
+        self.state.pop()
+        self.history = self.history[3]
+        return move
+
+    def copy(self, stack=True):
+        """Copy the board with its game state."""
+        board = super(GameBoard, self).copy(stack=False)
+        if stack:
+            board.move_stack = list(self.move_stack)  # the moves are never changed => no deep copy
+            board.stack = list(self.stack)
+            board.state = self.state.copy()
+            board.root_position = self.root_position
+            board.history = self.history
+        else:
+            board.clear_stack()  # the copied position is the new root
+        return board
+
+    def snapshot(self):
+        """Return an immutable snapshot of the game in O(1)."""
+        return GameSnapshot(self)
+
+    def has_legal_moves(self):
+        """Return if the side to move has a legal move."""
+        return self.state.get_legal_count(self) > 0
+
+    def is_checkmate(self):
+        """Check if the current position is a checkmate."""
+        return self.is_check() and not self.has_legal_moves()
+
+    def is_stalemate(self):
+        """Check if the current position is a stalemate."""
+        return not self.is_check() and not self.is_variant_end() and not self.has_legal_moves()
+
+    def is_seventyfive_moves(self):
+        """Check the seventyfive-move rule."""
+        return self.halfmove_clock >= 150 and self.has_legal_moves()
+
+    def is_fivefold_repetition(self):
+        """Check if the current position occurred the fifth time."""
+        return self.state.get_count() >= 5
+
+    def can_claim_fifty_moves(self):
+        """Check if a draw can be claimed by the fifty-move rule."""
+        return self.halfmove_clock >= 100 and self.has_legal_moves()
+
+    def can_claim_threefold_repetition(self):
+        """Check if a draw can be claimed by the current position or a legal move repeating the third time."""
+        if self.state.get_count() >= 3:
+            return True
+        if not self.state.repeated:  # no position occurred twice => no move can lead to a threefold one
+            return False
+        for move in self.generate_legal_moves():
+            self.push(move)
+            count = self.state.get_count()
+            self.pop()
+            if count >= 3:
+                return True
+        return False
+
+    def is_game_over(self, claim_draw=False):
+        """Check if the game is over (without a claim unless claim_draw is given)."""
+        if self.is_seventyfive_moves() or self.is_insufficient_material() or not self.has_legal_moves():
+            return True
+        if self.is_fivefold_repetition():
+            return True
+        return claim_draw and self.can_claim_draw()
+
+
+class GameSnapshot(object):
+
+    """An immutable game for the message payloads - it shares the move history, a real board is only built on demand."""
+
+    def __init__(self, board: GameBoard):
+        super(GameSnapshot, self).__init__()
+        self.root_position = board.root_position
+        self.root_entry = board.state.entries[0]
+        self.history = board.history
+        self.position = _capture(board)
+        self.chess960 = board.chess960
+        self.turn = board.turn
+        self.castling_rights = board.castling_rights
+        self.ep_square = board.ep_square
+        self.halfmove_clock = board.halfmove_clock
+        self.fullmove_number = board.fullmove_number
+        self._position_board = None
+        self._move_stack = None
+
+    def __repr__(self):
+        return "GameSnapshot('{}')".format(self.fen())
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self  # immutable => the per display message copies share it
+
+    def _get_position_board(self):
+        if self._position_board is None:
+            self._position_board = _restore(self.position, self.chess960)
+        return self._position_board
+
+    def _get_plies(self):
+        plies = []
+        history = self.history
+        while history:
+            plies.append(history)
+            history = history[3]
+        plies.reverse()
+        return plies
+
+    @property
+    def move_stack(self):
+        """Return the moves of the game."""
+        if self._move_stack is None:
+            self._move_stack = tuple(ply[0] for ply in self._get_plies())
+        return self._move_stack
+
+    def peek(self):
+        """Return the last move."""
+        if self.history is None:
+            raise IndexError('no moves')
+        return self.history[0]
+
+    def copy(self, stack=True):
+        """Return a real (mutable) GameBoard of the game - built out of the shared history without a replay."""
+        board = _restore(self.position, self.chess960, GameBoard)
+        if stack:
+            plies = self._get_plies()
+            board.move_stack = [ply[0] for ply in plies]
+            board.stack = [ply[1] for ply in plies]
+            board.state = GameState.from_entries([self.root_entry] + [ply[2] for ply in plies])
+            board.root_position = self.root_position
+            board.history = self.history
+        return board
+
+    def fen(self):
+        """Return the fen of the position."""
+        return self._get_position_board().fen()
+
+    def board_fen(self):
+        """Return the board part of the fen."""
+        return self._get_position_board().board_fen()
+
+    def castling_xfen(self):
+        """Return the castling part of the fen."""
+        return self._get_position_board().castling_xfen()
+
+    def chess960_pos(self):
+        """Return the chess960 start position number (None if not a start position)."""
+        return self._get_position_board().chess960_pos()
+
+    def is_check(self):
+        """Return if the side to move is in check."""
+        return self._get_position_board().is_check()
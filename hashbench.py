@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import logging
+import configargparse
+
+import chess
+
+from uci.engine import UciEngine
+
+
+def play_opening(engine: UciEngine, moves: list, depth: int):
+    """Search every position of the opening to the given depth and return the total secs."""
+    game = chess.Board()
+    engine.newgame(game.copy())
+    total = 0.0
+    for move in moves:
+        game.push(move)
+        engine.position(game.copy())
+        start = time.monotonic()
+        engine.engine.go(depth=depth)
+        total += time.monotonic() - start
+    return total
+
+
+def main():
+    """Compare the time to depth N of a repeated opening with and without keeping the engine hash."""
+    parser = configargparse.ArgParser()
+    parser.add_argument('engine', type=str, help='engine executable')
+    parser.add_argument('-d', '--depth', type=int, default=16, help='search depth of each position')
+    parser.add_argument('-o', '--opening', type=str, default='e2e4 e7e5 g1f3 b8c6 f1b5 a7a6 b5a4 g8f6 e1g1 f8e7',
+                        help='uci moves of the repeated opening')
+    parser.add_argument('-g', '--games', type=int, default=2, help='how often the opening is played')
+    parser.add_argument('-l', '--log-level', choices=['notset', 'debug', 'info', 'warning', 'error', 'critical'],
+                        default='warning', help='logging level')
+    args = parser.parse_args()
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()))
+
+    moves = [chess.Move.from_uci(move) for move in args.opening.split()]
+    for keep_hash in (False, True):
+        engine = UciEngine(args.engine, keep_hash=keep_hash)
+        engine.startup({}, show=False)
+        times = [play_opening(engine, moves, args.depth) for _ in range(args.games)]
+        engine.quit()
+        print('keep hash: {!s:5} hash file: {!s:5} secs per game: {}'.format(
+            keep_hash, engine.has_hash_file(), ' '.join('{:.2f}'.format(secs) for secs in times)))
+
+
+if __name__ == '__main__':
+    main()
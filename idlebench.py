@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import configargparse
+
+
+def get_children(pid: int):
+    """Return the child pids (engines for example) of a process."""
+    children = []
+    for task in os.listdir('/proc/{}/task'.format(pid)):
+        try:
+            with open('/proc/{}/task/{}/children'.format(pid, task)) as file:
+                children += [int(child) for child in file.read().split()]
+        except OSError:
+            pass
+    return children
+
+
+def sample(pid: int):
+    """Return the cpu ticks and context switches (= wakeups) of all threads of a process."""
+    ticks = switches = 0
+    for task in os.listdir('/proc/{}/task'.format(pid)):
+        try:
+            with open('/proc/{}/task/{}/stat'.format(pid, task)) as file:
+                fields = file.read().rsplit(')', 1)[1].split()
+            ticks += int(fields[11]) + int(fields[12])  # utime + stime
+            with open('/proc/{}/task/{}/status'.format(pid, task)) as file:
+                for line in file:
+                    if line.startswith(('voluntary_ctxt_switches', 'nonvoluntary_ctxt_switches')):
+                        switches += int(line.split()[1])
+        except (OSError, IndexError, ValueError):
+            pass  # thread ended meanwhile
+    return ticks, switches
+
+
+def main():
+    """Sample /proc to show the cpu usage and wakeups per second of picochess (and its engines)."""
+    parser = configargparse.ArgParser()
+    parser.add_argument('pid', type=int, help='process id of picochess')
+    parser.add_argument('-i', '--interval', type=float, default=10.0, help='secs per sample')
+    parser.add_argument('-n', '--samples', type=int, default=0, help='number of samples (0 = forever)')
+    parser.add_argument('-c', '--children', action='store_true', help='add the child processes (engines)')
+    args = parser.parse_args()
+
+    hertz = os.sysconf('SC_CLK_TCK')
+
+    def _sample_all():
+        pids = [args.pid] + (get_children(args.pid) if args.children else [])
+        results = [sample(pid) for pid in pids if os.path.isdir('/proc/{}'.format(pid))]
+        return sum(res[0] for res in results), sum(res[1] for res in results)
+
+    print('{:>8s} {:>8s} {:>12s}'.format('secs', 'cpu %', 'wakeups/s'))
+    start = last_time = time.monotonic()
+    last_ticks, last_switches = _sample_all()
+    count = 0
+    try:
+        while not args.samples or count < args.samples:
+            time.sleep(args.interval)
+            now = time.monotonic()
+            ticks, switches = _sample_all()
+            secs = now - last_time
+            print('{:8.0f} {:8.1f} {:12.1f}'.format(now - start, 100 * (ticks - last_ticks) / hertz / secs,
+                                                     (switches - last_switches) / secs), flush=True)
+            last_time, last_ticks, last_switches = now, ticks, switches
+            count += 1
+    except (KeyboardInterrupt, FileNotFoundError):
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import json
+import time
+import logging
+import configargparse
+
+
+def main():
+    """Convert a json lines log (log-format = json) back to the readable picochess log format."""
+    parser = configargparse.ArgParser()
+    parser.add_argument('files', nargs='*', help='json log files (default: stdin)')
+    parser.add_argument('-l', '--level', choices=['debug', 'info', 'warning', 'error', 'critical'], default='debug',
+                        help='only show this level and above')
+    parser.add_argument('-m', '--module', type=str, help='only show lines of this module')
+    parser.add_argument('-t', '--thread', action='store_true', help='show the thread name')
+    args = parser.parse_args()
+
+    min_level = getattr(logging, args.level.upper())
+    for file in [open(name) for name in args.files] or [sys.stdin]:
+        with file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    print(line, end='')  # maybe an old text log line
+                    continue
+                if getattr(logging, record['l']) < min_level or (args.module and record['m'] != args.module):
+                    continue
+                stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['t']))
+                thread = ' [{}]'.format(record['th']) if args.thread else ''
+                print('{}.{:03d} {:>7s} {:>10s}{} - {}: {}'.format(stamp, int(record['t'] * 1000) % 1000, record['l'],
+                                                                    record['m'], thread, record['f'], record['msg']))
+                if 'exc' in record:
+                    print(record['exc'])
+
+
+if __name__ == '__main__':
+    main()
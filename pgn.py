@@ -21,14 +21,6 @@ import datetime
 import logging
 import os
 import queue
-from email import encoders
-from email.mime.multipart import MIMEMultipart
-from email.mime.audio import MIMEAudio
-from email.mime.base import MIMEBase
-from email.mime.image import MIMEImage
-from email.mime.text import MIMEText
-import mimetypes
-import requests
 
 import chess
 import chess.pgn
@@ -70,6 +62,14 @@ class Emailer(object):
             # lib without encryption (SMTP-port 21)
             logging.debug('SMTP Mail delivery: Import standard SMTP Lib (no SSL encryption)')
             from smtplib import SMTP
+        # the email libs are only needed here - don't load them at startup
+        from email import encoders
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.audio import MIMEAudio
+        from email.mime.base import MIMEBase
+        from email.mime.image import MIMEImage
+        from email.mime.text import MIMEText
+        import mimetypes
         conn = False
         try:
             outer = MIMEMultipart()
@@ -118,6 +118,7 @@ class Emailer(object):
             logging.debug('SMTP Mail delivery: Ended')
 
     def _use_mailgun(self, subject, body):
+        import requests  # slow to import - only needed here
         out = requests.post('https://api.mailgun.net/v3/picochess.org/messages',
                             auth=('api', self.mailgun_key),
                             data={'from': 'Your PicoChess computer <no-reply@picochess.org>',
@@ -163,7 +164,7 @@ class PgnDisplay(DisplayMsg, threading.Thread):
 
     def _save_and_email_pgn(self, message):
         logging.debug('Saving game to [%s]', self.file_name)
-        pgn_game = chess.pgn.Game().from_board(message.game)
+        pgn_game = chess.pgn.Game().from_board(message.game.copy())
 
         # Headers
         pgn_game.headers['Event'] = 'PicoChess game'
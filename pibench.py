@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import logging
+import tempfile
+import subprocess
+import configargparse
+from ctypes import c_double
+
+from utilities import DisplayMsg
+from dgt.api import Message
+from dgt.util import ClockSide
+from dgt.pi import DgtPi
+
+
+def build_mock():
+    """Compile etc/dgtpicom_mock.c and return the library file."""
+    lib_file = os.path.join(tempfile.gettempdir(), 'dgtpicom.mock.so')
+    source = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'etc', 'dgtpicom_mock.c')
+    subprocess.check_call(['gcc', '-shared', '-fPIC', '-O2', '-o', lib_file, source])
+    return lib_file
+
+
+def measure(dgtpi: DgtPi, display: DisplayMsg, secs: float):
+    """Return the library calls, clock time messages & button messages per sec and the cpu usage in %."""
+    while not display.msg_queue.empty():
+        display.msg_queue.get()
+    calls = dgtpi.lib.dgtpicom_mock_calls()
+    cpu = time.process_time()
+    time.sleep(secs)
+    cpu = time.process_time() - cpu
+    calls = dgtpi.lib.dgtpicom_mock_calls() - calls
+    times = buttons = 0
+    while not display.msg_queue.empty():
+        message = display.msg_queue.get()
+        times += isinstance(message, Message.DGT_CLOCK_TIME)
+        buttons += isinstance(message, Message.DGT_BUTTON)
+    return calls / secs, times / secs, buttons / secs, 100 * cpu / secs
+
+
+def main():
+    """Benchmark the DgtPi i2c polling on a mocked dgtpicom library."""
+    parser = configargparse.ArgParser()
+    parser.add_argument('-s', '--secs', type=float, default=10.0, help='secs per scenario')
+    parser.add_argument('--lib', type=str, help='mock library (default: compile etc/dgtpicom_mock.c)')
+    parser.add_argument('--latency', type=int, default=300, help='usecs per library call')
+    parser.add_argument('--button-secs', type=float, default=3.0, help='secs between button presses (buttons scenario)')
+    parser.add_argument('-l', '--log-level', choices=['notset', 'debug', 'info', 'warning', 'error', 'critical'],
+                        default='warning', help='logging level')
+    args = parser.parse_args()
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()))
+
+    os.environ['DGTPICOM_MOCK_LATENCY_US'] = str(args.latency)
+    display = DisplayMsg()
+    dgtpi = DgtPi(None, lib_file=args.lib or build_mock())
+    dgtpi.set_clock(300, 300, {'i2c'})
+    dgtpi.start_clock(ClockSide.NONE, {'i2c'})
+
+    print('{:10s} {:>10s} {:>10s} {:>10s} {:>8s}'.format('scenario', 'calls/s', 'times/s', 'buttons/s', 'cpu %'))
+    for scenario in ('buttons', 'idle', 'running'):
+        if scenario == 'buttons':
+            dgtpi.lib.dgtpicom_mock_buttons(c_double(args.button_secs))
+        if scenario == 'idle':
+            dgtpi.lib.dgtpicom_mock_buttons(c_double(0))
+            time.sleep(dgtpi.button_awake)  # let the fast polling after the last button press end
+        if scenario == 'running':
+            dgtpi.start_clock(ClockSide.LEFT, {'i2c'})
+        print('{:10s} {:10.1f} {:10.1f} {:10.1f} {:8.1f}'.format(scenario, *measure(dgtpi, display, args.secs)),
+              flush=True)
+    os._exit(0)  # the DgtPi thread runs forever
+
+
+if __name__ == '__main__':
+    main()
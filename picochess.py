@@ -23,23 +23,25 @@ import threading
 import copy
 import gc
 import logging
-from logging.handlers import RotatingFileHandler
+import atexit
 import time
 import queue
 import configargparse
+from collections import deque
 
 from uci.engine import UciEngine
 from uci.read import read_engine_ini
+from uci.resources import engine_resources
+from uci.ponder import PonderPool
 import chess
 import chess.polyglot
 import chess.uci
 
 from timecontrol import TimeControl
+from gamestate import GameBoard
 from utilities import get_location, update_picochess, get_opening_books, shutdown, reboot, checkout_tag
 from utilities import Observable, DisplayMsg, version, evt_queue, write_picochess_ini, hms_time, RepeatedTimer
-from pgn import Emailer, PgnDisplay
-from server import WebServer
-from talker.picotalker import PicoTalkerDisplay
+from utilities import tracer, metrics, idle_manager, LogWriter, JsonLogFormatter
 from dispatcher import Dispatcher
 
 from dgt.api import Message, Event
@@ -67,8 +69,14 @@ class AlternativeMover:
             return set(game.legal_moves)
         return searchmoves
 
-    def book(self, bookreader, game_copy: chess.Board):
+    def book(self, bookreader, game_copy: chess.Board, prefetcher=None):
         """Get a BookMove or None from game position."""
+        if prefetcher and not self.excludemoves:  # the prefetched replies dont know about excluded moves
+            found, book_res = prefetcher.get(game_copy)
+            if found:
+                if book_res:
+                    self.add(book_res.bestmove)
+                return book_res
         try:
             choice = bookreader.weighted_choice(game_copy, self.excludemoves)
         except IndexError:
@@ -93,6 +101,137 @@ class AlternativeMover:
         self.excludemoves = set()
 
 
+class BookPrefetcher(object):
+
+    """Look up the book replies for all legal user moves while the user thinks."""
+
+    def __init__(self):
+        super(BookPrefetcher, self).__init__()
+        self.replies = {}  # zobrist hash of the position after the user move => BestMove or None (out of book)
+        self.generation = 0  # a running prefetch stops as soon as this changes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def start(self, bookreader, game: chess.Board):
+        """Start to prefetch the book replies for the user moves from game position."""
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+            self.replies = {}
+        try:
+            bookreader.find(game)
+        except IndexError:
+            logging.debug('position out of book - no prefetch')
+            return
+        threading.Thread(target=self._prefetch, args=(generation, bookreader, game.copy()), daemon=True).start()
+
+    def _prefetch(self, generation: int, bookreader, game: chess.Board):
+        for move in list(game.legal_moves):
+            game.push(move)
+            key = chess.polyglot.zobrist_hash(game)
+            try:
+                book_move = bookreader.weighted_choice(game).move()
+                game.push(book_move)
+                try:
+                    book_ponder = bookreader.weighted_choice(game).move()
+                except IndexError:
+                    book_ponder = None
+                game.pop()
+                reply = chess.uci.BestMove(book_move, book_ponder)
+            except IndexError:
+                reply = None
+            game.pop()
+            with self.lock:
+                if generation != self.generation:
+                    return
+                self.replies[key] = reply
+        logging.debug('prefetched %i book replies', len(self.replies))
+
+    def cancel(self):
+        """Stop a running prefetch and forget the replies."""
+        with self.lock:
+            self.generation += 1
+            self.replies = {}
+
+    def get(self, game: chess.Board):
+        """Return if the game position was prefetched and its BestMove (or None if out of book)."""
+        key = chess.polyglot.zobrist_hash(game)
+        with self.lock:
+            found = key in self.replies
+            reply = self.replies.get(key)
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        logging.debug('book prefetch found: %s hits: %i misses: %i', found, self.hits, self.misses)
+        return found, reply
+
+
+class MoveInference(object):
+
+    """Guess the user move out of the field updates and pre-start the engine search on it - nothing else is done."""
+
+    def __init__(self):
+        super(MoveInference, self).__init__()
+        self.guess = None  # (fen, move, time) of the move guessed out of the field updates
+        self.confirmed = None  # guessed move confirmed by the stable fen - its search isnt taken over yet
+        self.searching = False  # the engine ponders on the position after the guessed move
+
+    def infer(self, fen: str, game: chess.Board, legal_fens: list, engine, timec: TimeControl, bookreader):
+        """Guess the move if fen is a legal move position - ponder on it unless the book knows the reply."""
+        if fen not in legal_fens or (self.guess and fen == self.guess[0]):
+            return
+        if self.guess:
+            metrics.inc('picochess_move_inference_total', result='rollback')  # a piece is still sliding
+            self.cancel(engine)
+        move = list(game.legal_moves)[legal_fens.index(fen)]
+        logging.info('move [%s] inferred out of the field updates', move)
+        self.guess = (fen, move, time.monotonic())
+        game_copy = game.copy()
+        game_copy.push(move)
+        try:
+            bookreader.find(game_copy)
+            return  # think() plays the book move
+        except IndexError:
+            pass
+        if engine.is_waiting():
+            engine.position(game_copy)
+            engine.brain(timec.uci(game_copy.turn))
+            self.searching = True
+
+    def confirm(self, fen: str, engine):
+        """Compare the stable fen with the guess - keep the search for a hit, stop it otherwise."""
+        self.confirmed = None
+        if not self.guess:
+            return
+        guessed_fen, move, start = self.guess
+        self.guess = None
+        if fen == guessed_fen:
+            metrics.inc('picochess_move_inference_total', result='hit')
+            metrics.observe('picochess_move_inference_gain_seconds', time.monotonic() - start)
+            self.confirmed = move
+        else:
+            logging.info('inferred move [%s] reverted by the stable fen', move)
+            metrics.inc('picochess_move_inference_total', result='rollback')
+            self.cancel(engine)
+
+    def take(self, move: chess.Move):
+        """Return if the engine already searches after this (confirmed) user move - the search is handed over."""
+        hit = self.searching and move == self.confirmed
+        if hit:
+            self.searching = False
+        self.confirmed = None
+        return hit
+
+    def cancel(self, engine):
+        """Stop the search on the guessed move (its best move is never shown)."""
+        if self.searching:
+            engine.stop()
+            self.searching = False
+        self.confirmed = None
+
+
 def main():
     """Main function."""
     def display_ip_info():
@@ -141,6 +280,14 @@ def main():
             game_copy.pop()
         return fens
 
+    def is_engine_thinking():
+        """Return if the engine (or an extra engine it handed over the live search) thinks on the computer move."""
+        return engine.is_thinking() or ponder_pool.is_thinking()
+
+    def is_engine_waiting():
+        """Return if no engine (also no extra engine) searches."""
+        return engine.is_waiting() and not ponder_pool.is_thinking()
+
     def think(game: chess.Board, timec: TimeControl, msg: Message):
         """
         Start a new search on the current game.
@@ -149,22 +296,22 @@ def main():
         """
         DisplayMsg.show(msg)
         start_clock()
-        book_res = searchmoves.book(bookreader, game.copy())
+        book_res = searchmoves.book(bookreader, game.copy(), book_prefetcher)
         if book_res:
             Observable.fire(Event.BEST_MOVE(move=book_res.bestmove, ponder=book_res.ponder, inbook=True))
         else:
-            while not engine.is_waiting():
+            while not is_engine_waiting():
                 time.sleep(0.05)
                 logging.warning('engine is still not waiting')
-            uci_dict = timec.uci()
+            uci_dict = timec.uci(game.turn)
             uci_dict['searchmoves'] = searchmoves.all(game)
-            engine.position(copy.deepcopy(game))
+            engine.position(game.copy())
             engine.go(uci_dict)
 
     def analyse(game: chess.Board, msg: Message):
         """Start a new ponder search on the current game."""
         DisplayMsg.show(msg)
-        engine.position(copy.deepcopy(game))
+        engine.position(game.copy())
         engine.ponder()
 
     def observe(game: chess.Board, msg: Message):
@@ -176,19 +323,22 @@ def main():
         """Start a new permanent brain search on the game with pondering move made."""
         assert not done_computer_fen, 'brain() called with displayed move - fen: %s' % done_computer_fen
         if pb_move:
-            game_copy = copy.deepcopy(game)
+            game_copy = game.copy()
             game_copy.push(pb_move)
             logging.info('start permanent brain with pondering move [%s] fen: %s', pb_move, game_copy.fen())
             engine.position(game_copy)
-            engine.brain(timec.uci())
+            engine.brain(timec.uci(game_copy.turn))
+            ponder_pool.start(engine, game, pb_move, timec.uci(game_copy.turn))
         else:
             logging.info('ignore permanent brain')
 
     def stop_search_and_clock(ponder_hit=False):
         """Depending on the interaction mode stop search and clock."""
+        if not ponder_hit:
+            ponder_pool.stop()
         if interaction_mode in (Mode.NORMAL, Mode.BRAIN):
             stop_clock()
-            if engine.is_waiting():
+            if is_engine_waiting():
                 logging.info('engine already waiting')
             else:
                 if ponder_hit:
@@ -203,8 +353,9 @@ def main():
 
     def stop_search():
         """Stop current search."""
+        ponder_pool.stop()
         engine.stop()
-        while not engine.is_waiting():
+        while not is_engine_waiting():
             time.sleep(0.05)
             logging.warning('engine is still not waiting')
 
@@ -235,7 +386,7 @@ def main():
         :param play_mode:
         :return: False is the game continues, Game_Ends() Message if it has ended
         """
-        result = None
+        result = None  # GameBoard answers all these out of its game state (no move replay)
         if game.is_stalemate():
             result = GameResult.STALEMATE
         if game.is_insufficient_material():
@@ -250,7 +401,7 @@ def main():
         if result is None:
             return False
         else:
-            return Message.GAME_ENDS(result=result, play_mode=play_mode, game=game.copy())
+            return Message.GAME_ENDS(result=result, play_mode=play_mode, game=game.snapshot())
 
     def user_move(move: chess.Move, sliding: bool):
         """Handle an user move."""
@@ -266,12 +417,18 @@ def main():
             if interaction_mode == Mode.BRAIN:
                 ponder_hit = (move == pb_move)
                 logging.info('pondering move: [%s] res: Ponder%s', pb_move, 'Hit' if ponder_hit else 'Miss')
+                extra_hit = ponder_pool.check(move, pb_move)  # an extra engine pondered on the user move
+            elif interaction_mode == Mode.NORMAL and not sliding:
+                ponder_hit = move_inference.take(move)  # the engine started on the inferred move already
+                extra_hit = False
             else:
-                ponder_hit = False
-            if sliding and ponder_hit:
+                ponder_hit = extra_hit = False
+            if sliding and (ponder_hit or extra_hit):
                 logging.warning('sliding detected, turn ponderhit off')
-                ponder_hit = False
-            stop_search_and_clock(ponder_hit=ponder_hit)
+                ponder_hit = extra_hit = False
+            stop_search_and_clock(ponder_hit=ponder_hit or extra_hit)
+            if extra_hit:
+                engine.stop()  # the main engine pondered on another move
             if interaction_mode in (Mode.NORMAL, Mode.BRAIN, Mode.OBSERVE, Mode.REMOTE) and not sliding:
                 time_control.add_time(game.turn)
 
@@ -282,23 +439,27 @@ def main():
             game.push(move)
             searchmoves.reset()
             if interaction_mode in (Mode.NORMAL, Mode.BRAIN):
-                msg = Message.USER_MOVE_DONE(move=move, fen=fen, turn=turn, game=game.copy())
+                msg = Message.USER_MOVE_DONE(move=move, fen=fen, turn=turn, game=game.snapshot())
                 game_end = check_game_state(game, play_mode)
                 if game_end:
+                    ponder_pool.stop()
                     DisplayMsg.show(msg)
                     DisplayMsg.show(game_end)
                 else:
-                    if interaction_mode == Mode.NORMAL or not ponder_hit:
-                        if not check_game_state(game, play_mode):
-                            logging.info('starting think()')
-                            think(game, time_control, msg)
+                    if not (ponder_hit or extra_hit):
+                        logging.info('starting think()')
+                        think(game, time_control, msg)
                     else:
                         logging.info('think() not started cause ponderhit')
                         DisplayMsg.show(msg)
                         start_clock()
-                        engine.hit()  # finally tell the engine
+                        if ponder_hit:
+                            ponder_pool.stop()
+                            engine.hit()  # finally tell the engine
+                        else:
+                            ponder_pool.hit(move)  # the extra search goes on as the live one
             elif interaction_mode == Mode.REMOTE:
-                msg = Message.USER_MOVE_DONE(move=move, fen=fen, turn=turn, game=game.copy())
+                msg = Message.USER_MOVE_DONE(move=move, fen=fen, turn=turn, game=game.snapshot())
                 game_end = check_game_state(game, play_mode)
                 if game_end:
                     DisplayMsg.show(msg)
@@ -306,7 +467,7 @@ def main():
                 else:
                     observe(game, msg)
             elif interaction_mode == Mode.OBSERVE:
-                msg = Message.REVIEW_MOVE_DONE(move=move, fen=fen, turn=turn, game=game.copy())
+                msg = Message.REVIEW_MOVE_DONE(move=move, fen=fen, turn=turn, game=game.snapshot())
                 game_end = check_game_state(game, play_mode)
                 if game_end:
                     DisplayMsg.show(msg)
@@ -314,7 +475,7 @@ def main():
                 else:
                     observe(game, msg)
             else:  # interaction_mode in (Mode.ANALYSIS, Mode.KIBITZ, Mode.PONDER):
-                msg = Message.REVIEW_MOVE_DONE(move=move, fen=fen, turn=turn, game=game.copy())
+                msg = Message.REVIEW_MOVE_DONE(move=move, fen=fen, turn=turn, game=game.snapshot())
                 game_end = check_game_state(game, play_mode)
                 if game_end:
                     DisplayMsg.show(msg)
@@ -413,6 +574,7 @@ def main():
                 searchmoves.reset()
                 time_control.add_time(not game.turn)
                 start_clock()
+                book_prefetcher.start(bookreader, game)
                 if interaction_mode == Mode.BRAIN:
                     brain(game, time_control)
 
@@ -422,7 +584,7 @@ def main():
         # Check if this is a previous legal position and allow user to restart from this position
         else:
             handled_fen = False
-            game_copy = copy.deepcopy(game)
+            game_copy = game.copy()
             while game_copy.move_stack:
                 game_copy.pop()
                 if game_copy.board_fen() == fen:
@@ -432,13 +594,15 @@ def main():
                     stop_search_and_clock()
                     while len(game_copy.move_stack) < len(game.move_stack):
                         game.pop()
+                    time_control.set_moves_done(game)
 
                     # its a complete new pos, delete safed values
                     done_computer_fen = None
                     done_move = pb_move = chess.Move.null()
                     searchmoves.reset()
 
-                    set_wait_state(Message.TAKE_BACK(game=game.copy()))  # new: force stop no matter if picochess turn
+                    # new: force stop no matter if picochess turn
+                    set_wait_state(Message.TAKE_BACK(game=game.snapshot()))
                     break
         # doing issue #152
         logging.debug('fen: %s result: %s', fen, handled_fen)
@@ -467,7 +631,7 @@ def main():
                     text = play_mode.value  # type: str
                     DisplayMsg.show(Message.PLAY_MODE(play_mode=play_mode, play_mode_text=dgttranslate.text(text)))
         if start_search:
-            assert engine.is_waiting(), 'engine not waiting! thinking status: %s' % engine.is_thinking()
+            assert is_engine_waiting(), 'engine not waiting! thinking status: %s' % is_engine_thinking()
             # Go back to analysing or observing
             if interaction_mode == Mode.BRAIN and not done_computer_fen:
                 brain(game, time_control)
@@ -492,10 +656,33 @@ def main():
             except ValueError:
                 return 1
 
-        if len(time_list) == 1:
+        def _stages():
+            stages = []
+            inc = 0
+            for time_str in time_list:
+                if time_str.startswith('+'):
+                    inc = _num(time_str[1:])
+                elif '/' in time_str:
+                    moves, mins = time_str.split('/', 1)
+                    stages.append([_num(moves), _num(mins)])
+                else:
+                    stages.append([0, _num(time_str)])
+            return stages, inc
+
+        if any('/' in time_str for time_str in time_list):
+            stages, inc = _stages()
+            timec = TimeControl(TimeMode.STAGES, blitz=stages[0][1], fischer=inc, stages=stages)
+            textc = dgttranslate.text('B00_tc_stage', timec.get_list_text())
+        elif len(time_list) == 1:
             fixed = _num(time_list[0])
             timec = TimeControl(TimeMode.FIXED, fixed=fixed)
             textc = dgttranslate.text('B00_tc_fixed', timec.get_list_text())
+        elif len(time_list) == 2 and time_list[1].startswith('b'):
+            timec = TimeControl(TimeMode.BRONSTEIN, blitz=_num(time_list[0]), delay=_num(time_list[1][1:]))
+            textc = dgttranslate.text('B00_tc_brons', timec.get_list_text())
+        elif len(time_list) == 2 and time_list[1].startswith('d'):
+            timec = TimeControl(TimeMode.DELAY, blitz=_num(time_list[0]), delay=_num(time_list[1][1:]))
+            textc = dgttranslate.text('B00_tc_delay', timec.get_list_text())
         elif len(time_list) == 2:
             blitz = _num(time_list[0])
             fisch = _num(time_list[1])
@@ -541,17 +728,30 @@ def main():
     parser.add_argument('-erk', '--engine-remote-key', type=str, help='key file for the remote engine server')
     parser.add_argument('-erh', '--engine-remote-home', type=str, help='engine home path for the remote engine server',
                         default='/opt/picochess')
+    parser.add_argument('-ert', '--engine-remote-tcp-port', type=int,
+                        help='port of a picochess engine server (used instead of ssh)')
+    parser.add_argument('-ecr', '--engine-cpu-reserve', type=int, default=1,
+                        help='cpu cores kept free of engine threads (for web server, talker & picochess)')
+    parser.add_argument('-ems', '--engine-memory-share', type=int, default=25,
+                        help='percent of the available memory used for engine hash tables (0 = engine default)')
+    parser.add_argument('-ekh', '--engine-keep-hash', action='store_true',
+                        help='keep the engine hash between games (no ucinewgame, save/load the hash if supported)')
+    parser.add_argument('-epc', '--engine-ponder-candidates', type=int, default=0,
+                        help='in brain mode ponder on this many more user replies with extra engines (local only)')
     parser.add_argument('-d', '--dgt-port', type=str,
                         help='enable dgt board on the given serial port such as /dev/ttyUSB0')
     parser.add_argument('-b', '--book', type=str, help="path of book such as 'books/b-flank.bin'",
                         default='books/h-varied.bin')
     parser.add_argument('-t', '--time', type=str, default='5 0',
-                        help="Time settings <FixSec> or <StMin IncSec> like '10'(move) or '5 0'(game) '3 2'(fischer). \
-                        All values must be below 100")
+                        help="Time settings <FixSec> or <StMin IncSec> like '10'(move) or '5 0'(game) '3 2'(fischer) \
+                        or <StMin bSec/dSec> like '5 b3'(bronstein) '5 d3'(us delay) \
+                        or <Moves/Min ...> <Min> <+IncSec> like '40/90 30 +30' (stages). All values must be below 100")
     parser.add_argument('-norl', '--disable-revelation-leds', action='store_true', help='disable Revelation leds')
     parser.add_argument('-l', '--log-level', choices=['notset', 'debug', 'info', 'warning', 'error', 'critical'],
                         default='warning', help='logging level')
     parser.add_argument('-lf', '--log-file', type=str, help='log to the given file')
+    parser.add_argument('-lfo', '--log-format', choices=['text', 'json'], default='text',
+                        help='log file format - json lines can be read with logview.py')
     parser.add_argument('-pf', '--pgn-file', type=str, help='pgn file used to store the games', default='games.pgn')
     parser.add_argument('-pu', '--pgn-user', type=str, help='user name for the pgn file', default=None)
     parser.add_argument('-pe', '--pgn-elo', type=str, help='user elo for the pgn file', default='-')
@@ -589,16 +789,35 @@ def main():
     parser.add_argument('-noet', '--disable-et', action='store_true', help='some clocks need this to work - deprecated')
     parser.add_argument('-ss', '--slow-slide', type=int, default=0, choices=range(0, 10),
                         help='extra wait time factor for a stable board position (sliding detect)')
+    parser.add_argument('-nomi', '--disable-move-inference', action='store_true',
+                        help='dont start the engine search on a user move guessed out of the field updates')
+    parser.add_argument('-tr', '--trace-events', nargs='?', const=20000, type=int, metavar='SIZE',
+                        help='trace the latency of events (keeps SIZE hops), see /trace on the web server')
+    parser.add_argument('-iq', '--idle-quiet', type=int, default=0, metavar='MINUTES',
+                        help='stop the engine search after this many minutes without user input (0 = never)')
+    parser.add_argument('-isl', '--idle-sleep', type=int, default=0, metavar='MINUTES',
+                        help='slow down board polling and timers after this many minutes without input (0 = never)')
 
     args, unknown = parser.parse_known_args()
 
     # Enable logging
     if args.log_file:
-        handler = RotatingFileHandler('logs' + os.sep + args.log_file, maxBytes=1.4 * 1024 * 1024, backupCount=5)
-        logging.basicConfig(level=getattr(logging, args.log_level.upper()),
-                            format='%(asctime)s.%(msecs)03d %(levelname)7s %(module)10s - %(funcName)s: %(message)s',
-                            datefmt="%Y-%m-%d %H:%M:%S", handlers=[handler])
+        if args.log_format == 'json':
+            formatter = JsonLogFormatter()
+        else:
+            formatter = logging.Formatter('%(asctime)s.%(msecs)03d %(levelname)7s %(module)10s - %(funcName)s: '
+                                          '%(message)s', datefmt="%Y-%m-%d %H:%M:%S")
+        # the (sd card) file is written by a background thread, the callers only queue their records
+        log_writer = LogWriter('logs' + os.sep + args.log_file, formatter, max_bytes=int(1.4 * 1024 * 1024),
+                               backup_count=5)
+        log_writer.start()
+        atexit.register(log_writer.stop)
+        logging.basicConfig(level=getattr(logging, args.log_level.upper()), handlers=[log_writer.get_handler()])
     logging.getLogger('chess.engine').setLevel(logging.INFO)  # don't want to get so many python-chess uci messages
+    if args.trace_events:
+        tracer.hops = deque(maxlen=args.trace_events)
+        tracer.enabled = True
+    idle_manager.configure(args.idle_quiet * 60, args.idle_sleep * 60)
 
     logging.debug('#' * 20 + ' PicoChess v%s ' + '#' * 20, version)
     # log the startup parameters but hide the password fields
@@ -607,6 +826,10 @@ def main():
     logging.debug('startup parameters: %s', a_copy)
     if unknown:
         logging.warning('invalid parameter given %s', unknown)
+    # Startup is staged: board & clock first, then the engine (on its own thread) while web, pgn & talker load
+    startup_start = time.monotonic()
+    startup_stages = {}
+
     # wire some dgt classes
     dgtboard = DgtBoard(args.dgt_port, args.disable_revelation_leds, args.dgtpi, args.disable_et, args.slow_slide)
     dgttranslate = DgtTranslate(args.beep_config, args.beep_some_level, args.language, version)
@@ -619,17 +842,11 @@ def main():
     # The class dgtDisplay fires Event (Observable) & DispatchDgt (Dispatcher)
     DgtDisplay(dgttranslate, dgtmenu, time_control).start()
 
-    # Create PicoTalker for speech output
-    PicoTalkerDisplay(args.user_voice, args.computer_voice, args.speed_voice).start()
-
-    # Launch web server
-    if args.web_server_port:
-        WebServer(args.web_server_port, dgtboard).start()
-        dgtdispatcher.register('web')
-
     if args.console:
         logging.debug('starting PicoChess in console mode')
-        RepeatedTimer(1, _dgt_serial_nr).start()  # simulate the dgtboard watchdog
+        serial_nr_timer = RepeatedTimer(1, _dgt_serial_nr)  # simulate the dgtboard watchdog
+        idle_manager.add_timer(serial_nr_timer, 10)
+        serial_nr_timer.start()
     else:
         # Connect to DGT board
         logging.debug('starting PicoChess in board mode')
@@ -641,8 +858,55 @@ def main():
             dgtboard.run()  # a clock can only be online together with the board, so we must start it infront
         DgtHw(dgtboard).start()
         dgtdispatcher.register('ser')
+    if args.web_server_port:
+        dgtdispatcher.register('web')  # all devices must be known before the dispatcher runs, the web comes later
     # The class Dispatcher sends DgtApi messages at the correct (delayed) time out
     dgtdispatcher.start()
+    startup_stages['board'] = time.monotonic() - startup_start
+
+    engine_resources.configure(args.engine_cpu_reserve, args.engine_memory_share)
+    ponder_pool = PonderPool(args.engine_ponder_candidates)
+
+    def start_engine():
+        """Try the given engine first and if that fails the first/second from engines.ini."""
+        engine_file = args.engine
+        engine_tries = 0
+        while engine_tries < 2:
+            if engine_file is None:
+                eng_ini = read_engine_ini()
+                engine_file = eng_ini[engine_tries]['file']
+                engine_tries += 1
+
+            # Gentlemen, start your engines...
+            engine = UciEngine(file=engine_file, hostname=args.engine_remote_server,
+                               username=args.engine_remote_user, key_file=args.engine_remote_key,
+                               password=args.engine_remote_pass, home=args.engine_remote_home,
+                               port=args.engine_remote_tcp_port, keep_hash=args.engine_keep_hash)
+            try:
+                engine_startup['name'] = engine.get_name()
+                engine_startup['engine'] = engine
+                break
+            except AttributeError:
+                logging.error('engine %s not started', engine_file)
+                engine_file = None
+        startup_stages['engine'] = time.monotonic() - startup_start
+
+    engine_startup = {'engine': None, 'name': None}
+    engine_thread = threading.Thread(target=start_engine, name='engine_startup')
+    engine_thread.start()
+
+    # these modules are slow to import, so only load them now (and the web server only if needed)
+    from pgn import Emailer, PgnDisplay
+    from talker.picotalker import PicoTalkerDisplay
+
+    # Create PicoTalker for speech output
+    PicoTalkerDisplay(args.user_voice, args.computer_voice, args.speed_voice).start()
+
+    # Launch web server
+    if args.web_server_port:
+        from server import WebServer
+        WebServer(args.web_server_port, dgtboard).start()
+
     # Save to PGN
     emailer = Emailer(email=args.email, mailgun_key=args.mailgun_key)
     emailer.set_smtp(sserver=args.smtp_server, suser=args.smtp_user, spass=args.smtp_pass,
@@ -656,40 +920,23 @@ def main():
             user_name = args.email.split('@')[0]
         else:
             user_name = 'Player'
+    startup_stages['displays'] = time.monotonic() - startup_start
 
-    # Update
+    # Update - "git remote update" can take long, so don't let the user wait for it
     if args.enable_update:
-        update_picochess(args.dgtpi, args.enable_update_reboot, dgttranslate)
-
-    # try the given engine first and if that fails the first/second from "engines.ini" then crush
-    engine_file = args.engine
-    engine_tries = 0
-    engine = engine_name = None
-    while engine_tries < 2:
-        if engine_file is None:
-            eng_ini = read_engine_ini()
-            engine_file = eng_ini[engine_tries]['file']
-            engine_tries += 1
-
-        # Gentlemen, start your engines...
-        engine = UciEngine(file=engine_file, hostname=args.engine_remote_server, username=args.engine_remote_user,
-                           key_file=args.engine_remote_key, password=args.engine_remote_pass,
-                           home=args.engine_remote_home)
-        try:
-            engine_name = engine.get_name()
-            break
-        except AttributeError:
-            logging.error('engine %s not started', engine_file)
-            engine_file = None
+        threading.Thread(target=update_picochess, args=(args.enable_update_reboot, dgttranslate),
+                         name='update', daemon=True).start()
 
-    if engine_tries == 2:
+    engine_thread.join()
+    engine, engine_name = engine_startup['engine'], engine_startup['name']
+    if engine is None:
         time.sleep(3)
         DisplayMsg.show(Message.ENGINE_FAIL())
         time.sleep(2)
         sys.exit(-1)
 
     # Startup - internal
-    game = chess.Board()  # Create the current game
+    game = GameBoard()  # Create the current game
     legal_fens = compute_legal_fens(game.copy())  # Compute the legal FENs
     all_books = get_opening_books()
     try:
@@ -699,13 +946,17 @@ def main():
         book_index = 7
     bookreader = chess.polyglot.open_reader(all_books[book_index]['file'])
     searchmoves = AlternativeMover()
+    book_prefetcher = BookPrefetcher()
     interaction_mode = Mode.NORMAL
     play_mode = PlayMode.USER_WHITE  # @todo handle Mode.REMOTE too
 
     last_legal_fens = []
+    move_inference = MoveInference()
+    idle_stopped = False  # the engine search was stopped cause nobody played
     done_computer_fen = None
     done_move = chess.Move.null()
     game_declared = False  # User declared resignation or draw
+    update_reboot = False  # the update wants a reboot - done with the next new game
 
     args.engine_level = None if args.engine_level == 'None' else args.engine_level
     engine_opt, level_index = get_engine_level_dict(args.engine_level)
@@ -738,6 +989,9 @@ def main():
 
     pb_move = chess.Move.null()  # safes the best ponder move so far (for permanent brain use)
 
+    startup_stages['ready'] = time.monotonic() - startup_start
+    logging.info('startup done (secs) %s', ' '.join('{}: {:.2f}'.format(*stage) for stage in startup_stages.items()))
+
     # Event loop
     logging.info('evt_queue ready')
     while True:
@@ -747,10 +1001,19 @@ def main():
             pass
         else:
             logging.debug('received event from evt_queue: %s', event)
+            tracer.enter(event, 'main')
+            event_start = time.monotonic()
             if False:  # switch-case
                 pass
             elif isinstance(event, Event.FEN):
+                move_inference.confirm(event.fen, engine)
                 process_fen(event.fen)
+                move_inference.cancel(engine)  # the confirmed move wasnt played as expected
+
+            elif isinstance(event, Event.FIELD_FEN):
+                user_turn = interaction_mode == Mode.NORMAL and not is_not_user_turn(game.turn)
+                if not args.disable_move_inference and user_turn and not done_computer_fen:
+                    move_inference.infer(event.fen, game, legal_fens, engine, time_control, bookreader)
 
             elif isinstance(event, Event.KEYBOARD_MOVE):
                 move = event.move
@@ -770,6 +1033,20 @@ def main():
                                               do_speak=bool(event.options)))
                 stop_fen_timer()
 
+            elif isinstance(event, Event.NEW_ENGINE) and args.engine_keep_hash and \
+                    event.eng['file'] == engine.get_file() and not engine.needs_restart(event.options or {}):
+                # same engine & same hash size/threads => keep the running process and its hash
+                logging.debug('keeping the running engine [%s]', engine.get_file())
+                stop_search()
+                engine.startup(event.options, False)
+                searchmoves.reset()
+                msg = Message.ENGINE_READY(eng=event.eng, engine_name=engine_name, eng_text=event.eng_text,
+                                           has_levels=engine.has_levels(), has_960=engine.has_chess960(),
+                                           has_ponder=engine.has_ponder(), show_ok=event.show_ok)
+                set_wait_state(msg)
+                if interaction_mode in (Mode.NORMAL, Mode.BRAIN):  # engine isnt started/searching => stop the clock
+                    stop_clock()
+
             elif isinstance(event, Event.NEW_ENGINE):
                 old_file = engine.get_file()
                 old_options = {}
@@ -783,7 +1060,7 @@ def main():
                 if engine.quit():
                     # Load the new one and send args.
                     # Local engines only
-                    engine = UciEngine(event.eng['file'])
+                    engine = UciEngine(event.eng['file'], keep_hash=args.engine_keep_hash)
                     try:
                         engine_name = engine.get_name()
                     except AttributeError:
@@ -791,7 +1068,7 @@ def main():
                         logging.error('new engine failed to start, reverting to %s', old_file)
                         engine_fallback = True
                         event.options = old_options
-                        engine = UciEngine(old_file)
+                        engine = UciEngine(old_file, keep_hash=args.engine_keep_hash)
                         try:
                             engine_name = engine.get_name()
                         except AttributeError:
@@ -806,7 +1083,7 @@ def main():
                         logging.debug('new engine doesnt support pondering mode, reverting to %s', old_file)
                         engine_fallback = True
                         if engine.quit():
-                            engine = UciEngine(old_file)
+                            engine = UciEngine(old_file, keep_hash=args.engine_keep_hash)
                             engine.startup(old_options)
                         else:
                             logging.error('engine shutdown failure')
@@ -836,8 +1113,8 @@ def main():
                 if game.move_stack:
                     if not (game.is_game_over() or game_declared):
                         result = GameResult.ABORT
-                        DisplayMsg.show(Message.GAME_ENDS(result=result, play_mode=play_mode, game=game.copy()))
-                game = chess.Board(event.fen, uci960)
+                        DisplayMsg.show(Message.GAME_ENDS(result=result, play_mode=play_mode, game=game.snapshot()))
+                game = GameBoard(event.fen, uci960)
                 # see new_game
                 stop_search_and_clock()
                 if engine.has_chess960():
@@ -849,7 +1126,7 @@ def main():
                 time_control.reset()
                 searchmoves.reset()
                 game_declared = False
-                set_wait_state(Message.START_NEW_GAME(game=game.copy(), newgame=True))
+                set_wait_state(Message.START_NEW_GAME(game=game.snapshot(), newgame=True))
 
             elif isinstance(event, Event.NEW_GAME):
                 newgame = game.move_stack or (game.chess960_pos() != event.pos960)
@@ -859,9 +1136,12 @@ def main():
 
                     if not (game.is_game_over() or game_declared):
                         result = GameResult.ABORT
-                        DisplayMsg.show(Message.GAME_ENDS(result=result, play_mode=play_mode, game=game.copy()))
+                        DisplayMsg.show(Message.GAME_ENDS(result=result, play_mode=play_mode, game=game.snapshot()))
+                    if update_reboot:
+                        DisplayMsg.show(Message.SYSTEM_REBOOT())
+                        reboot(args.dgtpi, dev='update')
 
-                    game = chess.Board()
+                    game = GameBoard()
                     if uci960:
                         game.set_chess960_pos(event.pos960)
                     # see setup_position
@@ -870,18 +1150,24 @@ def main():
                         engine.option('UCI_Chess960', uci960)
                         engine.send()
                     engine.newgame(game.copy())
+                    ponder_pool.new_game()
                     done_computer_fen = None
                     done_move = pb_move = chess.Move.null()
                     time_control.reset()
                     searchmoves.reset()
+                    if interaction_mode in (Mode.NORMAL, Mode.BRAIN) and not is_not_user_turn(game.turn):
+                        book_prefetcher.start(bookreader, game)
                     game_declared = False
-                    set_wait_state(Message.START_NEW_GAME(game=game.copy(), newgame=newgame))
+                    set_wait_state(Message.START_NEW_GAME(game=game.snapshot(), newgame=newgame))
                 else:
                     logging.debug('no need to start a new game')
-                    DisplayMsg.show(Message.START_NEW_GAME(game=game.copy(), newgame=newgame))
+                    DisplayMsg.show(Message.START_NEW_GAME(game=game.snapshot(), newgame=newgame))
 
             elif isinstance(event, Event.PAUSE_RESUME):
-                if engine.is_thinking():
+                if ponder_pool.is_thinking():  # move now also for the extra engine doing the live search
+                    stop_clock()
+                    ponder_pool.stop(show_best=True)
+                elif engine.is_thinking():
                     stop_clock()
                     engine.stop(show_best=True)
                 elif not done_computer_fen:
@@ -902,13 +1188,14 @@ def main():
                         # set computer to move - in case the user just changed the engine
                         play_mode = PlayMode.USER_WHITE if game.turn == chess.BLACK else PlayMode.USER_BLACK
                         if not check_game_state(game, play_mode):
-                            think(game, time_control, Message.ALTERNATIVE_MOVE(game=game.copy(), play_mode=play_mode))
+                            msg = Message.ALTERNATIVE_MOVE(game=game.snapshot(), play_mode=play_mode)
+                            think(game, time_control, msg)
                     else:
                         logging.warning('wrong function call [alternative]! mode: %s', interaction_mode)
 
             elif isinstance(event, Event.SWITCH_SIDES):
                 if interaction_mode in (Mode.NORMAL, Mode.BRAIN):
-                    if not engine.is_waiting():
+                    if not is_engine_waiting():
                         stop_search_and_clock()
 
                     last_legal_fens = []
@@ -943,20 +1230,20 @@ def main():
                             legal_fens = compute_legal_fens(game.copy())
 
                     if best_move_displayed:
-                        DisplayMsg.show(Message.SWITCH_SIDES(game=game.copy(), move=move))
+                        DisplayMsg.show(Message.SWITCH_SIDES(game=game.snapshot(), move=move))
 
             elif isinstance(event, Event.DRAWRESIGN):
                 if not game_declared:  # in case user leaves kings in place while moving other pieces
                     stop_search_and_clock()
-                    DisplayMsg.show(Message.GAME_ENDS(result=event.result, play_mode=play_mode, game=game.copy()))
+                    DisplayMsg.show(Message.GAME_ENDS(result=event.result, play_mode=play_mode, game=game.snapshot()))
                     game_declared = True
                     stop_fen_timer()
 
             elif isinstance(event, Event.REMOTE_MOVE):
                 if interaction_mode == Mode.REMOTE and is_not_user_turn(game.turn):
                     stop_search_and_clock()
-                    DisplayMsg.show(Message.COMPUTER_MOVE(move=event.move, ponder=chess.Move.null(), game=game.copy(),
-                                                          wait=False))
+                    DisplayMsg.show(Message.COMPUTER_MOVE(move=event.move, ponder=chess.Move.null(),
+                                                          game=game.snapshot(), wait=False))
                     game_copy = game.copy()
                     game_copy.push(event.move)
                     done_computer_fen = game_copy.board_fen()
@@ -976,8 +1263,8 @@ def main():
                         if event.inbook:
                             DisplayMsg.show(Message.BOOK_MOVE())
                         searchmoves.add(event.move)
-                        DisplayMsg.show(Message.COMPUTER_MOVE(move=event.move, ponder=event.ponder, game=game.copy(),
-                                                              wait=event.inbook))
+                        DisplayMsg.show(Message.COMPUTER_MOVE(move=event.move, ponder=event.ponder,
+                                                              game=game.snapshot(), wait=event.inbook))
                         game_copy = game.copy()
                         game_copy.push(event.move)
                         done_computer_fen = game_copy.board_fen()
@@ -993,10 +1280,10 @@ def main():
                 else:
                     # illegal moves can occur if a pv from the engine arrives at the same time as an user move
                     if game.is_legal(event.pv[0]):
-                        DisplayMsg.show(Message.NEW_PV(pv=event.pv, mode=interaction_mode, game=game.copy()))
+                        DisplayMsg.show(Message.NEW_PV(pv=event.pv, mode=interaction_mode, game=game.snapshot()))
                     else:
                         logging.info('illegal move can not be displayed. move: %s fen: %s', event.pv[0], game.fen())
-                        logging.info('engine status: t:%s p:%s', engine.is_thinking(), engine.is_pondering())
+                        logging.info('engine status: t:%s p:%s', is_engine_thinking(), engine.is_pondering())
 
             elif isinstance(event, Event.NEW_SCORE):
                 if interaction_mode == Mode.BRAIN and engine.is_pondering():
@@ -1033,6 +1320,7 @@ def main():
             elif isinstance(event, Event.SET_OPENING_BOOK):
                 write_picochess_ini('book', event.book['file'])
                 logging.debug('changing opening book [%s]', event.book['file'])
+                book_prefetcher.cancel()
                 bookreader = chess.polyglot.open_reader(event.book['file'])
                 DisplayMsg.show(Message.OPENING_BOOK(book_text=event.book_text, show_ok=event.show_ok))
                 stop_fen_timer()
@@ -1041,12 +1329,8 @@ def main():
                 time_control.stop_internal(log=False)
                 tc_init = event.tc_init
                 time_control = TimeControl(**tc_init)
-                if time_control.mode == TimeMode.BLITZ:
-                    write_picochess_ini('time', '{:d} 0'.format(tc_init['blitz']))
-                elif time_control.mode == TimeMode.FISCHER:
-                    write_picochess_ini('time', '{:d} {:d}'.format(tc_init['blitz'], tc_init['fischer']))
-                elif time_control.mode == TimeMode.FIXED:
-                    write_picochess_ini('time', '{:d}'.format(tc_init['fixed']))
+                time_control.set_moves_done(game)  # the stages count the moves of the running game
+                write_picochess_ini('time', time_control.get_ini_text())
                 text = Message.TIME_CONTROL(time_text=event.time_text, show_ok=event.show_ok, tc_init=tc_init)
                 DisplayMsg.show(text)
                 stop_fen_timer()
@@ -1073,19 +1357,23 @@ def main():
             elif isinstance(event, Event.OUT_OF_TIME):
                 stop_search_and_clock()
                 result = GameResult.OUT_OF_TIME
-                DisplayMsg.show(Message.GAME_ENDS(result=result, play_mode=play_mode, game=game.copy()))
+                DisplayMsg.show(Message.GAME_ENDS(result=result, play_mode=play_mode, game=game.snapshot()))
 
             elif isinstance(event, Event.SHUTDOWN):
                 result = GameResult.ABORT
-                DisplayMsg.show(Message.GAME_ENDS(result=result, play_mode=play_mode, game=game.copy()))
+                DisplayMsg.show(Message.GAME_ENDS(result=result, play_mode=play_mode, game=game.snapshot()))
                 DisplayMsg.show(Message.SYSTEM_SHUTDOWN())
                 shutdown(args.dgtpi, dev=event.dev)
 
             elif isinstance(event, Event.REBOOT):
-                result = GameResult.ABORT
-                DisplayMsg.show(Message.GAME_ENDS(result=result, play_mode=play_mode, game=game.copy()))
-                DisplayMsg.show(Message.SYSTEM_REBOOT())
-                reboot(args.dgtpi, dev=event.dev)
+                if event.dev == 'update' and game.move_stack and not (game.is_game_over() or game_declared):
+                    logging.info('update done - reboot after the running game')
+                    update_reboot = True
+                else:
+                    result = GameResult.ABORT
+                    DisplayMsg.show(Message.GAME_ENDS(result=result, play_mode=play_mode, game=game.snapshot()))
+                    DisplayMsg.show(Message.SYSTEM_REBOOT())
+                    reboot(args.dgtpi, dev=event.dev)
 
             elif isinstance(event, Event.EMAIL_LOG):
                 email_logger = Emailer(email=args.email, mailgun_key=args.mailgun_key)
@@ -1104,6 +1392,21 @@ def main():
             elif isinstance(event, Event.KEYBOARD_FEN):
                 DisplayMsg.show(Message.DGT_FEN(fen=event.fen, raw=False))
 
+            elif isinstance(event, Event.IDLE):
+                if event.state == 'active':
+                    if idle_stopped and engine.is_waiting():
+                        logging.debug('restarting the engine search after idle')
+                        engine.position(game.copy())
+                        engine.ponder()
+                    idle_stopped = False
+                elif time_control.internal_running() or is_engine_thinking():
+                    idle_manager.touch('game')  # a game is running - the user is just thinking
+                elif engine.is_pondering() and \
+                        interaction_mode in (Mode.ANALYSIS, Mode.KIBITZ, Mode.PONDER, Mode.OBSERVE, Mode.REMOTE):
+                    logging.debug('stopping the engine search while idle')
+                    stop_search()
+                    idle_stopped = True
+
             elif isinstance(event, Event.EXIT_MENU):
                 DisplayMsg.show(Message.EXIT_MENU())
 
@@ -1118,6 +1421,7 @@ def main():
             else:  # Default
                 logging.warning('event not handled : [%s]', event)
 
+            metrics.observe('picochess_event_seconds', time.monotonic() - event_start, type=repr(event))
             evt_queue.task_done()
 
 
@@ -16,6 +16,7 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 import datetime
+import time
 import threading
 import logging
 from collections import OrderedDict
@@ -28,7 +29,7 @@ import tornado.wsgi
 from tornado.ioloop import IOLoop
 from tornado.websocket import WebSocketHandler
 
-from utilities import Observable, DisplayMsg, hms_time, RepeatedTimer
+from utilities import Observable, DisplayMsg, hms_time, clock_scheduler, tracer, metrics
 from web.picoweb import picoweb as pw
 
 from dgt.api import Event, Message
@@ -126,6 +127,16 @@ class EventHandler(WebSocketHandler):
         for client in cls.clients:
             client.write_message(msg)
 
+    @classmethod
+    def get_metrics(cls):
+        """Return the client count and the pending send buffer of each client."""
+        gauges = [('picochess_websocket_clients', {}, len(cls.clients))]
+        for client in cls.clients:
+            stream = client.ws_connection.stream if client.ws_connection else None
+            gauges.append(('picochess_websocket_send_buffer_bytes', {'client': client.real_ip()},
+                           getattr(stream, '_write_buffer_size', 0)))
+        return gauges
+
 
 class DGTHandler(ServerRequestHandler):
     def get(self, *args, **kwargs):
@@ -152,6 +163,22 @@ class InfoHandler(ServerRequestHandler):
                 self.write(self.shared['clock_text'])
 
 
+class TraceHandler(ServerRequestHandler):
+    def get(self, *args, **kwargs):
+        action = self.get_argument('action', 'chrome')
+        self.set_header('Content-Type', 'application/json')
+        if action == 'chrome':  # load this into chrome://tracing
+            self.write(tracer.get_chrome_trace())
+        if action == 'summary':
+            self.write(tracer.get_summary())
+
+
+class MetricsHandler(ServerRequestHandler):
+    def get(self, *args, **kwargs):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4')
+        self.write(metrics.render())
+
+
 class ChessBoardHandler(ServerRequestHandler):
     def get(self):
         self.render('web/picoweb/templates/clock.html')
@@ -171,11 +198,14 @@ class WebServer(threading.Thread):
             (r'/event', EventHandler, dict(shared=shared)),
             (r'/dgt', DGTHandler, dict(shared=shared)),
             (r'/info', InfoHandler, dict(shared=shared)),
+            (r'/trace', TraceHandler, dict(shared=shared)),
+            (r'/metrics', MetricsHandler, dict(shared=shared)),
 
             (r'/channel', ChannelHandler, dict(shared=shared)),
             (r'.*', tornado.web.FallbackHandler, {'fallback': wsgi_app})
         ])
         application.listen(port)
+        metrics.add_collector(EventHandler.get_metrics)
 
     def run(self):
         """Call by threading.Thread start() function."""
@@ -190,7 +220,10 @@ class WebVr(DgtIface):
     def __init__(self, shared, dgtboard: DgtBoard):
         super(WebVr, self).__init__(dgtboard)
         self.shared = shared
-        self.virtual_timer = None
+        self.virtual_timer = None  # handle of the next clock tick inside clock_scheduler
+        self.run_start = None  # time.monotonic() value of the clock start
+        self.run_ticks = 0
+        self.timer_lock = threading.Lock()
         self.enable_dgtpi = dgtboard.is_pi
         sub = 2 if dgtboard.is_pi else 0
         DisplayMsg.show(Message.DGT_CLOCK_VERSION(main=2, sub=sub, dev='web', text=None))
@@ -204,19 +237,31 @@ class WebVr(DgtIface):
         if 'clock_text' not in self.shared:
             self.shared['clock_text'] = {}
 
+    def _stop_timer(self):
+        with self.timer_lock:
+            if self.virtual_timer:
+                clock_scheduler.cancel(self.virtual_timer)
+                self.virtual_timer = None
+
     def _runclock(self):
+        with self.timer_lock:
+            if self.virtual_timer is None:  # stopped meanwhile
+                return
+            # ticks are scheduled on whole secs after the clock start, so late ticks dont add up
+            self.run_ticks += 1
+            self.virtual_timer = clock_scheduler.schedule_at(self.run_start + self.run_ticks + 1, self._runclock)
         if self.side_running == ClockSide.LEFT:
             time_left = self.l_time - 1
             if time_left <= 0:
                 logging.info('negative/zero time left: %s', time_left)
-                self.virtual_timer.stop()
+                self._stop_timer()
                 time_left = 0
             self.l_time = time_left
         if self.side_running == ClockSide.RIGHT:
             time_right = self.r_time - 1
             if time_right <= 0:
                 logging.info('negative/zero time right: %s', time_right)
-                self.virtual_timer.stop()
+                self._stop_timer()
                 time_right = 0
             self.r_time = time_right
         logging.info('(web) clock new time received l:%s r:%s', hms_time(self.l_time), hms_time(self.r_time))
@@ -300,8 +345,7 @@ class WebVr(DgtIface):
         if self.get_name() not in devs:
             logging.debug('ignored stopClock - devs: %s', devs)
             return True
-        if self.virtual_timer:
-            self.virtual_timer.stop()
+        self._stop_timer()
         return self._resume_clock(ClockSide.NONE)
 
     def _resume_clock(self, side: ClockSide):
@@ -313,11 +357,12 @@ class WebVr(DgtIface):
         if self.get_name() not in devs:
             logging.debug('ignored startClock - devs: %s', devs)
             return True
-        if self.virtual_timer and self.virtual_timer.is_running():
-            self.virtual_timer.stop()
+        self._stop_timer()
         if side != ClockSide.NONE:
-            self.virtual_timer = RepeatedTimer(1, self._runclock)
-            self.virtual_timer.start()
+            with self.timer_lock:
+                self.run_start = time.monotonic()
+                self.run_ticks = 0
+                self.virtual_timer = clock_scheduler.schedule_at(self.run_start + 1, self._runclock)
         self._resume_clock(side)
         self.clock_show_time = True
         self._display_time(self.l_time, self.r_time)
@@ -457,7 +502,7 @@ class WebDisplay(DisplayMsg, threading.Thread):
         if False:  # switch-case
             pass
         elif isinstance(message, Message.START_NEW_GAME):
-            pgn_str = _transfer(message.game)
+            pgn_str = _transfer(message.game.copy())
             fen = message.game.fen()
             result = {'pgn': pgn_str, 'fen': fen, 'event': 'Game', 'move': '0000', 'play': 'newgame'}
             self.shared['last_dgt_move_msg'] = result
@@ -571,7 +616,7 @@ class WebDisplay(DisplayMsg, threading.Thread):
             EventHandler.write_to_clients(result)
 
         elif isinstance(message, Message.USER_MOVE_DONE):
-            pgn_str = _transfer(message.game)
+            pgn_str = _transfer(message.game.copy())
             fen = _oldstyle_fen(message.game)
             mov = message.move.uci()
             result = {'pgn': pgn_str, 'fen': fen, 'event': 'Fen', 'move': mov, 'play': 'user'}
@@ -579,7 +624,7 @@ class WebDisplay(DisplayMsg, threading.Thread):
             EventHandler.write_to_clients(result)
 
         elif isinstance(message, Message.REVIEW_MOVE_DONE):
-            pgn_str = _transfer(message.game)
+            pgn_str = _transfer(message.game.copy())
             fen = _oldstyle_fen(message.game)
             mov = message.move.uci()
             result = {'pgn': pgn_str, 'fen': fen, 'event': 'Fen', 'move': mov, 'play': 'review'}
@@ -587,7 +632,7 @@ class WebDisplay(DisplayMsg, threading.Thread):
             EventHandler.write_to_clients(result)
 
         elif isinstance(message, Message.ALTERNATIVE_MOVE):
-            pgn_str = _transfer(message.game)
+            pgn_str = _transfer(message.game.copy())
             fen = _oldstyle_fen(message.game)
             mov = peek_uci(message.game)
             result = {'pgn': pgn_str, 'fen': fen, 'event': 'Fen', 'move': mov, 'play': 'reload'}
@@ -595,7 +640,7 @@ class WebDisplay(DisplayMsg, threading.Thread):
             EventHandler.write_to_clients(result)
 
         elif isinstance(message, Message.SWITCH_SIDES):
-            pgn_str = _transfer(message.game)
+            pgn_str = _transfer(message.game.copy())
             fen = _oldstyle_fen(message.game)
             mov = message.move.uci()
             result = {'pgn': pgn_str, 'fen': fen, 'event': 'Fen', 'move': mov, 'play': 'reload'}
@@ -603,7 +648,7 @@ class WebDisplay(DisplayMsg, threading.Thread):
             EventHandler.write_to_clients(result)
 
         elif isinstance(message, Message.TAKE_BACK):
-            pgn_str = _transfer(message.game)
+            pgn_str = _transfer(message.game.copy())
             fen = _oldstyle_fen(message.game)
             mov = peek_uci(message.game)
             result = {'pgn': pgn_str, 'fen': fen, 'event': 'Fen', 'move': mov, 'play': 'reload'}
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+import configargparse
+
+import chess
+
+from dgt.virtual import VirtualDgt
+
+
+def import_profile(stderr_file: str, top: int):
+    """Return the slowest imports (cumulative usecs) out of a "python -X importtime" output."""
+    imports = []
+    with open(stderr_file) as file:
+        for line in file:
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            self_us, cumulative_us, name = line.split(':', 1)[1].rstrip('\n').split('|')
+            if not name.startswith('  '):  # only top level imports of picochess (the others are indented)
+                imports.append((int(cumulative_us), int(self_us), name.strip()))
+    imports.sort(reverse=True)
+    return imports[:top]
+
+
+def run(args, extra: list):
+    """Start picochess on a virtual board and measure the time up to the first accepted move."""
+    board = VirtualDgt()
+    board.start()
+    stderr = tempfile.NamedTemporaryFile(prefix='importtime', delete=False)
+    command = [sys.executable, '-X', 'importtime', 'picochess.py', '--dgt-port', board.port] + extra
+    start = time.monotonic()
+    process = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), stderr=stderr,
+                               stdout=subprocess.DEVNULL)
+    result = {}
+    try:
+        while not board.stats['dumps'] and time.monotonic() - start < args.timeout:
+            time.sleep(0.01)
+        if board.stats['dumps']:
+            result['board_connected'] = time.monotonic() - start
+        # play the move as soon as the board is known - picochess accepts it once the event loop runs
+        board.play_move(chess.Board(), chess.Move.from_uci('e2e4'), lift_delay=0)
+        while not board.latency and time.monotonic() - start < args.timeout:
+            time.sleep(0.01)
+        if board.latency:
+            result['first_move_accepted'] = time.monotonic() - start
+    finally:
+        process.terminate()
+        process.wait()
+        board.stop()
+        stderr.close()
+    result['imports'] = import_profile(stderr.name, args.top)
+    os.unlink(stderr.name)
+    return result
+
+
+def main():
+    """Benchmark the picochess startup. All unknown parameters are handed over to picochess."""
+    parser = configargparse.ArgParser()
+    parser.add_argument('-r', '--runs', type=int, default=3, help='number of picochess starts')
+    parser.add_argument('-t', '--timeout', type=float, default=60.0, help='secs to wait for the first move')
+    parser.add_argument('--top', type=int, default=15, help='show the slowest imports')
+    args, extra = parser.parse_known_args()
+
+    results = [run(args, extra) for _ in range(args.runs)]
+    for name in ('board_connected', 'first_move_accepted'):
+        values = sorted(result[name] for result in results if name in result)
+        if values:
+            print('{:20s} min {:6.2f}s median {:6.2f}s max {:6.2f}s ({} of {} runs)'.format(
+                name, values[0], values[len(values) // 2], values[-1], len(values), len(results)))
+        else:
+            print('{:20s} not reached in {} runs'.format(name, len(results)))
+    print('slowest imports of the last run (cumulative / self ms):')
+    for cumulative_us, self_us, name in results[-1]['imports']:
+        print('{:8.1f} {:8.1f}  {}'.format(cumulative_us / 1000, self_us / 1000, name))
+
+
+if __name__ == '__main__':
+    main()
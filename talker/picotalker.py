@@ -104,6 +104,7 @@ class PicoTalkerDisplay(DisplayMsg, threading.Thread):
         self.speed_factor = (90 + (speed_factor % 10) * 5) / 100
         self.play_mode = PlayMode.USER_WHITE
         self.low_time = False
+        self.previous_move = chess.Move.null()  # Ignore repeated broadcasts of a move
 
         if user_voice:
             logging.debug('creating user voice: [%s]', str(user_voice))
@@ -145,152 +146,153 @@ class PicoTalkerDisplay(DisplayMsg, threading.Thread):
             if self.user_picotalker:
                 self.user_picotalker.talk(sounds)
 
+    def _process_message(self, message):
+        if False:  # switch-case
+            pass
+        elif isinstance(message, Message.ENGINE_FAIL):
+            logging.debug('announcing ENGINE_FAIL')
+            self.talk(['error.ogg'])
+
+        elif isinstance(message, Message.START_NEW_GAME):
+            if message.newgame:
+                logging.debug('announcing START_NEW_GAME')
+                self.talk(['newgame.ogg'])
+
+        elif isinstance(message, Message.COMPUTER_MOVE):
+            if message.move and message.game and message.move != self.previous_move:
+                logging.debug('announcing COMPUTER_MOVE [%s]', message.move)
+                game_copy = message.game.copy()
+                game_copy.push(message.move)
+                self.talk(self.say_last_move(game_copy), self.COMPUTER)
+                self.previous_move = message.move
+
+        elif isinstance(message, Message.USER_MOVE_DONE):
+            if message.move and message.game and message.move != self.previous_move:
+                logging.debug('announcing USER_MOVE_DONE [%s]', message.move)
+                self.talk(self.say_last_move(message.game.copy()), self.USER)
+                self.previous_move = message.move
+
+        elif isinstance(message, Message.REVIEW_MOVE_DONE):
+            if message.move and message.game and message.move != self.previous_move:
+                logging.debug('announcing REVIEW_MOVE_DONE [%s]', message.move)
+                self.talk(self.say_last_move(message.game.copy()), self.USER)
+                self.previous_move = message.move
+
+        elif isinstance(message, Message.GAME_ENDS):
+            if message.result == GameResult.OUT_OF_TIME:
+                logging.debug('announcing GAME_ENDS/TIME_CONTROL')
+                wins = 'whitewins.ogg' if message.game.turn == chess.BLACK else 'blackwins.ogg'
+                self.talk(['timelost.ogg', wins])
+            elif message.result == GameResult.INSUFFICIENT_MATERIAL:
+                logging.debug('announcing GAME_ENDS/INSUFFICIENT_MATERIAL')
+                self.talk(['material.ogg', 'draw.ogg'])
+            elif message.result == GameResult.MATE:
+                logging.debug('announcing GAME_ENDS/MATE')
+                self.talk(['checkmate.ogg'])
+            elif message.result == GameResult.STALEMATE:
+                logging.debug('announcing GAME_ENDS/STALEMATE')
+                self.talk(['stalemate.ogg'])
+            elif message.result == GameResult.ABORT:
+                logging.debug('announcing GAME_ENDS/ABORT')
+                self.talk(['abort.ogg'])
+            elif message.result == GameResult.DRAW:
+                logging.debug('announcing GAME_ENDS/DRAW')
+                self.talk(['draw.ogg'])
+            elif message.result == GameResult.WIN_WHITE:
+                logging.debug('announcing GAME_ENDS/WHITE_WIN')
+                self.talk(['whitewins.ogg'])
+            elif message.result == GameResult.WIN_BLACK:
+                logging.debug('announcing GAME_ENDS/BLACK_WIN')
+                self.talk(['blackwins.ogg'])
+            elif message.result == GameResult.FIVEFOLD_REPETITION:
+                logging.debug('announcing GAME_ENDS/FIVEFOLD_REPETITION')
+                self.talk(['repetition.ogg', 'draw.ogg'])
+
+        elif isinstance(message, Message.TAKE_BACK):
+            logging.debug('announcing TAKE_BACK')
+            self.talk(['takeback.ogg'])
+
+        elif isinstance(message, Message.TIME_CONTROL):
+            logging.debug('announcing TIME_CONTROL')
+            self.talk(['oktime.ogg'])
+
+        elif isinstance(message, Message.INTERACTION_MODE):
+            logging.debug('announcing INTERACTION_MODE')
+            self.talk(['okmode.ogg'])
+
+        elif isinstance(message, Message.LEVEL):
+            if message.do_speak:
+                logging.debug('announcing LEVEL')
+                self.talk(['oklevel.ogg'])
+            else:
+                logging.debug('dont announce LEVEL cause its also an engine message')
+
+        elif isinstance(message, Message.OPENING_BOOK):
+            logging.debug('announcing OPENING_BOOK')
+            self.talk(['okbook.ogg'])
+
+        elif isinstance(message, Message.ENGINE_READY):
+            logging.debug('announcing ENGINE_READY')
+            self.talk(['okengine.ogg'])
+
+        elif isinstance(message, Message.PLAY_MODE):
+            logging.debug('announcing PLAY_MODE')
+            self.play_mode = message.play_mode
+            userplay = 'userblack.ogg' if message.play_mode == PlayMode.USER_BLACK else 'userwhite.ogg'
+            self.talk([userplay])
+
+        elif isinstance(message, Message.STARTUP_INFO):
+            self.play_mode = message.info['play_mode']
+            logging.debug('announcing PICOCHESS')
+            self.talk(['picoChess.ogg'])
+
+        elif isinstance(message, Message.CLOCK_TIME):
+            time_u = message.time_white
+            time_c = message.time_black
+            if self.play_mode == PlayMode.USER_BLACK:
+                time_u, time_c = time_c, time_u
+            self.low_time = time_u < 60
+            if self.low_time:
+                logging.debug('time too low, disable voice - u: %i, c: %i', time_u, time_c)
+
+        elif isinstance(message, Message.ALTERNATIVE_MOVE):
+            self.play_mode = message.play_mode
+
+        elif isinstance(message, Message.SYSTEM_SHUTDOWN):
+            logging.debug('announcing SHUTDOWN')
+            self.talk(['goodbye.ogg'])
+
+        elif isinstance(message, Message.SYSTEM_REBOOT):
+            logging.debug('announcing REBOOT')
+            self.talk(['pleasewait.ogg'])
+
+        elif isinstance(message, Message.SET_VOICE):
+            self.speed_factor = (90 + (message.speed % 10) * 5) / 100
+            picotalker = PicoTalker(message.lang + ':' + message.speaker, self.speed_factor)
+            if message.type == Voice.USER:
+                self.set_user(picotalker)
+            if message.type == Voice.COMP:
+                self.set_computer(picotalker)
+            if message.type == Voice.SPEED:
+                self.set_factor(self.speed_factor)
+
+        else:  # Default
+            pass
+
     def run(self):
         """Start listening for Messages on our queue and generate speech as appropriate."""
-        previous_move = chess.Move.null()  # Ignore repeated broadcasts of a move
         logging.info('msg_queue ready')
         while True:
+            # Check if we have something to say
             try:
-                # Check if we have something to say
                 message = self.msg_queue.get()
-
-                if False:  # switch-case
-                    pass
-                elif isinstance(message, Message.ENGINE_FAIL):
-                    logging.debug('announcing ENGINE_FAIL')
-                    self.talk(['error.ogg'])
-
-                elif isinstance(message, Message.START_NEW_GAME):
-                    if message.newgame:
-                        logging.debug('announcing START_NEW_GAME')
-                        self.talk(['newgame.ogg'])
-
-                elif isinstance(message, Message.COMPUTER_MOVE):
-                    if message.move and message.game and message.move != previous_move:
-                        logging.debug('announcing COMPUTER_MOVE [%s]', message.move)
-                        game_copy = message.game.copy()
-                        game_copy.push(message.move)
-                        self.talk(self.say_last_move(game_copy), self.COMPUTER)
-                        previous_move = message.move
-
-                elif isinstance(message, Message.USER_MOVE_DONE):
-                    if message.move and message.game and message.move != previous_move:
-                        logging.debug('announcing USER_MOVE_DONE [%s]', message.move)
-                        self.talk(self.say_last_move(message.game), self.USER)
-                        previous_move = message.move
-
-                elif isinstance(message, Message.REVIEW_MOVE_DONE):
-                    if message.move and message.game and message.move != previous_move:
-                        logging.debug('announcing REVIEW_MOVE_DONE [%s]', message.move)
-                        self.talk(self.say_last_move(message.game), self.USER)
-                        previous_move = message.move
-
-                elif isinstance(message, Message.GAME_ENDS):
-                    if message.result == GameResult.OUT_OF_TIME:
-                        logging.debug('announcing GAME_ENDS/TIME_CONTROL')
-                        wins = 'whitewins.ogg' if message.game.turn == chess.BLACK else 'blackwins.ogg'
-                        self.talk(['timelost.ogg', wins])
-                    elif message.result == GameResult.INSUFFICIENT_MATERIAL:
-                        logging.debug('announcing GAME_ENDS/INSUFFICIENT_MATERIAL')
-                        self.talk(['material.ogg', 'draw.ogg'])
-                    elif message.result == GameResult.MATE:
-                        logging.debug('announcing GAME_ENDS/MATE')
-                        self.talk(['checkmate.ogg'])
-                    elif message.result == GameResult.STALEMATE:
-                        logging.debug('announcing GAME_ENDS/STALEMATE')
-                        self.talk(['stalemate.ogg'])
-                    elif message.result == GameResult.ABORT:
-                        logging.debug('announcing GAME_ENDS/ABORT')
-                        self.talk(['abort.ogg'])
-                    elif message.result == GameResult.DRAW:
-                        logging.debug('announcing GAME_ENDS/DRAW')
-                        self.talk(['draw.ogg'])
-                    elif message.result == GameResult.WIN_WHITE:
-                        logging.debug('announcing GAME_ENDS/WHITE_WIN')
-                        self.talk(['whitewins.ogg'])
-                    elif message.result == GameResult.WIN_BLACK:
-                        logging.debug('announcing GAME_ENDS/BLACK_WIN')
-                        self.talk(['blackwins.ogg'])
-                    elif message.result == GameResult.FIVEFOLD_REPETITION:
-                        logging.debug('announcing GAME_ENDS/FIVEFOLD_REPETITION')
-                        self.talk(['repetition.ogg', 'draw.ogg'])
-
-                elif isinstance(message, Message.TAKE_BACK):
-                    logging.debug('announcing TAKE_BACK')
-                    self.talk(['takeback.ogg'])
-
-                elif isinstance(message, Message.TIME_CONTROL):
-                    logging.debug('announcing TIME_CONTROL')
-                    self.talk(['oktime.ogg'])
-
-                elif isinstance(message, Message.INTERACTION_MODE):
-                    logging.debug('announcing INTERACTION_MODE')
-                    self.talk(['okmode.ogg'])
-
-                elif isinstance(message, Message.LEVEL):
-                    if message.do_speak:
-                        logging.debug('announcing LEVEL')
-                        self.talk(['oklevel.ogg'])
-                    else:
-                        logging.debug('dont announce LEVEL cause its also an engine message')
-
-                elif isinstance(message, Message.OPENING_BOOK):
-                    logging.debug('announcing OPENING_BOOK')
-                    self.talk(['okbook.ogg'])
-
-                elif isinstance(message, Message.ENGINE_READY):
-                    logging.debug('announcing ENGINE_READY')
-                    self.talk(['okengine.ogg'])
-
-                elif isinstance(message, Message.PLAY_MODE):
-                    logging.debug('announcing PLAY_MODE')
-                    self.play_mode = message.play_mode
-                    userplay = 'userblack.ogg' if message.play_mode == PlayMode.USER_BLACK else 'userwhite.ogg'
-                    self.talk([userplay])
-
-                elif isinstance(message, Message.STARTUP_INFO):
-                    self.play_mode = message.info['play_mode']
-                    logging.debug('announcing PICOCHESS')
-                    self.talk(['picoChess.ogg'])
-
-                elif isinstance(message, Message.CLOCK_TIME):
-                    time_u = message.time_white
-                    time_c = message.time_black
-                    if self.play_mode == PlayMode.USER_BLACK:
-                        time_u, time_c = time_c, time_u
-                    self.low_time = time_u < 60
-                    if self.low_time:
-                        logging.debug('time too low, disable voice - u: %i, c: %i', time_u, time_c)
-
-                elif isinstance(message, Message.ALTERNATIVE_MOVE):
-                    self.play_mode = message.play_mode
-
-                elif isinstance(message, Message.SYSTEM_SHUTDOWN):
-                    logging.debug('announcing SHUTDOWN')
-                    self.talk(['goodbye.ogg'])
-
-                elif isinstance(message, Message.SYSTEM_REBOOT):
-                    logging.debug('announcing REBOOT')
-                    self.talk(['pleasewait.ogg'])
-
-                elif isinstance(message, Message.SET_VOICE):
-                    self.speed_factor = (90 + (message.speed % 10) * 5) / 100
-                    picotalker = PicoTalker(message.lang + ':' + message.speaker, self.speed_factor)
-                    if message.type == Voice.USER:
-                        self.set_user(picotalker)
-                    if message.type == Voice.COMP:
-                        self.set_computer(picotalker)
-                    if message.type == Voice.SPEED:
-                        self.set_factor(self.speed_factor)
-
-                else:  # Default
-                    pass
+                self._process_message(message)
             except queue.Empty:
                 pass
 
     @staticmethod
     def say_last_move(game: chess.Board):
-        """Take a chess.BitBoard instance and speaks the last move from it."""
+        """Take a (mutable) chess.Board instance and speaks the last move from it."""
         move_parts = {
             'K': 'king.ogg',
             'B': 'bishop.ogg',
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# A scripted uci engine for the tests: it answers at once (or on stop/ponderhit for infinite & ponder searches)
+# with the first legal moves of the position. Each received command is appended to the file $FAKE_ENGINE_LOG.
+
+import os
+import sys
+
+import chess
+
+OPTIONS = ['option name Hash type spin default 16 min 1 max 1024',
+           'option name MultiPV type spin default 1 min 1 max 10',
+           'option name Skill Level type spin default 20 min 0 max 20',
+           'option name Ponder type check default false']
+
+
+def _send(*lines):
+    for line in lines:
+        sys.stdout.write(line + '\n')
+    sys.stdout.flush()
+
+
+def _position(tokens: list):
+    board = chess.Board() if tokens[1] == 'startpos' else chess.Board(' '.join(tokens[2:8]))
+    if 'moves' in tokens:
+        for move in tokens[tokens.index('moves') + 1:]:
+            board.push_uci(move)
+    return board
+
+
+def _bestmove(board: chess.Board, multipv: int):
+    moves = sorted(move.uci() for move in board.legal_moves)
+    for number, move in enumerate(moves[:multipv]):
+        _send('info depth 5 multipv {} score cp {} nodes 1000 pv {}'.format(number + 1, 20 - number, move))
+    if not moves:
+        _send('bestmove (none)')
+        return
+    board = board.copy()
+    board.push_uci(moves[0])
+    replies = sorted(move.uci() for move in board.legal_moves)
+    _send('bestmove {} ponder {}'.format(moves[0], replies[0]) if replies else 'bestmove ' + moves[0])
+
+
+def main():
+    """Read the uci commands from stdin."""
+    log_file = os.environ.get('FAKE_ENGINE_LOG')
+    board = chess.Board()
+    multipv = 1
+    waiting = None  # the tokens of a running infinite or ponder search
+    for line in sys.stdin:
+        if log_file:
+            with open(log_file, 'a') as file:
+                file.write(line)
+        tokens = line.split()
+        if not tokens:
+            continue
+        if tokens[0] == 'uci':
+            _send('id name FakeEngine', 'id author picochess')
+            _send(*OPTIONS)
+            _send('uciok')
+        elif tokens[0] == 'isready':
+            _send('readyok')
+        elif tokens[0] == 'setoption' and line.split(' value ')[0].strip().endswith('MultiPV'):
+            multipv = int(tokens[-1])
+        elif tokens[0] == 'position':
+            board = _position(tokens)
+        elif tokens[0] == 'go':
+            if 'infinite' in tokens or 'ponder' in tokens:
+                waiting = tokens
+            else:
+                _bestmove(board, multipv)
+        elif tokens[0] == 'ponderhit' and waiting:
+            if 'nodes' in waiting or 'depth' in waiting:  # a limited search ends after the ponderhit
+                waiting = None
+                _bestmove(board, multipv)
+            else:
+                waiting = ['go', 'infinite']
+        elif tokens[0] == 'stop' and waiting:
+            waiting = None
+            _bestmove(board, multipv)
+        elif tokens[0] == 'quit':
+            break
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import chess
+import pytest
+
+import dispatcher
+import utilities
+from dispatcher import Dispatcher
+from dgt.api import Dgt, DgtApi
+from dgt.menu import DgtMenu
+from dgt.translate import DgtTranslate
+from dgt.util import ClockSide
+from utilities import DisplayDgt, DispatchDgt, dgtdisplay_devices
+
+START = 1000.0
+
+
+class FakeTime(object):
+
+    """A time.monotonic() only moved by the test."""
+
+    def __init__(self):
+        self.now = START
+
+    def monotonic(self):
+        return self.now
+
+
+class FakeClock(DisplayDgt):
+
+    """A clock device recording the (secs, command) it gets shown."""
+
+    def __init__(self, name: str, fake_time: FakeTime):
+        super(FakeClock, self).__init__()
+        self.name = name
+        self.fake_time = fake_time
+        self.dgt_queue = self
+        self.shown = []
+
+    def get_name(self):
+        return self.name
+
+    def put(self, message):
+        self.shown.append((round(self.fake_time.now - START, 3), message))
+
+
+@pytest.fixture
+def fake_time(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(dispatcher, 'time', fake)
+    yield fake
+    del dgtdisplay_devices[:]
+
+
+def _create(fake_time, dev: str):
+    dgttranslate = DgtTranslate('none', 0, 'en', 'test')
+    dgtdispatcher = Dispatcher(DgtMenu(False, 3, 0, False, None, dgttranslate))
+    dgtdispatcher.register(dev)
+    dgtdispatcher.clock_connected[dev] = True
+    return dgtdispatcher, FakeClock(dev, fake_time)
+
+
+def _advance(dgtdispatcher, fake_time, until: float):
+    """Let the time run like the dispatcher loop does - it wakes up at each deadline."""
+    while True:
+        deadline = dgtdispatcher._get_next_deadline()
+        if deadline is None or deadline > until:
+            break
+        fake_time.now = max(fake_time.now, deadline)
+        dgtdispatcher._process_deadlines(fake_time.now)
+    fake_time.now = max(fake_time.now, until)
+
+
+def _run(dgtdispatcher, fake_time, events: list):
+    """Dispatch the (secs, command) events in time order and run until nothing waits anymore."""
+    for secs, command in sorted(events, key=lambda event: event[0]):
+        _advance(dgtdispatcher, fake_time, START + secs)
+        dgtdispatcher._dispatch(command, fake_time.now)
+    _advance(dgtdispatcher, fake_time, START + 3600)
+
+
+def _info_text(number: int, dev: str):
+    return Dgt.DISPLAY_TEXT(l='{:3d} 0.{:02d}'.format(number, number % 100), m=str(number), s=str(number),
+                            beep=False, maxtime=1, wait=False, devs={dev}, info=True)
+
+
+def _move(dev: str):
+    return Dgt.DISPLAY_MOVE(move=chess.Move.from_uci('e7e5'), fen=chess.STARTING_FEN, side=ClockSide.RIGHT,
+                            wait=False, maxtime=0, beep=False, devs={dev}, uci960=False, lang='en', capital=False)
+
+
+def _load(dev: str):
+    """20 info texts/sec for 3 secs, a clock stop or start every 0.75 secs and a silent computer move."""
+    events = [(number * 0.05, _info_text(number, dev)) for number in range(60)]
+    for number, secs in enumerate((0.375, 1.125, 1.875, 2.625)):
+        if number % 2:
+            command = Dgt.CLOCK_START(side=ClockSide.LEFT, wait=True, devs={dev})
+        else:
+            command = Dgt.CLOCK_STOP(wait=True, devs={dev})
+        events.append((secs, command))
+    events.append((1.5, _move(dev)))
+    return events
+
+
+def _of_type(shown: list, *types):
+    return [(secs, command) for secs, command in shown if repr(command) in types]
+
+
+@pytest.mark.parametrize('dev, texts_shown', [('ser', 2), ('i2c', 2), ('web', 60)])
+def test_load(fake_time, dev, texts_shown):
+    dgtdispatcher, clock = _create(fake_time, dev)
+    events = _load(dev)
+    _run(dgtdispatcher, fake_time, events)
+
+    # no clock start/stop is dropped or reordered
+    sent = [repr(command) for _, command in _of_type(events, DgtApi.CLOCK_START, DgtApi.CLOCK_STOP)]
+    shown = [repr(command) for _, command in _of_type(clock.shown, DgtApi.CLOCK_START, DgtApi.CLOCK_STOP)]
+    assert shown == sent
+    metric = dgtdispatcher.get_metrics()[dev]
+    assert metric['clock_in'] == metric['clock_out'] == 4
+
+    # the computer move is shown at once
+    assert [secs for secs, _ in _of_type(clock.shown, DgtApi.DISPLAY_MOVE)] == [1.5]
+
+    # ser/i2c: 60 texts => 2 shown (the rest coalesced or replaced by the clock commands), web: not governed
+    texts = _of_type(clock.shown, DgtApi.DISPLAY_TEXT)
+    assert len(texts) == texts_shown
+    assert metric['coalesced'] == 60 - texts_shown
+    if texts_shown < 60:
+        assert all(later - former >= 0.3 for (former, _), (later, _) in zip(texts, texts[1:]))
+    # the last text is never lost (a clock command or the move would replace it)
+    assert texts[-1][1].m == '59'
+
+
+def test_move_not_governed(fake_time):
+    dgtdispatcher, clock = _create(fake_time, 'ser')
+    _run(dgtdispatcher, fake_time, [(0.0, _move('ser'))])
+    assert [secs for secs, _ in _of_type(clock.shown, DgtApi.DISPLAY_MOVE)] == [0.0]
+    assert not dgtdispatcher.pending['ser']
+
+
+def test_clock_commands_kept_behind_maxtime(fake_time):
+    dgtdispatcher, clock = _create(fake_time, 'ser')
+    events = [
+        (0.0, Dgt.DISPLAY_TEXT(l='menu', m='menu', s='menu', beep=False, maxtime=2, wait=False, devs={'ser'})),
+        (0.1, Dgt.CLOCK_STOP(wait=True, devs={'ser'})),
+        (0.2, Dgt.CLOCK_START(side=ClockSide.RIGHT, wait=True, devs={'ser'})),
+        (0.3, Dgt.DISPLAY_TEXT(l='other', m='other', s='other', beep=False, maxtime=1, wait=False, devs={'ser'})),
+    ]
+    _run(dgtdispatcher, fake_time, events)
+    shown = _of_type(clock.shown, DgtApi.CLOCK_START, DgtApi.CLOCK_STOP)
+    assert [(secs, repr(command)) for secs, command in shown] == [(0.3, DgtApi.CLOCK_STOP), (0.3, DgtApi.CLOCK_START)]
+
+
+def test_time_to_display_from_fire(fake_time, monkeypatch):
+    monkeypatch.setattr(utilities, 'time', fake_time)
+    dgtdispatcher, clock = _create(fake_time, 'ser')
+    DispatchDgt.fire(_move('ser'))
+    fake_time.now += 0.5  # the command waits inside dispatch_queue
+    dgtdispatcher._step()
+    assert len(clock.shown) == 1
+    assert dgtdispatcher.get_metrics()['ser']['ttd_max'] == pytest.approx(0.5)
@@ -0,0 +1,112 @@
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+import chess
+
+from gamestate import GameBoard, GameSnapshot
+from timecontrol import TimeControl
+from dgt.api import Message
+from dgt.util import GameResult, PlayMode, Mode, TimeMode
+from dgt.translate import DgtTranslate
+from dgt.menu import DgtMenu
+from dgt.display import DgtDisplay
+from talker.picotalker import PicoTalkerDisplay
+from pgn import PgnDisplay, Emailer
+from utilities import msgdisplay_devices
+
+
+def _game(moves: str):
+    game = GameBoard()
+    for move in moves.split():
+        game.push_uci(move)
+    return game
+
+
+def _game_messages():
+    """Return all messages carrying a game (as sent by picochess.py) - with a check and a mate among them."""
+    game = _game('e2e4 e7e5 f1c4 b8c6 d1h5 g8f6')
+    mate = chess.Move.from_uci('h5f7')
+    played = game.copy()
+    played.push(mate)
+    check = _game('e2e4 f7f6 d1h5')
+    return [
+        Message.START_NEW_GAME(game=_game('').snapshot(), newgame=True),
+        Message.COMPUTER_MOVE(move=mate, ponder=None, game=game.snapshot(), wait=False),
+        Message.USER_MOVE_DONE(move=mate, fen=played.fen(), turn=played.turn, game=played.snapshot()),
+        Message.USER_MOVE_DONE(move=check.peek(), fen=check.fen(), turn=check.turn, game=check.snapshot()),
+        Message.REVIEW_MOVE_DONE(move=mate, fen=played.fen(), turn=played.turn, game=played.snapshot()),
+        Message.NEW_PV(pv=[mate], mode=Mode.NORMAL, game=game.snapshot()),
+        Message.ALTERNATIVE_MOVE(game=game.snapshot(), play_mode=PlayMode.USER_WHITE),
+        Message.SWITCH_SIDES(game=game.snapshot(), move=mate),
+        Message.TAKE_BACK(game=game.snapshot()),
+        Message.GAME_ENDS(result=GameResult.MATE, play_mode=PlayMode.USER_WHITE, game=played.snapshot()),
+        Message.GAME_ENDS(result=GameResult.OUT_OF_TIME, play_mode=PlayMode.USER_WHITE, game=game.snapshot()),
+    ]
+
+
+def _dgt_display():
+    dgttranslate = DgtTranslate('none', 0, 'en', 'test')
+    dgtmenu = DgtMenu(False, 3, 0, False, None, dgttranslate)
+    return DgtDisplay(dgttranslate, dgtmenu, TimeControl(TimeMode.BLITZ, blitz=5))
+
+
+def _talker_display():
+    display = PicoTalkerDisplay(None, None, 0)
+    display.spoken = []
+    display.talk = lambda sounds, dev=PicoTalkerDisplay.SYSTEM: display.spoken.append(sounds)
+    return display
+
+
+def _pgn_display(tmp_path):
+    return PgnDisplay(str(tmp_path / 'games.pgn'), Emailer())
+
+
+def _web_display(tmp_path):
+    server = pytest.importorskip('server')
+    return server.WebDisplay({})
+
+
+@pytest.fixture(autouse=True)
+def _unregister_displays():
+    yield
+    del msgdisplay_devices[:]
+
+
+@pytest.mark.parametrize('create', [_dgt_display, _talker_display, _pgn_display, _web_display])
+def test_game_messages(create, tmp_path):
+    display = create(tmp_path) if create in (_pgn_display, _web_display) else create()
+    process = display.task if hasattr(display, 'task') else display._process_message
+    for message in _game_messages():
+        assert isinstance(message.game, GameSnapshot)
+        process(message)
+
+
+def test_talker_says_mate_and_check():
+    display = _talker_display()
+    for message in _game_messages():
+        display._process_message(message)
+    said = [sound for sounds in display.spoken for sound in sounds]
+    assert 'checkmate.ogg' in said
+    assert 'check.ogg' in said
+
+
+def test_pgn_written(tmp_path):
+    display = _pgn_display(tmp_path)
+    for message in _game_messages():
+        display._process_message(message)
+    assert '4. Qxf7#' in (tmp_path / 'games.pgn').read_text()
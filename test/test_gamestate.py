@@ -0,0 +1,171 @@
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import random
+
+import chess
+import pytest
+
+from gamestate import GameBoard
+
+SHUFFLE = 'g1f3 g8f6 f3g1 f6g8'
+
+
+def _occurrences(board: chess.Board):
+    """Return how often the current position occurred in the game - replayed on a plain chess.Board."""
+    replay = board.copy()
+    while replay.move_stack:
+        replay.pop()
+    keys = [replay._transposition_key()]
+    for move in board.move_stack:
+        replay.push(move)
+        keys.append(replay._transposition_key())
+    return keys.count(keys[-1])
+
+
+def _check(game: GameBoard, board: chess.Board):
+    """Compare the incremental answers of the game with python-chess (fivefold: all occurrences count)."""
+    assert game.fen() == board.fen()
+    assert game.state.get_count() == _occurrences(board)
+    assert game.state.repeated == sum(1 for count in game.state.counts.values() if count > 1)
+    assert game.is_checkmate() == board.is_checkmate()
+    assert game.is_stalemate() == board.is_stalemate()
+    assert game.can_claim_fifty_moves() == board.can_claim_fifty_moves()
+    assert game.is_seventyfive_moves() == board.is_seventyfive_moves()
+    assert game.can_claim_threefold_repetition() == board.can_claim_threefold_repetition()
+    assert game.is_fivefold_repetition() == (_occurrences(board) >= 5)
+    assert game.is_game_over() == (board.is_game_over() or _occurrences(board) >= 5)
+
+
+def _play(game: GameBoard, board: chess.Board, moves: str):
+    for uci in moves.split():
+        move = chess.Move.from_uci(uci)
+        game.push(move)
+        board.push(move)
+        _check(game, board)
+
+
+def _boards(fen=chess.STARTING_FEN, chess960=False):
+    game, board = GameBoard(fen, chess960), chess.Board(fen, chess960)
+    _check(game, board)
+    return game, board
+
+
+@pytest.mark.parametrize('fen, chess960', [
+    (chess.STARTING_FEN, False),
+    ('r3k2r/pppq1ppp/2n2n2/3pp3/3PP3/2N2N2/PPPQ1PPP/R3K2R w KQkq - 0 8', False),  # castling both sides
+    ('4k3/pp4pp/8/2pP4/8/8/PP4PP/4K3 w - c6 0 30', False),  # legal en passant
+    (chess.Board.from_chess960_pos(100).fen(), True),
+])
+def test_random_games(fen, chess960):
+    """Random push/pop/copy walks - mostly quiet piece moves, so positions repeat."""
+    rand = random.Random(fen)
+    for _ in range(6):
+        game, board = _boards(fen, chess960)
+        for _ in range(120):
+            action = rand.random()
+            if action < 0.1 and board.move_stack:
+                assert game.pop() == board.pop()
+            elif action < 0.15:
+                game = game.copy()
+            elif action < 0.2:
+                game = game.snapshot().copy()
+            else:
+                moves = list(board.legal_moves)
+                if not moves:
+                    break
+                quiet = [move for move in moves if not board.is_capture(move) and
+                         board.piece_type_at(move.from_square) in (chess.KNIGHT, chess.KING)]
+                move = rand.choice(quiet if quiet and rand.random() < 0.8 else moves)
+                game.push(move)
+                board.push(move)
+            _check(game, board)
+
+
+def test_threefold_and_fivefold():
+    game, board = _boards()
+    _play(game, board, SHUFFLE)
+    assert not game.can_claim_threefold_repetition()
+    _play(game, board, 'g1f3 g8f6 f3g1')
+    assert game.can_claim_threefold_repetition()  # f6g8 repeats the start position the third time
+    _play(game, board, 'f6g8 ' + SHUFFLE + ' ' + SHUFFLE)
+    assert game.is_fivefold_repetition() and game.is_game_over()
+    game.pop()
+    assert not game.is_fivefold_repetition()
+
+
+def test_fivefold_not_consecutive():
+    game, board = _boards()
+    _play(game, board, ' '.join([SHUFFLE] * 3 + ['g1f3 g8f6 b1c3 b8c6 c3b1 c6b8 f3g1 f6g8']))
+    assert game.state.get_count() == 5
+    assert game.is_fivefold_repetition() and not board.is_fivefold_repetition()  # python-chess wants consecutive
+
+
+def test_fifty_and_seventyfive_moves():
+    game, board = _boards('k7/8/8/8/8/8/8/K6R w - - 99 80')
+    assert not game.can_claim_fifty_moves()
+    _play(game, board, 'h1h2')
+    assert game.can_claim_fifty_moves() and not game.is_game_over()
+    game, board = _boards('k7/8/8/8/8/8/p7/K6R w - - 149 80')
+    _play(game, board, 'h1h2')
+    assert game.is_seventyfive_moves() and game.is_game_over()
+    game.pop()
+    board.pop()
+    _play(game, board, 'a1a2')  # the capture resets the clock
+    assert game.halfmove_clock == 0 and not game.is_game_over()
+
+
+def test_mate_and_stalemate():
+    game, board = _boards()
+    _play(game, board, 'f2f3 e7e5 g2g4 d8h4')
+    assert game.is_checkmate() and game.is_game_over()
+    copied = game.snapshot().copy()
+    copied.pop()
+    assert not copied.is_checkmate() and game.is_checkmate()
+    game, board = _boards('k7/8/8/1Q6/8/8/8/7K w - - 0 1')
+    _play(game, board, 'b5b6')
+    assert game.is_stalemate() and game.is_game_over()
+
+
+def test_en_passant_key():
+    game, board = _boards()
+    _play(game, board, 'e2e4 g8f6 g1f3 f6g8 f3g1')  # e3 is set but not capturable
+    assert game.state.get_count() == 2
+    game, board = _boards('k7/8/8/8/3p4/8/4P3/K7 w - - 0 1')
+    _play(game, board, 'e2e4 a8b8 a1b1 b8a8 b1a1')  # d4xe3 was possible only the first time
+    assert game.state.get_count() == 1
+    _play(game, board, 'a8b8 a1b1 b8a8 b1a1')
+    assert game.state.get_count() == 2
+
+
+def test_castling_key():
+    game, board = _boards('k7/8/8/8/8/8/8/4K2R w K - 0 1')
+    _play(game, board, 'e1f1 a8b8 f1e1 b8a8')  # same pieces but the castling right is gone
+    assert game.state.get_count() == 1
+    _play(game, board, 'e1f1 a8b8 f1e1 b8a8')
+    assert game.state.get_count() == 2
+
+
+def test_copy_keeps_the_state():
+    game, board = _boards()
+    _play(game, board, SHUFFLE)
+    copied = game.copy()
+    copied.push_uci('g1f3')
+    copied.pop()
+    copied.push_uci('b1c3')
+    assert game.state.get_count() == 2 and copied.state.get_count() == 1
+    assert game.copy(stack=False).state.get_count() == 1  # the copied position is the new root
@@ -0,0 +1,72 @@
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import chess
+import pytest
+
+import dgt.iface
+from dgt.api import Dgt
+from dgt.iface import DgtIface, SanCache
+from dgt.util import ClockSide
+from utilities import dgtdisplay_devices
+
+
+class FakeClock(DgtIface):
+
+    """A clock only rendering the move texts."""
+
+    def get_name(self):
+        return 'ser'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    monkeypatch.setattr(dgt.iface, 'san_cache', SanCache(size=2))
+    yield FakeClock(None)
+    del dgtdisplay_devices[:]
+
+
+def _move(uci: str, side=ClockSide.LEFT, capital=False, fen=chess.STARTING_FEN):
+    return Dgt.DISPLAY_MOVE(move=chess.Move.from_uci(uci), fen=fen, side=side, wait=False, maxtime=0, beep=False,
+                            devs={'ser'}, uci960=False, lang='de', capital=capital)
+
+
+def test_san_text(clock):
+    assert clock.get_san(_move('g1f3'))[1] == 'Sf3'
+    assert clock.get_san(_move('g1f3', side=ClockSide.RIGHT))[1] == '     Sf3'
+    assert clock.get_san(_move('g1f3', side=ClockSide.RIGHT), is_xl=True)[1] == '   Sf3'
+    assert clock.get_san(_move('g1f3', capital=True))[1] == 'SF3'
+
+
+def test_illegal_move_per_clock_type(clock):
+    """The xl and the 3000 clock get their own error texts - also out of the cache."""
+    assert clock.get_san(_move('e2e5'), is_xl=True)[1] == 'ere2e5'
+    assert clock.get_san(_move('e2e5'))[1] == 'err e2e5'
+    assert clock.get_san(_move('e2e5'), is_xl=True)[1] == 'ere2e5'
+
+
+def test_cache_hit_and_eviction(clock):
+    first = clock.get_san(_move('e2e4'))
+    assert clock.get_san(_move('e2e4')) is first  # rendered once
+    clock.get_san(_move('d2d4'))
+    clock.get_san(_move('e2e4'))  # the most recently used one now
+    clock.get_san(_move('g1f3'))  # drops d2d4
+    cache = dgt.iface.san_cache.cache
+    assert [key[1].uci() for key in cache] == ['e2e4', 'g1f3']
+    assert clock.get_san(_move('e2e4')) is first
+    assert clock.get_san(_move('d2d4')) is not None
+    assert len(cache) == 2
@@ -0,0 +1,159 @@
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import chess
+import pytest
+
+from gamestate import GameBoard
+from timecontrol import TimeControl
+from dgt.util import TimeMode
+from picochess import MoveInference
+
+
+class FakeEngine(object):
+
+    """An engine recording the searches - pondering from brain() till stop()."""
+
+    def __init__(self):
+        self.pondering = None  # fen of the position searched
+        self.calls = []
+
+    def is_waiting(self):
+        return self.pondering is None
+
+    def position(self, game: chess.Board):
+        self.calls.append(('position', game.fen()))
+        self.fen = game.fen()
+
+    def brain(self, time_dict: dict):
+        self.calls.append(('brain', time_dict['wtime'], time_dict['btime']))
+        self.pondering = self.fen
+
+    def stop(self, show_best=False):
+        assert not show_best, 'the best move of a guessed position must never be shown'
+        self.calls.append(('stop',))
+        self.pondering = None
+
+
+class FakeBook(object):
+
+    """A book knowing the replies of some positions."""
+
+    def __init__(self, fens=()):
+        self.fens = set(fens)
+
+    def find(self, game: chess.Board):
+        if game.board_fen() not in self.fens:
+            raise IndexError()
+
+
+def _legal_fens(game: chess.Board):
+    fens = []
+    for move in game.legal_moves:
+        game.push(move)
+        fens.append(game.board_fen())
+        game.pop()
+    return fens
+
+
+def _after(game: chess.Board, *moves):
+    game = game.copy()
+    for move in moves:
+        game.push_uci(move)
+    return game.board_fen()
+
+
+def _full_fen(game: chess.Board, move: str):
+    game = game.copy()
+    game.push_uci(move)
+    return game.fen()
+
+
+def _lifted(game: chess.Board, square: int):
+    board = game.copy()
+    board.remove_piece_at(square)
+    return board.board_fen()
+
+
+@pytest.fixture
+def setup():
+    game = GameBoard()
+    time_control = TimeControl(TimeMode.BLITZ, blitz=5)
+    return game, time_control, FakeEngine(), MoveInference()
+
+
+def _slide(setup, fens: list, book=FakeBook()):
+    game, time_control, engine, inference = setup
+    legal_fens = _legal_fens(game)
+    for fen in fens:
+        inference.infer(fen, game, legal_fens, engine, time_control, book)
+
+
+def test_slide_rollback(setup):
+    """The queen slides d1-h5 over e2 (a legal square) and is taken back to d1 => nothing happened."""
+    game, time_control, engine, inference = setup
+    game.push_uci('e2e4')
+    game.push_uci('e7e5')
+    start_fen = game.fen()
+    _slide(setup, [_lifted(game, chess.D1), _after(game, 'd1e2'), _lifted(game, chess.D1), _after(game, 'd1f3')])
+    assert engine.pondering == _full_fen(game, 'd1f3')
+    assert [call[0] for call in engine.calls] == ['position', 'brain', 'stop', 'position', 'brain']
+
+    inference.confirm(game.board_fen(), engine)  # the stable fen: the queen is back on d1
+    assert engine.is_waiting()
+    assert engine.calls[-1] == ('stop',)
+    assert game.fen() == start_fen and len(game.move_stack) == 2
+    assert not time_control.internal_running()
+    assert time_control.internal_time == {chess.WHITE: 300.0, chess.BLACK: 300.0}
+    assert not inference.take(chess.Move.from_uci('d1f3'))
+
+
+def test_slide_hit(setup):
+    game, time_control, engine, inference = setup
+    _slide(setup, [_lifted(game, chess.E2), _after(game, 'e2e3'), _lifted(game, chess.E2), _after(game, 'e2e4')])
+    assert engine.pondering == _full_fen(game, 'e2e4')
+    inference.confirm(_after(game, 'e2e4'), engine)
+    assert not engine.is_waiting()  # the search goes on as the real one
+    assert not inference.take(chess.Move.from_uci('e2e3'))
+    assert engine.calls[-1] != ('stop',)
+
+
+def test_confirmed_move_taken_over(setup):
+    game, time_control, engine, inference = setup
+    _slide(setup, [_after(game, 'g1f3')])
+    inference.confirm(_after(game, 'g1f3'), engine)
+    assert inference.take(chess.Move.from_uci('g1f3'))
+    inference.cancel(engine)  # nothing left to stop
+    assert not engine.is_waiting()
+    assert game.move_stack == [] and not time_control.internal_running()
+
+
+def test_other_stable_move(setup):
+    """The stable fen shows another legal move => the guessed search stops before that move is played."""
+    game, time_control, engine, inference = setup
+    _slide(setup, [_after(game, 'e2e3')])
+    inference.confirm(_after(game, 'e2e4'), engine)
+    assert engine.is_waiting()
+    assert not inference.take(chess.Move.from_uci('e2e4'))
+
+
+def test_book_position_not_searched(setup):
+    game, time_control, engine, inference = setup
+    _slide(setup, [_after(game, 'e2e4')], book=FakeBook([_after(game, 'e2e4')]))
+    assert not engine.calls
+    inference.confirm(_after(game, 'e2e4'), engine)
+    assert not inference.take(chess.Move.from_uci('e2e4'))
@@ -0,0 +1,64 @@
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import logging
+
+from utilities import LogWriter, JsonLogFormatter
+
+
+def _log(tmp_path, formatter):
+    """Log like picochess.py does (basicConfig & the queue handler) and return the written lines."""
+    file_name = str(tmp_path / 'picochess.log')
+    writer = LogWriter(file_name, formatter, max_bytes=1024 * 1024, backup_count=1)
+    writer.start()
+    logger = logging.getLogger('picochess.test')
+    handler = writer.get_handler()
+    if handler.formatter is None:
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))  # what basicConfig() would set
+    logger.addHandler(handler)
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    try:
+        logger.debug('engine %s ready after %i secs', 'stockfish', 3)
+        try:
+            raise ValueError('bad fen')
+        except ValueError:
+            logger.exception('fen not set')
+    finally:
+        logger.removeHandler(handler)
+        writer.stop()
+    with open(file_name) as file:
+        return file.read().splitlines()
+
+
+def test_text_line(tmp_path):
+    formatter = logging.Formatter('%(levelname)7s %(module)10s - %(funcName)s: %(message)s')
+    lines = _log(tmp_path, formatter)
+    assert lines[0] == '  DEBUG test_logwriter - _log: engine stockfish ready after 3 secs'
+    assert lines[1] == '  ERROR test_logwriter - _log: fen not set'
+    assert 'ValueError: bad fen' in lines[-1]
+
+
+def test_json_line(tmp_path):
+    lines = _log(tmp_path, JsonLogFormatter())
+    first = json.loads(lines[0])
+    assert first['msg'] == 'engine stockfish ready after 3 secs'
+    assert (first['l'], first['m'], first['f']) == ('DEBUG', 'test_logwriter', '_log')
+    second = json.loads(lines[1])
+    assert second['msg'].startswith('fen not set\n')
+    assert 'ValueError: bad fen' in second['msg']
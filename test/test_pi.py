@@ -0,0 +1,57 @@
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from threading import Lock
+
+import dgt.pi
+from dgt.pi import DgtPi
+
+
+class FakeLib(object):
+
+    """The dgtpicom library - only counting the clock restarts."""
+
+    def __init__(self):
+        self.configured = 0
+
+    def dgtpicom_configure(self):
+        self.configured += 1
+        return 0
+
+
+class FakeDisplayMsg(object):
+
+    """Collect the shown messages."""
+
+    shown = []
+
+    @classmethod
+    def show(cls, message):
+        cls.shown.append(message)
+
+
+def test_button_numbers(monkeypatch):
+    monkeypatch.setattr(dgt.pi, 'DisplayMsg', FakeDisplayMsg)
+    FakeDisplayMsg.shown = []
+    dgtpi = DgtPi.__new__(DgtPi)  # no i2c library & polling thread
+    dgtpi.lib = FakeLib()
+    dgtpi.lib_lock = Lock()
+    for ack3 in (0x01, 0x02, 0x04, 0x08, 0x10, 0x20, 0x11, 0x40, -0x40, 0x03):
+        dgtpi._process_button(ack3)
+    assert [message.button for message in FakeDisplayMsg.shown] == [0, 1, 2, 3, 4, 0x11, 0x11, 0x40, -0x40]
+    assert all(message.dev == 'i2c' for message in FakeDisplayMsg.shown)
+    assert dgtpi.lib.configured == 1  # the on/off button restarts the clock
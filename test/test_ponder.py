@@ -0,0 +1,118 @@
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import queue
+import shutil
+import time
+
+import chess
+import pytest
+
+from dgt.api import EventApi
+from uci.engine import UciEngine
+from uci.ponder import PonderPool
+from utilities import evt_queue
+
+TIME_DICT = {'wtime': 60000, 'btime': 60000}
+
+
+def _wait(condition, secs=5.0):
+    end = time.monotonic() + secs
+    while not condition():
+        assert time.monotonic() < end, 'timeout'
+        time.sleep(0.01)
+
+
+def _events(secs=0.5):
+    """Return the search events fired within the secs."""
+    events = []
+    end = time.monotonic() + secs
+    while True:
+        try:
+            event = evt_queue.get(timeout=max(end - time.monotonic(), 0))
+        except queue.Empty:
+            return events
+        if repr(event) in (EventApi.START_SEARCH, EventApi.STOP_SEARCH, EventApi.BEST_MOVE):
+            events.append(event)
+
+
+@pytest.fixture
+def engine_file(tmp_path):
+    file = str(tmp_path / 'fakeengine')
+    shutil.copy(os.path.join(os.path.dirname(__file__), 'fakeengine.py'), file)
+    return file
+
+
+@pytest.fixture
+def pool(engine_file):
+    pools = []
+
+    def _create(options: dict):
+        engine = UciEngine(engine_file)
+        engine.startup(options, show=False)
+        ponder_pool = PonderPool(2, candidate_time=10)
+        pools.append((ponder_pool, engine))
+        return ponder_pool, engine
+
+    yield _create
+    for ponder_pool, engine in pools:
+        ponder_pool.quit()
+        engine.quit()
+
+
+def _promote(ponder_pool: PonderPool, engine: UciEngine):
+    """The user (white) is expected to play e2e4 but plays a2a3 - an extra engine pondered on it."""
+    game = chess.Board()
+    pb_move, move = chess.Move.from_uci('e2e4'), chess.Move.from_uci('a2a3')
+    ponder_pool.start(engine, game, pb_move, TIME_DICT)
+    _wait(lambda: len(ponder_pool.searches) == 2)
+    assert move in ponder_pool.searches
+    assert ponder_pool.check(move, pb_move)
+    _events(0.1)
+    ponder_pool.hit(move)
+
+
+def test_move_now(pool):
+    ponder_pool, engine = pool({})
+    _promote(ponder_pool, engine)
+    assert ponder_pool.is_thinking()
+    assert [repr(event) for event in _events()] == [EventApi.START_SEARCH]  # still searching
+    ponder_pool.stop(show_best=True)
+    events = _events()
+    assert [repr(event) for event in events] == [EventApi.STOP_SEARCH, EventApi.BEST_MOVE]
+    assert events[1].move == chess.Move.from_uci('a7a5')  # the first legal reply after a2a3
+    assert not ponder_pool.is_thinking()
+
+
+def test_stop_search(pool):
+    ponder_pool, engine = pool({})
+    _promote(ponder_pool, engine)
+    assert ponder_pool.is_thinking()
+    ponder_pool.stop()
+    _wait(lambda: not ponder_pool.is_thinking())
+    assert [repr(event) for event in _events()] == [EventApi.START_SEARCH, EventApi.STOP_SEARCH]
+
+
+def test_level_limits(pool):
+    ponder_pool, engine = pool({'go nodes': '500'})
+    assert engine.go_limits == {'nodes': 500}
+    _promote(ponder_pool, engine)
+    # the limited search ends by itself after the ponderhit (an unlimited one would wait for the stop)
+    events = _events()
+    assert [repr(event) for event in events] == [EventApi.START_SEARCH, EventApi.STOP_SEARCH, EventApi.BEST_MOVE]
+    assert not ponder_pool.is_thinking()
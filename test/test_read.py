@@ -0,0 +1,112 @@
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+import pytest
+
+from uci import read
+from uci.read import read_engine_ini
+from uci.remote import SshPool
+from utilities import metrics
+
+ENGINES_INI = """[stockfish]
+name = Stockfish
+small = stockf
+medium = Stockfis
+large = Stockfish
+elo = 3000
+"""
+
+LEVELS_UCI = """[Level@00]
+Skill Level = 0
+
+[Level@20]
+Skill Level = 20
+"""
+
+
+class FakeShell(object):
+
+    """A remote shell (spur like) serving the files of a local folder - it counts the opened files."""
+
+    def __init__(self):
+        self.opened = []
+        self.closed = False
+
+    def open(self, filename: str, mode: str):
+        self.opened.append(filename)
+        return open(filename, mode)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def engine_path(tmp_path):
+    (tmp_path / 'engines.ini').write_text(ENGINES_INI)
+    (tmp_path / 'stockfish.uci').write_text(LEVELS_UCI)
+    read.local_cache.clear()
+    read.remote_cache.clear()
+    yield str(tmp_path)
+    read.local_cache.clear()
+    read.remote_cache.clear()
+
+
+def test_local_cache_returns_copies(engine_path):
+    library = read_engine_ini(engine_path=engine_path)
+    assert [engine['name'] for engine in library] == ['Stockfish']
+    assert library[0]['level_dict']['Level@20'] == {'Skill Level': '20'}
+    library[0]['level_dict'].clear()
+    library.append({'name': 'changed'})
+    cached = read_engine_ini(engine_path=engine_path)
+    assert [engine['name'] for engine in cached] == ['Stockfish']
+    assert cached[0]['level_dict']['Level@20'] == {'Skill Level': '20'}
+
+
+def test_local_cache_follows_changes(engine_path):
+    read_engine_ini(engine_path=engine_path)
+    filename = os.path.join(engine_path, 'engines.ini')
+    with open(filename, 'a') as file:
+        file.write('\n[komodo]\nname = Komodo\nsmall = komodo\nmedium = Komodo\nlarge = Komodo\nelo = 2900\n')
+    os.utime(filename, (1, 1))  # a new mtime even inside the same timer tick
+    assert [engine['name'] for engine in read_engine_ini(engine_path=engine_path)] == ['Stockfish', 'Komodo']
+
+
+def test_remote_cache_keyed_by_server(engine_path):
+    shell = FakeShell()
+    library = read_engine_ini(shell, engine_path, server=('host', 'pi', None))
+    assert len(shell.opened) == 2
+    library[0]['name'] = 'changed'
+    reconnected = FakeShell()  # a reconnect gives a new shell to the same server
+    cached = read_engine_ini(reconnected, engine_path, server=('host', 'pi', None))
+    assert not reconnected.opened
+    assert cached[0]['name'] == 'Stockfish'
+    other = FakeShell()
+    read_engine_ini(other, engine_path, server=('host', 'root', None))
+    assert len(other.opened) == 2
+
+
+def test_ssh_pool_stats_and_close(monkeypatch):
+    shell = FakeShell()
+    monkeypatch.setattr(SshPool, 'shells', {('host', 'pi'): shell})
+    monkeypatch.setattr(SshPool, 'stats', {('host', 'pi'): {'connects': 2, 'reconnects': 1, 'handshake': 0.25,
+                                                            'handshake_max': 0.5}})
+    assert 'picochess_ssh_reconnects{host="host",user="pi"} 1' in metrics.render()
+    SshPool.close_all()
+    assert shell.closed
+    assert not SshPool.shells
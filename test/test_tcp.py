@@ -0,0 +1,121 @@
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import socket
+import time
+from threading import Thread, Lock
+
+import pytest
+
+from uci.engine import UciEngine
+from uci.tcp import EngineServer, TcpConnection, send_frame, recv_frame, FRAME_OPEN, FRAME_OPENED, FRAME_LINE, \
+    FRAME_CLOSE
+
+
+class Recorder(object):
+
+    """A session handler keeping the frames it gets."""
+
+    def __init__(self):
+        self.frames = []
+
+    def on_frame(self, frame_type: int, payload: str):
+        self.frames.append((frame_type, payload))
+
+
+def _wait(condition, secs=5.0):
+    end = time.monotonic() + secs
+    while not condition():
+        assert time.monotonic() < end, 'timeout'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """An engine server on a free loopback port serving the scripted engine - its commands go to engine.log."""
+    engine_path = tmp_path / 'engines'
+    engine_path.mkdir()
+    shutil.copy(os.path.join(os.path.dirname(__file__), 'fakeengine.py'), str(engine_path / 'fakeengine'))
+    log_file = tmp_path / 'engine.log'
+    monkeypatch.setenv('FAKE_ENGINE_LOG', str(log_file))
+    engine_server = EngineServer(0, str(engine_path))
+    Thread(target=engine_server.serve_forever, daemon=True).start()
+    engine_server.log = lambda: log_file.read_text().splitlines() if log_file.exists() else []
+    yield engine_server
+    engine_server.shutdown()
+    engine_server.server_close()
+    for engines in engine_server.idle.values():
+        for engine in engines:
+            engine.quit()
+
+
+def _idle(engine_server):
+    return len(engine_server.idle.get('fakeengine', []))
+
+
+def test_session_reset(server):
+    port = server.server_address[1]
+    engine = UciEngine('fakeengine', hostname='127.0.0.1', port=port)
+    engine.startup({'Skill Level': '5'}, show=False)
+    assert engine.engine.go(movetime=10).bestmove
+    engine.quit()
+    _wait(lambda: _idle(server) == 1)
+    log = server.log()
+    assert 'setoption name Skill Level value 5' in log
+    assert log[-3:] == ['ucinewgame', 'setoption name Skill Level value 20', 'isready']
+
+
+def test_search_stopped_and_engine_reused(server):
+    connection = TcpConnection.get('127.0.0.1', server.server_address[1])
+    for _ in range(2):
+        recorder = Recorder()
+        session, (frame_type, _) = connection.request(FRAME_OPEN, 'fakeengine', handler=recorder)
+        assert frame_type == FRAME_OPENED
+        connection.send(FRAME_LINE, session, 'go infinite')
+        connection.send(FRAME_CLOSE, session)
+        connection.release(session)
+        _wait(lambda: _idle(server) == 1)
+        assert server.log()[-4:] == ['go infinite', 'stop', 'ucinewgame', 'isready']
+    assert server.log().count('uci') == 1  # only one engine process was started
+
+
+def test_lines_after_opened():
+    """The server may send engine lines right behind the FRAME_OPENED - none of them gets lost."""
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+
+    def _serve():
+        sock, _ = listener.accept()
+        _, session, _ = recv_frame(sock)
+        lock = Lock()
+        send_frame(sock, lock, FRAME_OPENED, session)
+        send_frame(sock, lock, FRAME_LINE, session, 'id name early')
+        recv_frame(sock)  # till the client is gone
+        sock.close()
+
+    Thread(target=_serve, daemon=True).start()
+    connection = TcpConnection('127.0.0.1', listener.getsockname()[1])
+    recorder = Recorder()
+    _, (frame_type, _) = connection.request(FRAME_OPEN, 'fakeengine', handler=recorder)
+    assert frame_type == FRAME_OPENED
+    _wait(lambda: recorder.frames)
+    assert recorder.frames[0] == (FRAME_LINE, 'id name early')
+    connection.sock.close()
+    listener.close()
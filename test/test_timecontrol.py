@@ -0,0 +1,194 @@
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import chess
+import pytest
+
+import timecontrol
+from gamestate import GameBoard
+from timecontrol import TimeControl
+from dgt.util import TimeMode
+from utilities import metrics
+
+START = 1000.0
+
+
+class FakeTime(object):
+
+    """A time.monotonic() only moved by the test."""
+
+    def __init__(self):
+        self.now = START
+
+    def monotonic(self):
+        return self.now
+
+
+class FakeScheduler(object):
+
+    """A clock_scheduler recording the flag deadlines instead of calling them."""
+
+    def __init__(self):
+        self.deadlines = {}
+
+    def schedule_at(self, deadline: float, function, *args):
+        handle = len(self.deadlines) + 1
+        self.deadlines[handle] = deadline
+        return handle
+
+    def cancel(self, handle):
+        del self.deadlines[handle]
+
+
+@pytest.fixture
+def fake_time(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(timecontrol, 'time', fake)
+    monkeypatch.setattr(timecontrol, 'clock_scheduler', FakeScheduler())
+    return fake
+
+
+def _move(time_control: TimeControl, fake_time: FakeTime, color, secs: float):
+    """Let color think secs on the clock and finish the move - then the clock sends its times like a DGT does."""
+    time_control.start_internal(color, log=False)
+    fake_time.now += secs
+    time_control.stop_internal(log=False)
+    time_control.add_time(color)
+    time_control.set_clock_times(white_time=int(time_control.internal_time[chess.WHITE]),
+                                 black_time=int(time_control.internal_time[chess.BLACK]))
+
+
+def _times(time_control: TimeControl):
+    return time_control.internal_time[chess.WHITE], time_control.internal_time[chess.BLACK]
+
+
+def test_fischer(fake_time):
+    time_control = TimeControl(TimeMode.FISCHER, blitz=5, fischer=3)
+    assert _times(time_control) == (303, 303)
+    _move(time_control, fake_time, chess.WHITE, 10)
+    assert _times(time_control) == (296, 303)
+    _move(time_control, fake_time, chess.BLACK, 1)
+    assert _times(time_control) == (296, 305)
+    assert time_control.uci(chess.WHITE) == {'wtime': '296000', 'btime': '305000', 'winc': '3000', 'binc': '3000'}
+
+
+def test_bronstein(fake_time):
+    time_control = TimeControl(TimeMode.BRONSTEIN, blitz=5, delay=3)
+    assert _times(time_control) == (300, 300)
+    _move(time_control, fake_time, chess.WHITE, 2)  # below the delay => all given back
+    assert _times(time_control) == (300, 300)
+    _move(time_control, fake_time, chess.BLACK, 10)  # only the delay is given back
+    assert _times(time_control) == (300, 293)
+    assert time_control.uci(chess.WHITE) == {'wtime': '300000', 'btime': '293000', 'winc': '3000', 'binc': '3000'}
+
+
+def test_delay(fake_time):
+    time_control = TimeControl(TimeMode.DELAY, blitz=5, delay=3)
+    time_control.start_internal(chess.WHITE, log=False)
+    assert list(timecontrol.clock_scheduler.deadlines.values()) == [START + 300 + 3]  # the flag waits for the delay
+    fake_time.now += 2
+    time_control.stop_internal(log=False)
+    assert not timecontrol.clock_scheduler.deadlines
+    time_control.add_time(chess.WHITE)
+    assert _times(time_control) == (300, 300)
+    time_control.set_clock_times(white_time=300, black_time=300)
+    _move(time_control, fake_time, chess.BLACK, 10)
+    assert _times(time_control) == (300, 293)
+
+
+def test_stages(fake_time):
+    time_control = TimeControl(TimeMode.STAGES, blitz=1, fischer=2, stages=[[2, 1], [1, 1]])
+    assert _times(time_control) == (62, 62)
+    assert time_control.uci(chess.WHITE)['movestogo'] == '2'
+    _move(time_control, fake_time, chess.WHITE, 10)
+    assert _times(time_control) == (54, 62)
+    assert time_control.uci(chess.WHITE)['movestogo'] == '1'
+    assert time_control.uci(chess.BLACK)['movestogo'] == '2'
+    _move(time_control, fake_time, chess.WHITE, 10)  # finishes the first stage
+    assert _times(time_control) == (106, 62)
+    _move(time_control, fake_time, chess.WHITE, 10)  # the last stage repeats
+    assert _times(time_control) == (158, 62)
+    assert time_control.uci(chess.WHITE)['movestogo'] == '1'
+
+
+def test_stages_sudden_death(fake_time):
+    time_control = TimeControl(TimeMode.STAGES, blitz=1, stages=[[1, 1], [0, 2]])
+    assert 'winc' not in time_control.uci(chess.WHITE)
+    _move(time_control, fake_time, chess.WHITE, 10)
+    assert _times(time_control) == (170, 60)
+    assert 'movestogo' not in time_control.uci(chess.WHITE)
+    _move(time_control, fake_time, chess.WHITE, 10)
+    assert _times(time_control) == (160, 60)
+
+
+def test_fixed(fake_time):
+    time_control = TimeControl(TimeMode.FIXED, fixed=5)
+    assert time_control.uci(chess.WHITE) == {'movetime': '5000'}
+    time_control.start_internal(chess.WHITE, log=False)
+    assert not time_control.internal_running()
+    time_control.add_time(chess.WHITE)
+    assert _times(time_control) == (5, 5)
+
+
+def test_stages_takeback(fake_time):
+    game = GameBoard()
+    time_control = TimeControl(TimeMode.STAGES, blitz=1, stages=[[2, 1], [0, 1]])
+    for move in ('e2e4', 'e7e5', 'g1f3'):
+        _move(time_control, fake_time, game.turn, 1)
+        game.push_uci(move)
+    assert time_control.moves_done == {chess.WHITE: 2, chess.BLACK: 1}
+    game.pop()
+    game.pop()
+    time_control.set_moves_done(game)
+    assert time_control.moves_done == {chess.WHITE: 1, chess.BLACK: 0}
+    assert time_control.uci(chess.BLACK)['movestogo'] == '2'
+    assert time_control.uci(chess.WHITE)['movestogo'] == '1'
+    white, _ = _times(time_control)
+    _move(time_control, fake_time, chess.BLACK, 1)
+    _move(time_control, fake_time, chess.WHITE, 1)  # finishes the first stage again => the next stage time
+    assert _times(time_control)[0] == white - 1 + 60
+
+
+def test_moves_done_black_starts(fake_time):
+    game = GameBoard('rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1')
+    time_control = TimeControl(TimeMode.STAGES, blitz=1, stages=[[2, 1], [0, 1]])
+    time_control.set_moves_done(game)
+    assert time_control.moves_done == {chess.WHITE: 0, chess.BLACK: 0}
+    for move in ('e7e5', 'g1f3', 'b8c6'):
+        game.push_uci(move)
+    time_control.set_moves_done(game)
+    assert time_control.moves_done == {chess.WHITE: 1, chess.BLACK: 2}
+
+
+def test_moves_done_restored(fake_time):
+    time_control = TimeControl(TimeMode.STAGES, blitz=1, stages=[[2, 1], [0, 1]])
+    _move(time_control, fake_time, chess.WHITE, 1)
+    copied = TimeControl(**time_control.get_parameters())
+    assert copied.moves_done == {chess.WHITE: 1, chess.BLACK: 0}
+    assert copied.uci(chess.WHITE)['movestogo'] == '1'
+    copied.add_time(chess.WHITE)
+    assert time_control.moves_done == {chess.WHITE: 1, chess.BLACK: 0}
+
+
+def test_drift_metrics(fake_time):
+    time_control = TimeControl(TimeMode.BLITZ, blitz=5)
+    time_control.start_internal(chess.WHITE, log=False)
+    fake_time.now += 10.25
+    time_control.set_clock_times(white_time=289, black_time=300)  # the clock runs 0.75secs ahead
+    assert metrics.values['picochess_clock_drift_seconds'][1][()] == pytest.approx(-0.75)
+    histogram = metrics.values['picochess_clock_drift_abs_seconds'][1][()]
+    assert histogram[-2:] == pytest.approx([0.75, 1])
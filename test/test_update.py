@@ -0,0 +1,64 @@
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import queue
+
+import pytest
+
+import utilities
+from dgt.api import Event
+from dgt.translate import DgtTranslate
+
+
+def _drain(evt_queue: queue.Queue):
+    events = []
+    while True:
+        try:
+            events.append(evt_queue.get_nowait())
+        except queue.Empty:
+            return events
+
+
+@pytest.fixture
+def git(monkeypatch):
+    commands = []
+
+    def do_popen(command, log=True, force_en_env=False, timeout=None):
+        commands.append(command[1])
+        return {'rev-parse': 'master\n', 'status': 'Your branch is behind'}.get(command[1], '')
+
+    def reboot(dgtpi: bool, dev: str):
+        raise AssertionError('the update thread must not reboot during a game')
+
+    monkeypatch.setattr(utilities, 'do_popen', do_popen)
+    monkeypatch.setattr(utilities, 'reboot', reboot)
+    monkeypatch.setattr(utilities.time, 'sleep', lambda secs: None)
+    _drain(utilities.evt_queue)
+    _drain(utilities.dispatch_queue)
+    yield commands
+    _drain(utilities.dispatch_queue)
+
+
+@pytest.mark.parametrize('auto_reboot', [True, False])
+def test_update_requests_reboot(git, auto_reboot):
+    utilities.update_picochess(auto_reboot, DgtTranslate('none', 0, 'en', 'test'))
+    assert 'pull' in git
+    events = _drain(utilities.evt_queue)
+    if auto_reboot:
+        assert len(events) == 1 and isinstance(events[0], Event.REBOOT) and events[0].dev == 'update'
+    else:
+        assert not events
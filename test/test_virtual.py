@@ -0,0 +1,100 @@
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import queue
+import time
+import logging
+
+import chess
+import pytest
+
+from dgt.api import Message
+from dgt.board import DgtBoard
+from dgt.util import ClockSide
+from dgt.virtual import VirtualDgt
+from utilities import DisplayMsg, msgdisplay_devices, metrics
+
+
+def _wait_for(display: DisplayMsg, kind, secs=10.0):
+    """Return the first message of this kind the board sends within secs."""
+    end = time.monotonic() + secs
+    while time.monotonic() < end:
+        try:
+            message = display.msg_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if isinstance(message, kind):
+            return message
+    raise AssertionError('no %s received' % kind)
+
+
+@pytest.fixture
+def board():
+    """A DgtBoard connected to a virtual board & clock - both stopped afterwards, so pytest doesnt hang."""
+    virtual = VirtualDgt(seed=1)
+    virtual.start()
+    display = DisplayMsg()
+    dgtboard = DgtBoard(virtual.port, disable_revelation_leds=True, is_pi=False, disable_end=False)
+    dgtboard.run()
+    yield virtual, dgtboard, display
+    dgtboard.stop()
+    virtual.stop()
+    assert not dgtboard.incoming_board_thread.is_alive()
+    del msgdisplay_devices[:]
+
+
+def test_board_dump_field_update_and_clock_ack(board):
+    virtual, dgtboard, display = board
+    start = chess.Board()
+    message = _wait_for(display, Message.DGT_FEN)
+    assert message.fen == start.board_fen()
+    message = _wait_for(display, Message.DGT_CLOCK_VERSION)
+    assert (message.main, message.sub) == virtual.clock_version
+    assert dgtboard.clock_stats['acked'] == 1
+
+    virtual.play_move(start, chess.Move.from_uci('e2e4'), lift_delay=0.01)
+    message = _wait_for(display, Message.DGT_FIELD_FEN)
+    assert message.fen == 'rnbqkbnr/pppppppp/8/8/8/8/PPPP1PPP/RNBQKBNR'  # e2 lifted
+    message = _wait_for(display, Message.DGT_FEN)
+    assert message.fen == start.board_fen()  # the stable position after e4
+
+    assert dgtboard.set_and_run(0, 0, 5, 0, 0, 0, 5, 0)  # set the times but dont run the clock
+    end = time.monotonic() + 5
+    while dgtboard.clock_stats['acked'] < 2 and time.monotonic() < end:
+        time.sleep(0.01)
+    assert dgtboard.clock_stats == dict(dgtboard.clock_stats, sent=2, acked=2, ack_errors=0, timeouts=0)
+    assert virtual.clock_times == [300, 300]
+
+
+def test_clock_load(board):
+    virtual, dgtboard, display = board
+    _wait_for(display, Message.DGT_CLOCK_VERSION)
+    sides = [ClockSide.LEFT, ClockSide.RIGHT, ClockSide.NONE]
+    for count in range(20):  # like DgtHw: a text, then start|stop the clock and go back to the time display
+        side = sides[count % len(sides)]
+        assert dgtboard.set_text_3k(b'load %03i' % count, 0)
+        assert dgtboard.set_and_run(int(side == ClockSide.LEFT), 0, 5, 0, int(side == ClockSide.RIGHT), 0, 5, 0)
+        assert dgtboard.end_text()
+    end = time.monotonic() + 5
+    while dgtboard.clock_lock and time.monotonic() < end:
+        time.sleep(0.01)
+    stats = dgtboard.get_clock_stats()
+    logging.info('clock load: %s', stats)
+    assert (stats['sent'], stats['acked'], stats['ack_errors'], stats['timeouts']) == (61, 61, 0, 0)
+    assert virtual.clock_runs == [sides[count % len(sides)] for count in range(20)]  # no start|stop lost
+    gauges = metrics.render()
+    assert 'picochess_clock_acked{device="ser"} 61' in gauges
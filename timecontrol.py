@@ -16,12 +16,10 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 import time
-import threading
 import logging
 import copy
-from math import floor
 
-from utilities import Observable, hms_time
+from utilities import Observable, hms_time, clock_scheduler, metrics
 import chess
 from dgt.api import Event
 from dgt.util import TimeMode
@@ -31,41 +29,70 @@ class TimeControl(object):
 
     """Control the picochess internal clock."""
 
-    def __init__(self, mode=TimeMode.FIXED, fixed=0, blitz=0, fischer=0, internal_time=None):
+    def __init__(self, mode=TimeMode.FIXED, fixed=0, blitz=0, fischer=0, delay=0, stages=None, internal_time=None,
+                 moves_done=None):
         super(TimeControl, self).__init__()
         self.mode = mode
         self.move_time = fixed
         self.game_time = blitz
         self.fisch_inc = fischer
+        self.delay = delay  # secs for the BRONSTEIN & DELAY mode
+        self.stages = stages if stages else [[0, blitz]]  # [moves, mins] - the last one repeats if moves > 0
         self.internal_time = internal_time
 
         self.clock_time = {chess.WHITE: 0, chess.BLACK: 0}  # saves the sended clock time for white/black
-        self.timer = None
+        self.timer = None  # handle of the flag deadline inside clock_scheduler
         self.run_color = None
         self.active_color = None
-        self.start_time = None
+        self.start_time = None  # time.monotonic() value of the last clock start
+        self.moves_done = {chess.WHITE: 0, chess.BLACK: 0}  # needed for the STAGES mode
+        self.last_used = {chess.WHITE: 0.0, chess.BLACK: 0.0}  # used secs of the last move (for the delay modes)
 
         if internal_time:  # preset the clock (received) time already
             self.clock_time[chess.WHITE] = int(internal_time[chess.WHITE])
             self.clock_time[chess.BLACK] = int(internal_time[chess.BLACK])
         else:
             self.reset()
+        if moves_done:
+            self.moves_done = {chess.WHITE: moves_done[chess.WHITE], chess.BLACK: moves_done[chess.BLACK]}
 
     def __eq__(self, other):
         chk_mode = self.mode == other.mode
         chk_secs = self.move_time == other.move_time
         chk_mins = self.game_time == other.game_time
         chk_finc = self.fisch_inc == other.fisch_inc
-        return chk_mode and chk_secs and chk_mins and chk_finc
+        chk_dlay = self.delay == other.delay
+        chk_stgs = self.stages == other.stages
+        return chk_mode and chk_secs and chk_mins and chk_finc and chk_dlay and chk_stgs
 
     def __hash__(self):
         value = str(self.mode) + str(self.move_time) + str(self.game_time) + str(self.fisch_inc)
+        value += str(self.delay) + str(self.stages)
         return hash(value)
 
     def get_parameters(self):
         """Return the state of this class for generating a new instance."""
-        return {'mode': self.mode, 'fixed': self.move_time, 'blitz': self.game_time,
-                'fischer': self.fisch_inc, 'internal_time': self.internal_time}
+        return {'mode': self.mode, 'fixed': self.move_time, 'blitz': self.game_time, 'fischer': self.fisch_inc,
+                'delay': self.delay, 'stages': self.stages, 'internal_time': self.internal_time,
+                'moves_done': self.moves_done.copy()}
+
+    def get_ini_text(self):
+        """Return the time setting in the format of the "time" ini option."""
+        if self.mode == TimeMode.FIXED:
+            return '{:d}'.format(self.move_time)
+        if self.mode == TimeMode.BLITZ:
+            return '{:d} 0'.format(self.game_time)
+        if self.mode == TimeMode.FISCHER:
+            return '{:d} {:d}'.format(self.game_time, self.fisch_inc)
+        if self.mode == TimeMode.BRONSTEIN:
+            return '{:d} b{:d}'.format(self.game_time, self.delay)
+        if self.mode == TimeMode.DELAY:
+            return '{:d} d{:d}'.format(self.game_time, self.delay)
+        if self.mode == TimeMode.STAGES:
+            text = ' '.join('{:d}/{:d}'.format(moves, mins) if moves else '{:d}'.format(mins)
+                            for moves, mins in self.stages)
+            return text + (' +{:d}'.format(self.fisch_inc) if self.fisch_inc else '')
+        return ''
 
     def get_list_text(self):
         """Get the clock list text for the current time setting."""
@@ -75,6 +102,11 @@ class TimeControl(object):
             return '{:2d}'.format(self.game_time)
         if self.mode == TimeMode.FISCHER:
             return '{:2d} {:2d}'.format(self.game_time, self.fisch_inc)
+        if self.mode in (TimeMode.BRONSTEIN, TimeMode.DELAY):
+            return '{:2d} {:2d}'.format(self.game_time, self.delay)
+        if self.mode == TimeMode.STAGES:
+            moves, mins = self.stages[0]
+            return '{:2d}/{:d}'.format(moves, mins) if moves else '{:2d}'.format(mins)
         return 'errtm'
 
     def reset(self):
@@ -88,10 +120,24 @@ class TimeControl(object):
         elif self.mode == TimeMode.FIXED:
             self.clock_time[chess.WHITE] = self.clock_time[chess.BLACK] = self.move_time
 
+        elif self.mode in (TimeMode.BRONSTEIN, TimeMode.DELAY):
+            self.clock_time[chess.WHITE] = self.clock_time[chess.BLACK] = self.game_time * 60
+
+        elif self.mode == TimeMode.STAGES:
+            self.clock_time[chess.WHITE] = self.clock_time[chess.BLACK] = self.stages[0][1] * 60 + self.fisch_inc
+
+        self.moves_done = {chess.WHITE: 0, chess.BLACK: 0}
+        self.last_used = {chess.WHITE: 0.0, chess.BLACK: 0.0}
         self.internal_time = {chess.WHITE: float(self.clock_time[chess.WHITE]),
                               chess.BLACK: float(self.clock_time[chess.BLACK])}
         self.active_color = None
 
+    def set_moves_done(self, game: chess.Board):
+        """Count the moves per color out of the game - after a takeback or for a game already running."""
+        plies = len(game.move_stack)
+        first = game.turn if plies % 2 == 0 else not game.turn  # color of the first move
+        self.moves_done = {first: (plies + 1) // 2, not first: plies // 2}
+
     def _log_time(self):
         time_w, time_b = self.get_internal_time(flip_board=False)
         return hms_time(time_w), hms_time(time_b)
@@ -108,10 +154,32 @@ class TimeControl(object):
         logging.info('set clock times w:%s b:%s', hms_time(white_time), hms_time(black_time))
         self.clock_time[chess.WHITE] = white_time
         self.clock_time[chess.BLACK] = black_time
+        if self.internal_running() and self.start_time is not None:
+            self._update_drift(self.clock_time[self.active_color])
+
+    def _update_drift(self, clock_secs: int):
+        # the clock only sends full seconds (counting down), so a drift below 1sec is just the rounding
+        drift = clock_secs - self.get_remaining_time(self.active_color)
+        metrics.set('picochess_clock_drift_seconds', drift)
+        metrics.observe('picochess_clock_drift_abs_seconds', abs(drift))
+        if abs(drift) > 1.5:
+            logging.warning('internal clock drifts %.3f secs from the received clock time', drift)
+        else:
+            logging.debug('internal clock drift: %.3f secs', drift)
+
+    def get_remaining_time(self, color):
+        """Return the (exact) remaining secs for color - including the running time."""
+        remaining = self.internal_time[color]
+        if self.internal_running() and color == self.active_color and self.start_time is not None:
+            remaining -= self._used_ms() / 1000
+        return max(remaining, 0.0)
+
+    def _used_ms(self):
+        return int((time.monotonic() - self.start_time) * 1000)
 
     def reset_start_time(self):
         """Set the start time to the current time."""
-        self.start_time = time.time()
+        self.start_time = time.monotonic()
 
     def _out_of_time(self, time_start):
         """Fire an OUT_OF_TIME event."""
@@ -124,16 +192,47 @@ class TimeControl(object):
             logging.debug(txt, self.internal_time[self.active_color], display_color, time_start)
             Observable.fire(Event.OUT_OF_TIME(color=self.active_color))
 
+    def _stage_state(self, moves: int):
+        """Return the stage index and the moves to go inside it (None for sudden death) after moves made."""
+        index = 0
+        while True:
+            stage_moves = self.stages[index][0]
+            if stage_moves == 0:
+                return index, None
+            if moves < stage_moves:
+                return index, stage_moves - moves
+            moves -= stage_moves
+            if index + 1 < len(self.stages):  # otherwise the last stage repeats
+                index += 1
+
+    def _get_bonus(self, color):
+        """Return the secs to add after a move of color."""
+        if self.mode == TimeMode.FISCHER:
+            return self.fisch_inc
+        if self.mode in (TimeMode.BRONSTEIN, TimeMode.DELAY):
+            # the clock counts the delay down as well (see start_internal), so both give back the used delay
+            return min(self.last_used[color], self.delay)
+        if self.mode == TimeMode.STAGES:
+            _, moves_to_go = self._stage_state(self.moves_done[color])
+            bonus = self.fisch_inc
+            if moves_to_go == 1:  # this move finishes the stage
+                index, _ = self._stage_state(self.moves_done[color] + 1)
+                bonus += self.stages[index][1] * 60
+            return bonus
+        return 0
+
     def add_time(self, color):
         """Add the increment value to the color given."""
         assert self.internal_running() is False, 'internal clock still running for: %s' % self.run_color
-        if self.mode == TimeMode.FISCHER:
+        if self.mode in (TimeMode.FISCHER, TimeMode.BRONSTEIN, TimeMode.DELAY, TimeMode.STAGES):
             # log times - issue #184
             w_hms, b_hms = self._log_time()
             logging.info('before internal time w:%s - b:%s', w_hms, b_hms)
 
-            self.internal_time[color] += self.fisch_inc
-            self.clock_time[color] += self.fisch_inc
+            bonus = self._get_bonus(color)
+            self.moves_done[color] += 1
+            self.internal_time[color] += bonus
+            self.clock_time[color] += bonus
 
             # log times - issue #184
             w_hms, b_hms = self._log_time()
@@ -145,7 +244,7 @@ class TimeControl(object):
     def start_internal(self, color, log=True):
         """Start the internal clock."""
         if not self.internal_running():
-            if self.mode in (TimeMode.BLITZ, TimeMode.FISCHER):
+            if self.mode != TimeMode.FIXED:
                 self.active_color = color
                 self.reset_start_time()
 
@@ -160,29 +259,31 @@ class TimeControl(object):
 
             # Only start thread if not already started for same color, and the player has not already lost on time
             if self.internal_time[color] > 0 and self.active_color is not None and self.run_color != self.active_color:
-                self.timer = threading.Timer(copy.copy(self.internal_time[color]), self._out_of_time,
-                                             [copy.copy(self.internal_time[color])])
-                self.timer.start()
+                # the dgt clock has no delay mode: it counts down from the start, picochess gives back the delay
+                # afterwards (add_time) - only the flag needs to wait for the delay in addition
+                flag_time = self.internal_time[color] + (self.delay if self.mode == TimeMode.DELAY else 0)
+                self.timer = clock_scheduler.schedule_at(self.start_time + flag_time,
+                                                         self._out_of_time, self.internal_time[color])
                 logging.debug('internal timer started - color: %s run: %s active: %s',
                               color, self.run_color, self.active_color)
                 self.run_color = self.active_color
 
     def stop_internal(self, log=True):
         """Stop the internal clock."""
-        if self.internal_running() and self.mode in (TimeMode.BLITZ, TimeMode.FISCHER):
+        if self.internal_running() and self.mode != TimeMode.FIXED:
             if log:
                 w_hms, b_hms = self._log_time()
                 logging.info('old internal time w:%s b:%s', w_hms, b_hms)
 
             if self.timer:
-                self.timer.cancel()
-                self.timer.join()
-            else:
-                print('time=%s', self.internal_time)
-            used_time = floor((time.time() - self.start_time) * 10) / 10
+                clock_scheduler.cancel(self.timer)
+                self.timer = None
+            used_ms = self._used_ms()
             if log:
-                logging.info('used time: %s secs', used_time)
-            self.internal_time[self.active_color] -= used_time
+                logging.info('used time: %s ms', used_ms)
+            self.last_used[self.active_color] = used_ms / 1000
+            remaining_ms = round(self.internal_time[self.active_color] * 1000) - used_ms
+            self.internal_time[self.active_color] = remaining_ms / 1000
             if self.internal_time[self.active_color] < 0:
                 self.internal_time[self.active_color] = 0
 
@@ -195,17 +296,24 @@ class TimeControl(object):
         """Return if the internal clock is running."""
         return self.active_color is not None
 
-    def uci(self):
-        """Return remaining time for both players in an UCI dict."""
+    def uci(self, turn=None):
+        """Return remaining time for both players in an UCI dict (with movestogo for turn in STAGES mode)."""
         uci_dict = {}
-        if self.mode in (TimeMode.BLITZ, TimeMode.FISCHER):
+        if self.mode != TimeMode.FIXED:
             uci_dict['wtime'] = str(int(self.internal_time[chess.WHITE] * 1000))
             uci_dict['btime'] = str(int(self.internal_time[chess.BLACK] * 1000))
 
-            if self.mode == TimeMode.FISCHER:
+            if self.mode in (TimeMode.FISCHER, TimeMode.STAGES) and self.fisch_inc:
                 uci_dict['winc'] = str(self.fisch_inc * 1000)
                 uci_dict['binc'] = str(self.fisch_inc * 1000)
-        elif self.mode == TimeMode.FIXED:
+            if self.mode in (TimeMode.BRONSTEIN, TimeMode.DELAY):  # uci knows no delay - best fit is an increment
+                uci_dict['winc'] = str(self.delay * 1000)
+                uci_dict['binc'] = str(self.delay * 1000)
+            if self.mode == TimeMode.STAGES and turn is not None:
+                _, moves_to_go = self._stage_state(self.moves_done[turn])
+                if moves_to_go:
+                    uci_dict['movestogo'] = str(moves_to_go)
+        else:
             uci_dict['movetime'] = str(self.move_time * 1000)
 
         return uci_dict
@@ -17,62 +17,107 @@
 
 import logging
 import os
+import time
 import configparser
-import spur
-import paramiko
 
 from subprocess import DEVNULL
+from threading import Timer, Lock
 from dgt.api import Event
-from utilities import Observable
+from utilities import Observable, tracer, metrics
 import chess.uci
 from chess import Board
 from uci.informer import Informer
-from uci.read import read_engine_ini
+from uci.read import read_engine_ini, read_uci_snapshot, write_uci_snapshot
+from uci.remote import SshPool
+from uci.resources import engine_resources
+from uci.tcp import TcpConnection, tcp_spawn_engine
+
+
+HASH_OPTIONS = ('Hash', 'Threads')  # changing these renews the engine hash anyway
+HASH_FILE_OPTIONS = ('Hash File', 'Save Hash to File', 'Load Hash from File')
+GO_PREFIX = 'go '  # level options like "go nodes = 500" limit the search instead of setting an uci option
 
 
 class UciEngine(object):
 
     """Handle the uci engine communication."""
 
-    def __init__(self, file: str, hostname=None, username=None, key_file=None, password=None, home=''):
+    def __init__(self, file: str, hostname=None, username=None, key_file=None, password=None, home='', port=None,
+                 keep_hash=False, informer=True):
         super(UciEngine, self).__init__()
         try:
+            self.keep_hash = keep_hash  # keep the hash between games (no ucinewgame, save/load a hash file)
+            self.newgame_sent = False
+            self.newgame_960 = None  # UCI_Chess960 value at the last ucinewgame
+            self.launched = time.monotonic()
+            self.first_go = None  # secs from launch to the first go
+            self.snapshot = None
             self.shell = None
-            if hostname:
-                logging.info('connecting to [%s]', hostname)
-                if key_file:
-                    shell = spur.SshShell(hostname=hostname, username=username, private_key_file=key_file,
-                                          missing_host_key=paramiko.AutoAddPolicy())
-                else:
-                    shell = spur.SshShell(hostname=hostname, username=username, password=password,
-                                          missing_host_key=paramiko.AutoAddPolicy())
+            if hostname and port:
+                self.shell = TcpConnection.get(hostname, port)
+                self.engine = tcp_spawn_engine(hostname, port, file, chess.uci.Engine)
+            elif hostname:
+                shell = SshPool.get_shell(hostname, username=username, key_file=key_file, password=password)
                 self.shell = shell
                 if home:
                     file = home + os.sep + file
-                self.engine = chess.uci.spur_spawn_engine(shell, [file])
+                self.engine = chess.uci.spur_spawn_engine(shell, [file]) if shell else None
             else:
                 self.engine = chess.uci.popen_engine(file, stderr=DEVNULL)
 
             self.file = file
             if self.engine:
-                handler = Informer()
-                self.engine.info_handlers.append(handler)
-                self.engine.uci()
+                if informer:  # extra engines (multi ponder) keep their infos for themselves
+                    self.engine.info_handlers.append(Informer())
+                self.snapshot = None if hostname else read_uci_snapshot(file)
+                if self.snapshot:
+                    # use the cached identity now - the handshake is queued infront of all other commands anyway
+                    self.engine.name, self.engine.author = self.snapshot['name'], self.snapshot['author']
+                    for option in self.snapshot['options']:
+                        self.engine.options[option[0]] = chess.uci.Option(*option)
+                    self.engine.uci(async_callback=self._check_snapshot)
+                else:
+                    self.engine.uci()
+                    if not hostname:
+                        write_uci_snapshot(file, self.engine.name, self.engine.author, self.engine.options.values())
             else:
                 logging.error('engine executable [%s] not found', file)
             self.options = {}
+            self.engine_values = {}  # option values the engine is using (beside its defaults)
+            self.level_options = set()
             self.future = None
             self.show_best = True
+            self.go_limits = {}  # nodes & depth of a weak level
+            self.turn = None
+            self.go_start = None
+            self.think_time = None  # secs a timed search would take => delay the best move of a limited search
+            self.delay_timer = None
+            self.delay_lock = Lock()
+            self.cpu_saved = 0.0
 
             self.res = None
+            self.trace_id = None  # trace of the input which started the search
             self.level_support = False
-            self.installed_engines = read_engine_ini(self.shell, (file.rsplit(os.sep, 1))[0])
+            self.installed_engines = read_engine_ini(self.shell, (file.rsplit(os.sep, 1))[0],
+                                                     server=(hostname, username, port))
 
         except OSError:
             logging.exception('OS error in starting engine')
         except TypeError:
             logging.exception('engine executable not found')
 
+    def _check_snapshot(self, future):
+        try:
+            future.result()
+        except chess.uci.EngineTerminatedException:
+            logging.error('engine [%s] terminated during uci handshake', self.file)
+            return
+        options = [list(option) for option in self.engine.options.values()]
+        if self.engine.name != self.snapshot['name'] or options != self.snapshot['options']:
+            logging.warning('engine [%s] differs from its uci snapshot => updating it', self.file)
+            write_uci_snapshot(self.file, self.engine.name, self.engine.author, self.engine.options.values())
+        logging.debug('engine [%s] handshake verified after %.3f secs', self.file, time.monotonic() - self.launched)
+
     def get_name(self):
         """Get engine name."""
         return self.engine.name
@@ -85,13 +130,32 @@ class UciEngine(object):
         """Set OptionName with value."""
         self.options[name] = value
 
+    def _engine_value(self, name):
+        if name in self.engine_values:
+            return self.engine_values[name]
+        option = self.engine.options.get(name)
+        return None if option is None else option.default
+
+    @staticmethod
+    def _same_value(old, new):
+        if isinstance(old, bool) or isinstance(new, bool):
+            return str(old).lower() == str(new).lower()
+        return str(old) == str(new)
+
     def send(self):
-        """Send options to engine."""
-        self.engine.setoption(self.options)
+        """Send the options to the engine - only those the engine isn't already using."""
+        changed = {name: value for name, value in self.options.items()
+                   if not self._same_value(self._engine_value(name), value)}
+        logging.debug('sending %i of %i options', len(changed), len(self.options))
+        if changed:
+            self.engine.setoption(changed)
+            self.engine_values.update(changed)
 
     def level(self, options: dict):
         """Set options."""
-        self.options = options
+        self.go_limits = {name[len(GO_PREFIX):]: int(value) for name, value in options.items()
+                          if name.lower().startswith(GO_PREFIX)}
+        self.options = {name: value for name, value in options.items() if not name.lower().startswith(GO_PREFIX)}
 
     def has_levels(self):
         """Return engine level support."""
@@ -132,10 +196,40 @@ class UciEngine(object):
 
     def position(self, game: Board):
         """Set position."""
+        self.turn = game.turn
         self.engine.position(game)
 
+    def has_hash_file(self):
+        """Return if the engine can save & load its hash (only used for local engines)."""
+        return self.shell is None and all(name in self.engine.options for name in HASH_FILE_OPTIONS)
+
+    def needs_restart(self, options: dict):
+        """Return if these options change the hash size or threads of the running engine."""
+        return any(name in options and not self._same_value(self._engine_value(name), options[name])
+                   for name in HASH_OPTIONS)
+
+    def _hash_file_option(self, button: str):
+        path = os.path.abspath(self.file) + '.hash'
+        if button == 'Load Hash from File' and not os.path.isfile(path):
+            return
+        start = time.monotonic()
+        self.engine.setoption({'Hash File': path, button: None})
+        logging.debug('engine [%s] %s [%s] took %.3f secs', self.file, button, path, time.monotonic() - start)
+
+    def set_resources(self, resources: dict):
+        """Set a new Threads/Hash share - a searching engine gets it with its next startup."""
+        changed = {name: value for name, value in resources.items()
+                   if name not in self.level_options and not self._same_value(self._engine_value(name), value)}
+        if changed and self.is_waiting():
+            logging.debug('engine [%s] rebalanced to %s', self.file, changed)
+            self.engine.setoption(changed)
+            self.engine_values.update(changed)
+
     def quit(self):
         """Quit engine."""
+        engine_resources.unregister(self)
+        if self.keep_hash and self.has_hash_file():
+            self._hash_file_option('Save Hash to File')
         if self.engine.quit():  # Ask nicely
             if self.engine.terminate():  # If you won't go nicely....
                 if self.engine.kill():  # Right that does it!
@@ -150,6 +244,12 @@ class UciEngine(object):
         """Stop engine."""
         logging.info('show_best old: %s new: %s', self.show_best, show_best)
         self.show_best = show_best
+        with self.delay_lock:
+            delay_timer, self.delay_timer = self.delay_timer, None
+        if delay_timer:
+            delay_timer.cancel()
+            self._fire_best()
+            return self.res
         if self.is_waiting():
             logging.info('engine already stopped')
             return self.res
@@ -159,30 +259,58 @@ class UciEngine(object):
             logging.error('Engine terminated')  # @todo find out, why this can happen!
         return self.future.result()
 
+    def _check_first_go(self):
+        if self.first_go is None:
+            self.first_go = time.monotonic() - self.launched
+            metrics.set('picochess_engine_first_go_seconds', self.first_go)
+            logging.info('engine [%s] first go after %.3f secs', self.file, self.first_go)
+
+    def _get_think_time(self, time_dict: dict):
+        """Return the secs a timed search would (roughly) take."""
+        if 'movetime' in time_dict:
+            return int(time_dict['movetime']) / 1000
+        side = 'w' if self.turn is None or self.turn else 'b'
+        time_left = int(time_dict.get(side + 'time', 0)) / 1000
+        moves_to_go = int(time_dict.get('movestogo', 30))
+        return min(time_left / max(moves_to_go, 1) + int(time_dict.get(side + 'inc', 0)) / 1000, time_left / 2)
+
     def go(self, time_dict: dict):
         """Go engine."""
+        self._check_first_go()
         self.show_best = True
+        self.think_time = None
+        if self.go_limits:  # weak level => a cheap search, but the user shouldnt notice it
+            self.think_time = self._get_think_time(time_dict)
+            time_dict = dict(self.go_limits)
         time_dict['async_callback'] = self.callback
 
         Observable.fire(Event.START_SEARCH())
+        self.trace_id = tracer.current()
+        self.go_start = time.monotonic()
         self.future = self.engine.go(**time_dict)
         return self.future
 
     def ponder(self):
         """Ponder engine."""
+        self._check_first_go()
         self.show_best = False
 
         Observable.fire(Event.START_SEARCH())
+        self.trace_id = tracer.current()
         self.future = self.engine.go(ponder=True, infinite=True, async_callback=self.callback)
         return self.future
 
     def brain(self, time_dict: dict):
         """Permanent brain."""
+        self._check_first_go()
         self.show_best = True
+        if self.go_limits:
+            time_dict = dict(self.go_limits)
         time_dict['ponder'] = True
         time_dict['async_callback'] = self.callback3
 
         Observable.fire(Event.START_SEARCH())
+        self.trace_id = tracer.current()
         self.future = self.engine.go(**time_dict)
         return self.future
 
@@ -194,12 +322,33 @@ class UciEngine(object):
 
     def callback(self, command):
         """Callback function."""
+        tracer.resume(self.trace_id, 'engine:bestmove')
         try:
             self.res = command.result()
         except chess.uci.EngineTerminatedException:
             logging.error('Engine terminated')  # @todo find out, why this can happen!
             self.show_best = False
         logging.info('res: %s', self.res)
+        if self.think_time and self.show_best and self.res:
+            searched = time.monotonic() - self.go_start
+            saved = max(self.think_time - searched, 0) * int(self._engine_value('Threads') or 1)
+            self.cpu_saved += saved
+            metrics.inc('picochess_engine_cpu_saved_seconds_total', saved)
+            with self.delay_lock:
+                if self.think_time > searched:
+                    self.delay_timer = Timer(self.think_time - searched, self._delayed_best)
+                    self.delay_timer.start()
+                    return
+        self._fire_best()
+
+    def _delayed_best(self):
+        with self.delay_lock:
+            if self.delay_timer is None:  # stopped meanwhile
+                return
+            self.delay_timer = None
+        self._fire_best()
+
+    def _fire_best(self):
         Observable.fire(Event.STOP_SEARCH())
         if self.show_best and self.res:
             Observable.fire(Event.BEST_MOVE(move=self.res.bestmove, ponder=self.res.ponder, inbook=False))
@@ -208,6 +357,7 @@ class UciEngine(object):
 
     def callback3(self, command):
         """Callback function."""
+        tracer.resume(self.trace_id, 'engine:bestmove')
         try:
             self.res = command.result()
         except chess.uci.EngineTerminatedException:
@@ -222,7 +372,7 @@ class UciEngine(object):
 
     def is_thinking(self):
         """Engine thinking."""
-        return not self.engine.idle and not self.engine.pondering
+        return self.delay_timer is not None or (not self.engine.idle and not self.engine.pondering)
 
     def is_pondering(self):
         """Engine pondering."""
@@ -230,11 +380,20 @@ class UciEngine(object):
 
     def is_waiting(self):
         """Engine waiting."""
-        return self.engine.idle
+        return self.engine.idle and self.delay_timer is None
 
     def newgame(self, game: Board):
         """Engine sometimes need this to setup internal values."""
-        self.engine.ucinewgame()
+        if self.cpu_saved:
+            logging.info('engine [%s] level limits saved %.1f cpu secs last game', self.file, self.cpu_saved)
+            self.cpu_saved = 0.0
+        uci960 = self._engine_value('UCI_Chess960')
+        if self.keep_hash and self.newgame_sent and self._same_value(self.newgame_960, uci960):
+            logging.debug('keeping the engine hash - no ucinewgame')
+        else:  # the first game or a changed variant always needs a ucinewgame
+            self.engine.ucinewgame()
+            self.newgame_sent = True
+            self.newgame_960 = uci960
         self.engine.position(game)
 
     def startup(self, options: dict, show=True):
@@ -244,10 +403,21 @@ class UciEngine(object):
         if not options and parser.read(self.get_file() + '.uci'):
             options = dict(parser[parser.sections().pop()])
         self.level_support = bool(options)
+        self.level_options = set(options)  # these are given by the user, the resource manager keeps them
+        if self.shell is None:  # remote engines use the resources of their own host
+            engine_resources.register(self)
+            options = dict(options)
+            for name, value in engine_resources.get_options(self.engine.options).items():
+                options.setdefault(name, value)
 
         logging.debug('setting engine with options %s', options)
         self.level(options)
         self.send()
+        if self.keep_hash and not self.newgame_sent:
+            if 'NeverClearHash' in self.engine.options:
+                self.engine.setoption({'NeverClearHash': True})
+            if self.has_hash_file():
+                self._hash_file_option('Load Hash from File')
         self.newgame(Board())
         if show:
             logging.debug('Loaded engine [%s]', self.get_name())
@@ -17,7 +17,7 @@
 
 from threading import Timer
 
-from utilities import Observable
+from utilities import Observable, metrics
 from dgt.api import Event
 import chess.uci
 
@@ -86,6 +86,12 @@ class Informer(chess.uci.InfoHandler):
 
     def depth(self, dep):
         """Engine sends DEPTH."""
+        metrics.set('picochess_engine_depth', dep)
         if self._allow_fire_depth():
             Observable.fire(Event.NEW_DEPTH(depth=dep))
         super().depth(dep)
+
+    def nps(self, nps):
+        """Engine sends NPS."""
+        metrics.set('picochess_engine_nps', nps)
+        super().nps(nps)
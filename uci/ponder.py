@@ -0,0 +1,194 @@
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import time
+import atexit
+from functools import partial
+from threading import Thread, Lock
+
+import chess
+import chess.uci
+from dgt.api import Event
+from utilities import Observable, metrics
+from uci.engine import UciEngine
+from uci.informer import Informer
+
+
+class PonderPool(object):
+
+    """Ponder on more user replies than the ponder move with extra (local) engines in BRAIN mode."""
+
+    def __init__(self, size: int, candidate_time=200):
+        super(PonderPool, self).__init__()
+        self.size = size  # number of extra engines = extra user replies beside the ponder move
+        self.candidate_time = candidate_time  # msecs of the multipv search finding the user replies
+        self.file = None
+        self.options = None
+        self.engines = []
+        self.lock = Lock()
+        self.generation = 0  # a newer start() or stop() invalidates a running _start()
+        self.searches = {}  # user reply => (extra engine pondering on it, generation of its search)
+        self.promoted = None  # (extra engine, generation) doing the live search - until its bestmove arrived
+        self.show_best = False  # fire the bestmove of the promoted engine
+        self.ponder_start = None
+        self.stats = {'main': 0, 'extra': 0, 'miss': 0, 'saved': 0.0}
+        atexit.register(self.quit)
+
+    def _launch(self, engine: UciEngine):
+        for helper in self.engines:  # start() already stopped them
+            helper.quit()
+        self.engines = []
+        self.file = engine.get_file()
+        self.options = {name: engine.options[name] for name in engine.level_options if name in engine.options}
+        for _ in range(self.size):
+            helper = UciEngine(self.file, informer=False)
+            if not helper.engine:
+                break
+            helper.startup(dict(self.options), show=False)
+            self.engines.append(helper)
+        logging.debug('started %i extra engines [%s] for pondering', len(self.engines), self.file)
+
+    def quit(self):
+        """Quit the extra engines."""
+        self.stop()
+        for helper in self.engines:
+            helper.quit()
+        self.engines = []
+
+    def _get_candidates(self, game: chess.Board, pb_move: chess.Move):
+        helper = self.engines[0]
+        handler = chess.uci.InfoHandler()
+        helper.engine.info_handlers.append(handler)
+        multipv = 'MultiPV' in helper.engine.options
+        if multipv:
+            helper.engine.setoption({'MultiPV': len(self.engines) + 1})
+        helper.position(game)
+        res = helper.engine.go(movetime=self.candidate_time)
+        if multipv:
+            helper.engine.setoption({'MultiPV': 1})
+        helper.engine.info_handlers.remove(handler)
+        with handler:
+            moves = [pv[0] for _, pv in sorted(handler.info['pv'].items()) if pv]
+        if not moves and res.bestmove:
+            moves = [res.bestmove]
+        return [move for move in moves if move != pb_move and game.is_legal(move)][:len(self.engines)]
+
+    def start(self, engine: UciEngine, game: chess.Board, pb_move: chess.Move, time_dict: dict):
+        """Ponder on the best user replies (beside the ponder move of the main engine)."""
+        if not self.size or engine.shell is not None:  # remote engines have no extra processes
+            return
+        self.stop()
+        with self.lock:
+            generation = self.generation
+        self.ponder_start = time.monotonic()
+        Thread(target=self._start, args=(generation, engine, game.copy(), pb_move, dict(time_dict)),
+               daemon=True).start()
+
+    def _start(self, generation: int, engine: UciEngine, game: chess.Board, pb_move: chess.Move, time_dict: dict):
+        options = {name: engine.options[name] for name in engine.level_options if name in engine.options}
+        if engine.get_file() != self.file or options != self.options:
+            self._launch(engine)
+        if not self.engines:
+            return
+        if engine.go_limits:  # a weak level searches (like the main engine) by its nodes & depth only
+            time_dict = dict(engine.go_limits)
+        candidates = self._get_candidates(game, pb_move)
+        with self.lock:
+            if generation != self.generation:
+                return
+            for helper, move in zip(self.engines, candidates):
+                game_copy = game.copy()
+                game_copy.push(move)
+                helper.position(game_copy)
+                helper.engine.go(ponder=True, async_callback=partial(self._callback, helper, generation), **time_dict)
+                self.searches[move] = (helper, generation)
+        logging.debug('extra engines pondering on %s', [move.uci() for move in candidates])
+
+    def check(self, move: chess.Move, pb_move: chess.Move):
+        """Count the user reply and return if an extra engine pondered on it."""
+        if not self.size or self.ponder_start is None:
+            return False
+        with self.lock:
+            extra = move != pb_move and move in self.searches
+        result = 'main' if move == pb_move else ('extra' if extra else 'miss')
+        self.stats[result] += 1
+        metrics.inc('picochess_ponder_total', result=result)
+        if result != 'miss':
+            saved = time.monotonic() - self.ponder_start
+            self.stats['saved'] += saved
+            metrics.observe('picochess_ponder_saved_seconds', saved)
+        self.ponder_start = None
+        return extra
+
+    def hit(self, move: chess.Move):
+        """Promote the search on this user reply to the live search and stop the others."""
+        with self.lock:
+            self.generation += 1
+            promoted = self.promoted = self.searches.pop(move, None)
+            self.show_best = True
+            searches, self.searches = self.searches, {}
+        for helper, _ in searches.values():
+            helper.engine.stop()
+        if promoted:
+            logging.info('extra engine pondered on [%s] => ponderhit', move)
+            helper = promoted[0]
+            helper.engine.info_handlers.append(Informer())
+            Observable.fire(Event.START_SEARCH())
+            helper.engine.ponderhit()
+
+    def is_thinking(self):
+        """Return if an extra engine does the live search (till its bestmove arrived)."""
+        with self.lock:
+            return self.promoted is not None
+
+    def _callback(self, helper: UciEngine, generation: int, command):
+        with self.lock:
+            if self.promoted != (helper, generation):
+                return
+            self.promoted = None
+            show_best = self.show_best
+        helper.engine.info_handlers.clear()
+        try:
+            res = command.result()
+        except chess.uci.EngineTerminatedException:
+            logging.error('extra engine terminated')
+            res = None
+        Observable.fire(Event.STOP_SEARCH())
+        if show_best and res and res.bestmove:
+            Observable.fire(Event.BEST_MOVE(move=res.bestmove, ponder=res.ponder, inbook=False))
+        else:
+            logging.info('event best_move not fired')
+
+    def stop(self, show_best=False):
+        """Stop all extra searches - the live one fires its bestmove if show_best is given (like UciEngine.stop)."""
+        with self.lock:
+            self.generation += 1
+            searches = [helper for helper, _ in self.searches.values()]
+            self.searches = {}
+            if self.promoted:  # it stays promoted till its bestmove arrived
+                self.show_best = show_best
+                searches.append(self.promoted[0])
+        for helper in searches:
+            helper.engine.stop()
+
+    def new_game(self):
+        """Log the results of the last game and reset them."""
+        if self.size and (self.stats['main'] or self.stats['extra'] or self.stats['miss']):
+            logging.info('ponder results main hits: %i extra hits: %i misses: %i saved: %.1f secs',
+                         self.stats['main'], self.stats['extra'], self.stats['miss'], self.stats['saved'])
+        self.stats = {'main': 0, 'extra': 0, 'miss': 0, 'saved': 0.0}
@@ -18,31 +18,108 @@
 import platform
 import configparser
 import os
+import time
+import json
+import copy
+import logging
+from threading import Lock
 from dgt.api import Dgt
 
+remote_ttl = 300  # secs a remote engines.ini (and its uci files) is kept in cache
+remote_cache = {}  # (server, engine_path) => (timestamp, library) - the server stays the same after a reconnect
+remote_lock = Lock()
+local_cache = {}  # engine_path => (signature of engines.ini & uci files, library)
+
+SNAPSHOT_FILE = 'uci_cache.json'  # uci identity & options of the engine binaries in an engine folder
+
+
+def _file_signature(filename: str):
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime]
+
+
+def _folder_signature(engine_path: str):
+    try:
+        return sorted((entry.name, entry.stat().st_mtime) for entry in os.scandir(engine_path)
+                      if entry.name == 'engines.ini' or entry.name.endswith('.uci'))
+    except OSError:
+        return None
+
+
+def _read_snapshots(engine_path: str):
+    try:
+        with open(os.path.join(engine_path, SNAPSHOT_FILE)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def read_uci_snapshot(filename: str):
+    """Return the cached uci identity {name, author, options} of an engine binary - None if unknown or changed."""
+    filename = os.path.abspath(filename)
+    try:
+        signature = _file_signature(filename)
+    except OSError:
+        return None
+    snapshot = _read_snapshots(os.path.dirname(filename)).get(os.path.basename(filename))
+    if snapshot and snapshot['signature'] == signature:
+        return snapshot
+    return None
+
+
+def write_uci_snapshot(filename: str, name: str, author: str, options: list):
+    """Store the uci identity of an engine binary - options is a list of chess.uci.Option."""
+    filename = os.path.abspath(filename)
+    engine_path = os.path.dirname(filename)
+    try:
+        snapshots = _read_snapshots(engine_path)
+        snapshots[os.path.basename(filename)] = {'signature': _file_signature(filename), 'name': name,
+                                                 'author': author, 'options': [list(option) for option in options]}
+        with open(os.path.join(engine_path, SNAPSHOT_FILE), 'w') as file:
+            json.dump(snapshots, file)
+    except OSError as error:
+        logging.warning('uci snapshot of [%s] not written: %s', filename, error)
+
+
+def _read_config(config: configparser.ConfigParser, engine_shell, filename: str):
+    """Read a config file local or from the remote server. Return True on success."""
+    if engine_shell is None:
+        return bool(config.read(filename))
+    try:
+        with engine_shell.open(filename, 'r') as file:
+            config.read_file(file)
+    except (FileNotFoundError, IOError):
+        return False
+    return True
+
+
+def read_engine_ini(engine_shell=None, engine_path=None, server=None):
+    """Read engine.ini and creates a library list out of it - server is (hostname, username, port) of the shell."""
+    if engine_shell is not None:
+        with remote_lock:
+            cached = remote_cache.get((server, engine_path))
+        if cached and time.time() - cached[0] < remote_ttl:
+            return copy.deepcopy(cached[1])  # the caller may change its library
 
-def read_engine_ini(engine_shell=None, engine_path=None):
-    """Read engine.ini and creates a library list out of it."""
     config = configparser.ConfigParser()
     config.optionxform = str
-    try:
-        if engine_shell is None:
-            if not engine_path:
-                program_path = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
-                engine_path = program_path + os.sep + 'engines' + os.sep + platform.machine()
-            config.read(engine_path + os.sep + 'engines.ini')
-        else:
-            with engine_shell.open(engine_path + os.sep + 'engines.ini', 'r') as file:
-                config.read_file(file)
-    except FileNotFoundError:
-        pass
+    if engine_shell is None and not engine_path:
+        program_path = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+        engine_path = program_path + os.sep + 'engines' + os.sep + platform.machine()
+    signature = None
+    if engine_shell is None:  # a local library stays valid till engines.ini or an uci file changes
+        signature = _folder_signature(engine_path)
+        cached = local_cache.get(engine_path)
+        if signature and cached and cached[0] == signature:
+            return copy.deepcopy(cached[1])
+    _read_config(config, engine_shell, engine_path + os.sep + 'engines.ini')
 
     library = []
     for section in config.sections():
         parser = configparser.ConfigParser()
         parser.optionxform = str
         level_dict = {}
-        if parser.read(engine_path + os.sep + section + '.uci'):
+        if _read_config(parser, engine_shell, engine_path + os.sep + section + '.uci'):
             for p_section in parser.sections():
                 level_dict[p_section] = {}
                 for option in parser.options(p_section):
@@ -59,4 +136,9 @@ def read_engine_ini(engine_shell=None, engine_path=None):
                 'elo': confsect['elo']
             }
         )
+    if engine_shell is not None:
+        with remote_lock:
+            remote_cache[(server, engine_path)] = (time.time(), copy.deepcopy(library))
+    elif signature:
+        local_cache[engine_path] = (signature, copy.deepcopy(library))
     return library
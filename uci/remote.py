@@ -0,0 +1,122 @@
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import atexit
+import logging
+import time
+from threading import Lock
+
+from utilities import metrics
+
+
+class SshPool(object):
+
+    """Keep one persistent ssh connection per remote engine server."""
+
+    keepalive = 30  # secs between two ssh keepalive packets
+    shells = {}  # (hostname, username) => spur.SshShell
+    stats = {}  # (hostname, username) => dict with connects, reconnects and the handshake times
+    lock = Lock()
+
+    def __init__(self):
+        super(SshPool, self).__init__()
+
+    @staticmethod
+    def _is_alive(shell):
+        import spur  # spur & paramiko are slow to import - only load them for remote engines
+        try:
+            transport = shell._get_ssh_transport()  # spur connects lazy, this also does the first handshake
+        except spur.ssh.ConnectionError:
+            return False
+        return transport is not None and transport.is_active()
+
+    @classmethod
+    def _connect(cls, key, hostname: str, username: str, key_file: str, password: str):
+        import spur
+        import paramiko
+        if key_file:
+            shell = spur.SshShell(hostname=hostname, username=username, private_key_file=key_file,
+                                  missing_host_key=paramiko.AutoAddPolicy())
+        else:
+            shell = spur.SshShell(hostname=hostname, username=username, password=password,
+                                  missing_host_key=paramiko.AutoAddPolicy())
+        start = time.time()
+        if not cls._is_alive(shell):
+            logging.error('ssh handshake to [%s] failed', hostname)
+            shell.close()
+            return None
+        handshake = time.time() - start
+        shell._get_ssh_transport().set_keepalive(cls.keepalive)
+
+        stat = cls.stats.setdefault(key, {'connects': 0, 'reconnects': 0, 'handshake': 0.0, 'handshake_max': 0.0})
+        stat['connects'] += 1
+        stat['handshake'] = handshake
+        stat['handshake_max'] = max(stat['handshake_max'], handshake)
+        logging.info('ssh handshake to [%s] took %.3f secs', hostname, handshake)
+        return shell
+
+    @classmethod
+    def get_shell(cls, hostname: str, username=None, key_file=None, password=None):
+        """Return a connected shell for the server - reuse the existing connection or reconnect a dropped one."""
+        key = (hostname, username)
+        with cls.lock:
+            shell = cls.shells.get(key)
+            if shell:
+                if cls._is_alive(shell):
+                    logging.debug('reusing ssh connection to [%s]', hostname)
+                    return shell
+                logging.warning('ssh connection to [%s] dropped => reconnecting', hostname)
+                shell.close()
+                del cls.shells[key]
+                start = time.time()
+                shell = cls._connect(key, hostname, username, key_file, password)
+                if shell:
+                    cls.stats[key]['reconnects'] += 1
+                    logging.info('ssh reconnect to [%s] took %.3f secs', hostname, time.time() - start)
+            else:
+                logging.info('connecting to [%s]', hostname)
+                shell = cls._connect(key, hostname, username, key_file, password)
+            if shell:
+                cls.shells[key] = shell
+            return shell
+
+    @classmethod
+    def get_stats(cls):
+        """Return the connection statistics of all servers."""
+        with cls.lock:
+            return {key: stat.copy() for key, stat in cls.stats.items()}
+
+    @classmethod
+    def get_gauges(cls):
+        """Return the connection statistics as metric gauges."""
+        return [('picochess_ssh_' + name, {'host': hostname, 'user': username or ''}, value)
+                for (hostname, username), stat in cls.get_stats().items() for name, value in stat.items()]
+
+    @classmethod
+    def close_all(cls):
+        """Close all ssh connections."""
+        for (hostname, _), stat in cls.get_stats().items():
+            logging.info('ssh to [%s]: %i connects, %i reconnects, handshake %.3f secs (max %.3f)', hostname,
+                         stat['connects'], stat['reconnects'], stat['handshake'], stat['handshake_max'])
+        with cls.lock:
+            for shell in cls.shells.values():
+                shell.close()
+            cls.shells = {}
+
+
+metrics.add_collector(SshPool.get_gauges)
+atexit.register(SshPool.close_all)
@@ -0,0 +1,99 @@
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import logging
+from threading import Lock
+
+
+class EngineResources(object):
+
+    """Share the cpu cores and the memory of the host between the running (local) engines."""
+
+    def __init__(self):
+        super(EngineResources, self).__init__()
+        self.reserve_cores = 1  # left for web server, talker & picochess itself
+        self.memory_share = 25  # percent of the available memory used for the engine hashes (0 = engine default)
+        self.cores = None
+        self.memory = None  # MB available at startup - measured once, the hashes allocated later would count
+        self.engines = []
+        self.lock = Lock()
+
+    def configure(self, reserve_cores: int, memory_share: int):
+        """Set the budget and measure the host."""
+        self.reserve_cores = reserve_cores
+        self.memory_share = memory_share
+        self.cores = max(1, (os.cpu_count() or 1) - reserve_cores)
+        self.memory = self.get_available_memory()
+        logging.debug('engine budget: %i cores %s MB (%i%% of available)', self.cores, self.memory, memory_share)
+
+    @staticmethod
+    def get_available_memory():
+        """Return the available memory in MB (None if unknown)."""
+        try:
+            with open('/proc/meminfo') as meminfo:
+                for line in meminfo:
+                    if line.startswith('MemAvailable:'):
+                        return int(line.split()[1]) // 1024
+        except (OSError, ValueError, IndexError):
+            pass
+        return None
+
+    @staticmethod
+    def _clamp(value: int, option):
+        if option.min is not None:
+            value = max(value, option.min)
+        if option.max is not None:
+            value = min(value, option.max)
+        return value
+
+    def get_options(self, engine_options, jobs=None):
+        """Return the Threads & Hash values for one of the (jobs) engines - only for options the engine has."""
+        if self.cores is None:
+            self.configure(self.reserve_cores, self.memory_share)
+        jobs = max(1, jobs or len(self.engines))
+        options = {}
+        if 'Threads' in engine_options:
+            options['Threads'] = self._clamp(max(1, self.cores // jobs), engine_options['Threads'])
+        if 'Hash' in engine_options and self.memory and self.memory_share:
+            hash_mb = max(1, self.memory * self.memory_share // 100 // jobs)
+            hash_mb = 1 << (hash_mb.bit_length() - 1)  # engines prefer a power of 2
+            options['Hash'] = self._clamp(hash_mb, engine_options['Hash'])
+        return options
+
+    def register(self, engine):
+        """Add an engine and give the others their new (smaller) share."""
+        with self.lock:
+            if engine not in self.engines:
+                self.engines.append(engine)
+            others = [other for other in self.engines if other is not engine]
+        self._rebalance(others)
+
+    def unregister(self, engine):
+        """Remove an engine and give the others their new (bigger) share."""
+        with self.lock:
+            if engine in self.engines:
+                self.engines.remove(engine)
+            others = list(self.engines)
+        self._rebalance(others)
+
+    def _rebalance(self, engines: list):
+        for engine in engines:
+            engine.set_resources(self.get_options(engine.get_options()))
+
+
+engine_resources = EngineResources()
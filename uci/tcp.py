@@ -0,0 +1,475 @@
+# Copyright (C) 2013-2017 Jean-Francois Romang (jromang@posteo.de)
+#                         Shivkumar Shivaji ()
+#                         Jürgen Précour (LocutusOfPenguin@posteo.de)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import os
+import re
+import socket
+import socketserver
+import struct
+import logging
+import itertools
+import queue
+import subprocess
+from threading import Thread, Lock, Event
+
+# Frame layout: type (1 byte), session id (4 bytes), payload length (4 bytes), payload (utf-8)
+FRAME_HEADER = struct.Struct('>BII')
+
+FRAME_OPEN = 0x01  # client => server: start a session for the engine named in the payload
+FRAME_OPENED = 0x02  # server => client: session is ready
+FRAME_LINE = 0x03  # both directions: one uci line
+FRAME_INFO = 0x04  # server => client: one uci "info" line (the info channel)
+FRAME_CLOSE = 0x05  # both directions: session is finished
+FRAME_FILE = 0x06  # client => server: ask for a .ini/.uci file | server => client: its content
+FRAME_ERROR = 0x07  # server => client: request failed, payload is the reason
+
+FRAME_ANSWERS = (FRAME_OPENED, FRAME_FILE, FRAME_ERROR)  # frames answering a request
+
+option_line = re.compile(r'option name (.+?) type (\S+)(?: default ?(.*?))?(?= min | max | var |$)')
+
+
+def send_frame(sock: socket.socket, lock: Lock, frame_type: int, session: int, payload=''):
+    """Send one frame over the socket."""
+    data = payload.encode('utf-8')
+    with lock:
+        sock.sendall(FRAME_HEADER.pack(frame_type, session, len(data)) + data)
+
+
+def recv_frame(sock: socket.socket):
+    """Receive one frame from the socket. Return None if the connection is closed."""
+    def _recv_all(length: int):
+        data = b''
+        while len(data) < length:
+            chunk = sock.recv(length - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    header = _recv_all(FRAME_HEADER.size)
+    if header is None:
+        return None
+    frame_type, session, length = FRAME_HEADER.unpack(header)
+    payload = _recv_all(length) if length else b''
+    if payload is None:
+        return None
+    return frame_type, session, payload.decode('utf-8', errors='replace')
+
+
+class ServerEngine(object):
+
+    """A local engine process owned by the engine server, reusable by several sessions one after another."""
+
+    def __init__(self, name: str, path: str, timeout=5):
+        super(ServerEngine, self).__init__()
+        self.name = name
+        self.timeout = timeout  # secs to wait for the engine answers (uciok, bestmove, readyok)
+        self.process = subprocess.Popen([path], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL, bufsize=1, universal_newlines=True)
+        self.sink = None  # function(frame_type, line) of the current session, None while idle
+        self.lock = Lock()
+        self.defaults = {}  # option name => default value (buttons have none)
+        self.changed = set()  # names of the options a session did set
+        self.uciok = Event()
+        self.readyok = Event()
+        self.bestmove = Event()  # cleared while a search runs
+        self.bestmove.set()
+        Thread(target=self._read_forever, daemon=True).start()
+        self._write('uci')  # learn the option defaults for resetting the engine after a session
+        if not self.uciok.wait(timeout):
+            logging.warning('engine [%s] sent no uciok', name)
+
+    def _read_forever(self):
+        for line in self.process.stdout:
+            line = line.rstrip()
+            self._track(line)
+            with self.lock:
+                sink = self.sink
+            if sink:
+                sink(FRAME_INFO if line.startswith('info') else FRAME_LINE, line)
+        logging.info('engine [%s] terminated', self.name)
+        with self.lock:
+            sink = self.sink
+            self.sink = None
+        if sink:
+            sink(FRAME_CLOSE, '')
+
+    def _track(self, line: str):
+        if False:  # switch-case
+            pass
+        elif line.startswith('bestmove'):
+            self.bestmove.set()
+        elif line == 'readyok':
+            self.readyok.set()
+        elif line == 'uciok':
+            self.uciok.set()
+        elif line.startswith('option') and not self.uciok.is_set():
+            match = option_line.match(line)
+            if match and match.group(3) is not None:
+                self.defaults[match.group(1)] = match.group(3)
+
+    def is_alive(self):
+        """Return if the engine process still runs."""
+        return self.process.poll() is None
+
+    def attach(self, sink):
+        """Route the engine output to the given session."""
+        with self.lock:
+            self.sink = sink
+
+    def detach(self):
+        """Stop routing the engine output."""
+        with self.lock:
+            self.sink = None
+
+    def reset(self):
+        """Bring the engine back into its start state: no search, a new game & the option defaults."""
+        if not self.bestmove.is_set():
+            self._write('stop')
+            if not self.bestmove.wait(self.timeout):
+                logging.warning('engine [%s] sent no bestmove after stop', self.name)
+                return False
+        self._write('ucinewgame')
+        for name in sorted(self.changed):
+            if name in self.defaults:
+                self._write('setoption name {} value {}'.format(name, self.defaults[name]))
+        self.changed = set()
+        self.readyok.clear()
+        self._write('isready')
+        if not self.readyok.wait(self.timeout):
+            logging.warning('engine [%s] sent no readyok after the reset', self.name)
+            return False
+        return True
+
+    def _write(self, line: str):
+        try:
+            self.process.stdin.write(line + '\n')
+            self.process.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            logging.warning('engine [%s] not reachable', self.name)
+
+    def send_line(self, line: str):
+        """Send a line of the session to the engine."""
+        if line.startswith('go'):
+            self.bestmove.clear()
+        elif line.startswith('setoption name '):
+            self.changed.add(line[len('setoption name '):].split(' value ')[0].strip())
+        self._write(line)
+
+    def quit(self):
+        """Terminate the engine process."""
+        self._write('quit')
+        try:
+            self.process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+class EngineServerHandler(socketserver.BaseRequestHandler):
+
+    """Handle one client connection with its (multiplexed) sessions."""
+
+    def setup(self):
+        self.write_lock = Lock()
+        self.sessions = {}  # session id => ServerEngine
+
+    def _send(self, frame_type: int, session: int, payload=''):
+        try:
+            send_frame(self.request, self.write_lock, frame_type, session, payload)
+        except OSError:
+            logging.debug('client gone - frame for session %i dropped', session)
+
+    def _sink(self, session: int):
+        def _forward(frame_type, line):
+            if frame_type == FRAME_CLOSE:
+                self.sessions.pop(session, None)
+            self._send(frame_type, session, line)
+        return _forward
+
+    def _close_session(self, session: int):
+        engine = self.sessions.pop(session, None)
+        if engine:
+            engine.detach()
+            self.server.release(engine)
+
+    def handle(self):
+        logging.info('client %s connected', self.client_address)
+        while True:
+            try:
+                frame = recv_frame(self.request)
+            except OSError:
+                frame = None
+            if frame is None:
+                break
+            frame_type, session, payload = frame
+            if frame_type == FRAME_LINE:
+                engine = self.sessions.get(session)
+                if engine is None:
+                    self._send(FRAME_ERROR, session, 'unknown session')
+                elif payload.strip() == 'quit':  # dont kill a pooled engine - just end the session
+                    self._close_session(session)
+                    self._send(FRAME_CLOSE, session)
+                else:
+                    engine.send_line(payload)
+            elif frame_type == FRAME_OPEN:
+                engine = self.server.acquire(payload)
+                if engine:
+                    self.sessions[session] = engine
+                    engine.attach(self._sink(session))
+                    self._send(FRAME_OPENED, session)
+                else:
+                    self._send(FRAME_ERROR, session, 'engine not found')
+            elif frame_type == FRAME_CLOSE:
+                self._close_session(session)
+            elif frame_type == FRAME_FILE:
+                content = self.server.read_file(payload)
+                if content is None:
+                    self._send(FRAME_ERROR, session, 'file not found')
+                else:
+                    self._send(FRAME_FILE, session, content)
+            else:
+                logging.warning('unknown frame type %i', frame_type)
+
+    def finish(self):
+        for session in list(self.sessions):
+            self._close_session(session)
+        logging.info('client %s disconnected', self.client_address)
+
+
+class EngineServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+
+    """Serve the engines of an engine folder over tcp."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port: int, engine_path: str, max_idle=2):
+        super(EngineServer, self).__init__(('', port), EngineServerHandler)
+        self.engine_path = engine_path
+        self.max_idle = max_idle  # idle processes kept per engine
+        self.idle = {}  # engine name => list of idle ServerEngine
+        self.pool_lock = Lock()
+
+    def _local_path(self, name: str):
+        """Return the path of a file inside the engine folder or None if the name isnt a plain file name."""
+        name = os.path.basename(name)
+        if not name or name.startswith('.'):
+            return None
+        return os.path.join(self.engine_path, name)
+
+    def acquire(self, name: str):
+        """Return an idle engine or start a new one."""
+        path = self._local_path(name)
+        if path is None or not (os.path.isfile(path) and os.access(path, os.X_OK)):
+            logging.warning('engine [%s] not found', name)
+            return None
+        name = os.path.basename(name)
+        with self.pool_lock:
+            engines = self.idle.get(name, [])
+            while engines:
+                engine = engines.pop()
+                if engine.is_alive():
+                    logging.debug('reusing engine [%s]', name)
+                    return engine
+        logging.info('starting engine [%s]', name)
+        try:
+            return ServerEngine(name, path)
+        except OSError:
+            logging.exception('engine [%s] failed to start', name)
+            return None
+
+    def release(self, engine: ServerEngine):
+        """Reset the engine and put it back into the idle pool."""
+        if not engine.is_alive():
+            return
+        if not engine.reset():
+            engine.quit()
+            return
+        with self.pool_lock:
+            engines = self.idle.setdefault(engine.name, [])
+            if len(engines) < self.max_idle:
+                engines.append(engine)
+                return
+        engine.quit()
+
+    def read_file(self, name: str):
+        """Return the content of an engines.ini or .uci file."""
+        path = self._local_path(name)
+        if path is None or not (path.endswith('.ini') or path.endswith('.uci')):
+            return None
+        try:
+            with open(path, 'r') as file:
+                return file.read()
+        except OSError:
+            return None
+
+
+class TcpConnection(object):
+
+    """Client side of a (shared) connection towards an engine server."""
+
+    connections = {}  # (hostname, port) => TcpConnection
+    lock = Lock()
+
+    def __init__(self, hostname: str, port: int):
+        super(TcpConnection, self).__init__()
+        self.hostname = hostname
+        self.port = port
+        self.sock = socket.create_connection((hostname, port), timeout=10)
+        self.sock.settimeout(None)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.write_lock = Lock()
+        self.handlers = {}  # session id => TcpProcess
+        self.answers = {}  # session id => queue.Queue of a request waiting for its answer
+        self.session_ids = itertools.count(1)
+        self.alive = True
+        Thread(target=self._read_forever, daemon=True).start()
+
+    @classmethod
+    def get(cls, hostname: str, port: int):
+        """Return the shared connection to the server."""
+        with cls.lock:
+            conn = cls.connections.get((hostname, port))
+            if conn is None or not conn.alive:
+                logging.info('connecting to engine server [%s:%i]', hostname, port)
+                conn = cls.connections[(hostname, port)] = TcpConnection(hostname, port)
+            return conn
+
+    def _read_forever(self):
+        while True:
+            try:
+                frame = recv_frame(self.sock)
+            except OSError:
+                frame = None
+            if frame is None:
+                break
+            frame_type, session, payload = frame
+            answer = self.answers.pop(session, None) if frame_type in FRAME_ANSWERS else None
+            handler = self.handlers.get(session)
+            if answer:
+                answer.put((frame_type, payload))
+            elif handler:
+                handler.on_frame(frame_type, payload)
+            else:
+                logging.debug('frame for unknown session %i ignored', session)
+        logging.warning('engine server [%s:%i] connection closed', self.hostname, self.port)
+        self.alive = False
+        for answer in list(self.answers.values()):
+            answer.put((FRAME_ERROR, 'connection closed'))
+        for handler in list(self.handlers.values()):
+            handler.on_frame(FRAME_CLOSE, '')
+        self.answers = {}
+        self.handlers = {}
+
+    def send(self, frame_type: int, session: int, payload=''):
+        """Send a frame to the server."""
+        send_frame(self.sock, self.write_lock, frame_type, session, payload)
+
+    def request(self, frame_type: int, payload: str, handler=None, timeout=10):
+        """Send a request frame on a new session and wait for its answer."""
+        session = next(self.session_ids)
+        answer = queue.Queue()
+        self.answers[session] = answer
+        if handler:  # registered before sending - the engine lines can follow the answer at once
+            self.handlers[session] = handler
+        try:
+            self.send(frame_type, session, payload)
+            result = answer.get(timeout=timeout)
+        except (OSError, queue.Empty):
+            result = (FRAME_ERROR, 'no answer')
+        self.answers.pop(session, None)
+        if result[0] != FRAME_OPENED:
+            self.handlers.pop(session, None)
+        return session, result
+
+    def release(self, session: int):
+        """Forget the session."""
+        self.handlers.pop(session, None)
+
+    def open(self, name: str, mode='r'):
+        """Read an engines.ini or .uci file from the server - same signature as spur's open()."""
+        session, (frame_type, payload) = self.request(FRAME_FILE, os.path.basename(name))
+        if frame_type != FRAME_FILE:
+            raise FileNotFoundError(name)
+        return io.StringIO(payload)
+
+
+class TcpProcess(object):
+
+    """A remote engine reached over tcp - has the same interface as the python-chess process classes."""
+
+    def __init__(self, engine, connection: TcpConnection, name: str):
+        self.engine = engine
+        self.connection = connection
+        self.name = name
+        self.alive = False
+
+        self.engine.on_process_spawned(self)
+        self.session, (frame_type, payload) = connection.request(FRAME_OPEN, name, handler=self)
+        if frame_type != FRAME_OPENED:
+            raise OSError('engine server cant open [{}]: {}'.format(name, payload))
+        self.alive = True
+
+    def on_frame(self, frame_type: int, payload: str):
+        """Handle a frame for this session."""
+        if frame_type in (FRAME_LINE, FRAME_INFO):
+            self.engine.on_line_received(payload)
+        elif frame_type == FRAME_CLOSE:
+            if self.alive:
+                self.alive = False
+                self.connection.release(self.session)
+                self.engine.on_terminated()
+
+    def is_alive(self):
+        """Return if the session is open."""
+        return self.alive
+
+    def terminate(self):
+        """Close the session - the server keeps the engine for the next client."""
+        if self.alive:
+            try:
+                self.connection.send(FRAME_CLOSE, self.session)
+            except OSError:
+                pass
+            self.on_frame(FRAME_CLOSE, '')
+
+    def kill(self):
+        """Same as terminate."""
+        self.terminate()
+
+    def send_line(self, string: str):
+        """Send an uci line to the engine."""
+        self.connection.send(FRAME_LINE, self.session, string)
+
+    def wait_for_return_code(self):
+        """Sessions have no return code."""
+        return 0
+
+    def pid(self):
+        """Sessions have no pid."""
+        return None
+
+    def __repr__(self):
+        return '<TcpProcess [{}] session {}>'.format(self.name, self.session)
+
+
+def tcp_spawn_engine(hostname: str, port: int, name: str, engine_cls):
+    """Open a session for an engine of the engine server and return the (uci) engine."""
+    engine = engine_cls()
+    TcpProcess(engine, TcpConnection.get(hostname, port), os.path.basename(name))
+    return engine
@@ -18,7 +18,57 @@
 import platform
 import configparser
 import os
-from uci.engine import UciEngine
+import chess
+import chess.uci
+from uci.engine import UciEngine, GO_PREFIX
+
+# positions (opening, middlegame, endgame) to measure the nodes an engine needs for a depth
+CALIBRATION_FENS = ('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+                    'r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N2N2/PP2BPPP/R2QKB1R w KQ - 0 9',
+                    '8/5pk1/6p1/8/3R4/6P1/5PK1/3r4 w - - 0 40')
+
+
+def calibrate_nodes(engine: UciEngine, max_depth=10):
+    """Return the nodes the engine needs to finish the depths 1..max_depth (max of the calibration positions)."""
+    handler = chess.uci.InfoHandler()
+    engine.engine.info_handlers.append(handler)
+    table = {}
+    for fen in CALIBRATION_FENS:
+        for depth in range(1, max_depth + 1):
+            engine.engine.ucinewgame()
+            engine.position(chess.Board(fen))
+            engine.engine.go(depth=depth)
+            with handler:
+                nodes = handler.info.get('nodes', 0)
+            table[depth] = max(table.get(depth, 1), nodes)
+    engine.engine.info_handlers.remove(handler)
+    return table
+
+
+def add_nodes_levels(parser: configparser.ConfigParser, table: dict, weak_share=0.5):
+    """Limit the search of the weak levels (first part of the sorted sections) by depth and nodes."""
+    sections = sorted(parser.sections())
+    for index, section in enumerate(sections[:int(len(sections) * weak_share)]):
+        depth = min(index + 1, max(table))
+        parser[section][GO_PREFIX + 'depth'] = str(depth)
+        parser[section][GO_PREFIX + 'nodes'] = str(table[depth] * 2)  # leave room for harder positions
+
+
+def write_nodes_ini(engine_file: str, weak_share=0.5):
+    """Calibrate the engine and add the depth & nodes limits to the weak levels of its uci file."""
+    parser = configparser.ConfigParser()
+    parser.optionxform = str
+    if not parser.read(engine_file + '.uci'):
+        return False
+    engine = UciEngine(engine_file, informer=False)
+    if not engine.engine:
+        return False
+    table = calibrate_nodes(engine)
+    engine.quit()
+    add_nodes_levels(parser, table, weak_share)
+    with open(engine_file + '.uci', 'w') as configfile:
+        parser.write(configfile)
+    return table
 
 
 def write_engine_ini(engine_path=None):
@@ -77,6 +127,7 @@ def write_engine_ini(engine_path=None):
                     level += lvl_inc
                     count += 1
                 parser['Level@{:02d}'.format(count)] = {'Strength': str(maxlevel)}
+            add_nodes_levels(parser, calibrate_nodes(engine))
             with open(engine_path + os.sep + engine_filename + '.uci', 'w') as configfile:
                 parser.write(configfile)
 
@@ -101,7 +152,7 @@ def write_engine_ini(engine_path=None):
     config.optionxform = str
     for engine_file_name in engine_list:
         if is_exe(engine_path + os.sep + engine_file_name):
-            engine = UciEngine(engine_path + os.sep + engine_file_name)
+            engine = UciEngine(engine_path + os.sep + engine_file_name, informer=False)
             if engine:
                 print(engine_file_name)
                 try:
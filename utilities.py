@@ -16,6 +16,7 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 import logging
+import logging.handlers
 import queue
 import os
 import platform
@@ -25,12 +26,15 @@ import json
 import time
 import copy
 import configparser
+import heapq
+import itertools
 
-from threading import Timer
-from subprocess import Popen, PIPE
+from threading import Timer, Thread, Condition, Lock, local, current_thread, active_count
+from collections import deque
+from subprocess import Popen, PIPE, TimeoutExpired
 
 from dgt.translate import DgtTranslate
-from dgt.api import Dgt
+from dgt.api import Dgt, Event
 
 from configobj import ConfigObj, ConfigObjError, DuplicateError
 
@@ -44,6 +48,195 @@ msgdisplay_devices = []
 dgtdisplay_devices = []
 
 
+class Tracer(object):
+
+    """Follow an input through events, messages and dgt commands by a correlation id."""
+
+    def __init__(self, size=20000):
+        super(Tracer, self).__init__()
+        self.enabled = False
+        self.hops = deque(maxlen=size)  # (trace_id, stage, monotonic time, thread name)
+        self.ids = itertools.count(1)
+        self.local = local()
+        self.lock = Lock()
+
+    def start(self, stage: str):
+        """Open a new trace on the current thread (an input like a board field update)."""
+        if self.enabled:
+            self.local.trace_id = next(self.ids)
+            self._add(self.local.trace_id, stage)
+
+    def stamp(self, obj, kind: str):
+        """Return the trace id for obj (its own, the one of this thread or a new one) before it is queued."""
+        if not self.enabled:
+            return None
+        trace_id = obj.trace_id or getattr(self.local, 'trace_id', None) or next(self.ids)
+        self._add(trace_id, kind + ':' + repr(obj))
+        return trace_id
+
+    @staticmethod
+    def copy(obj, trace_id):
+        """Return a deep copy of obj carrying the trace id - the original is never changed."""
+        obj_copy = copy.deepcopy(obj)
+        if trace_id is not None:
+            obj_copy.trace_id = trace_id
+        return obj_copy
+
+    def enter(self, obj, stage: str):
+        """Continue the trace of obj on this thread after it is taken from a queue."""
+        if self.enabled:
+            self.local.trace_id = obj.trace_id
+            if obj.trace_id is not None:
+                self._add(obj.trace_id, stage + ':' + repr(obj))
+
+    def current(self):
+        """Return the trace id of this thread."""
+        return getattr(self.local, 'trace_id', None)
+
+    def resume(self, trace_id, stage: str):
+        """Continue a trace on a callback thread."""
+        if self.enabled:
+            self.local.trace_id = trace_id
+            if trace_id is not None:
+                self._add(trace_id, stage)
+
+    def _add(self, trace_id: int, stage: str):
+        with self.lock:
+            self.hops.append((trace_id, stage, time.monotonic(), current_thread().name))
+
+    def _traces(self):
+        with self.lock:
+            hops = list(self.hops)
+        traces = {}
+        for hop in hops:
+            traces.setdefault(hop[0], []).append(hop)
+        for trace in traces.values():
+            trace.sort(key=lambda hop: hop[2])
+        return traces
+
+    def get_chrome_trace(self):
+        """Return the hops as chrome://tracing json (each hop lasts from the previous hop of its trace)."""
+        events = []
+        for trace_id, hops in self._traces().items():
+            start = hops[0][2]
+            for index, (_, stage, stamp, thread) in enumerate(hops):
+                begin = hops[index - 1][2] if index else stamp
+                events.append({'name': stage, 'ph': 'X', 'pid': 1, 'tid': thread, 'ts': int(begin * 1e6),
+                               'dur': int((stamp - begin) * 1e6),
+                               'args': {'trace_id': trace_id, 'since_start_ms': round((stamp - start) * 1000, 3)}})
+        return json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'})
+
+    def get_summary(self):
+        """Return p50/p95/p99 latencies (ms) for every stage, measured from the previous hop of the trace."""
+        samples = {}
+        for hops in self._traces().values():
+            for index in range(1, len(hops)):
+                samples.setdefault(hops[index][1], []).append((hops[index][2] - hops[index - 1][2]) * 1000)
+        summary = {}
+        for stage, values in samples.items():
+            values.sort()
+            summary[stage] = {'count': len(values)}
+            for name, quantile in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+                summary[stage][name] = round(values[min(int(len(values) * quantile), len(values) - 1)], 3)
+        return summary
+
+
+tracer = Tracer()
+
+
+class Metrics(object):
+
+    """Counters, gauges and histograms rendered in the prometheus text format."""
+
+    buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)  # secs
+
+    def __init__(self):
+        super(Metrics, self).__init__()
+        self.lock = Lock()
+        self.values = {}  # name => (type, {labels: value}) - a histogram value is [bucket counts.., sum, count]
+        self.collectors = []  # functions called at scrape time, returning [(name, labels, value)] gauges
+
+    def _get(self, name: str, kind: str, labels: dict):
+        key = tuple(sorted(labels.items()))
+        series = self.values.setdefault(name, (kind, {}))[1]
+        return series, key
+
+    def inc(self, name: str, value=1, **labels):
+        """Increase a counter."""
+        with self.lock:
+            series, key = self._get(name, 'counter', labels)
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value, **labels):
+        """Set a gauge."""
+        with self.lock:
+            series, key = self._get(name, 'gauge', labels)
+            series[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """Add a value to a histogram."""
+        with self.lock:
+            series, key = self._get(name, 'histogram', labels)
+            if key not in series:
+                series[key] = [0] * (len(self.buckets) + 2)
+            histogram = series[key]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[index] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def add_collector(self, collector):
+        """Register a function returning gauges which are only computed when scraped."""
+        self.collectors.append(collector)
+
+    def render(self):
+        """Return all metrics in the prometheus text format."""
+        def _labels(key, extra=()):
+            pairs = list(key) + list(extra)
+            return '{' + ','.join('{}="{}"'.format(name, value) for name, value in pairs) + '}' if pairs else ''
+
+        lines = []
+        collected = {}
+        for collector in self.collectors:
+            for name, labels, value in collector():
+                collected.setdefault(name, []).append((tuple(sorted(labels.items())), value))
+        for name, samples in sorted(collected.items()):
+            lines.append('# TYPE {} gauge'.format(name))
+            lines.extend('{}{} {}'.format(name, _labels(key), value) for key, value in samples)
+        with self.lock:
+            values = {name: (kind, dict(series)) for name, (kind, series) in self.values.items()}
+        for name, (kind, series) in sorted(values.items()):
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for key, value in series.items():
+                if kind == 'histogram':
+                    for index, bound in enumerate(self.buckets):
+                        lines.append('{}_bucket{} {}'.format(name, _labels(key, (('le', bound),)), value[index]))
+                    lines.append('{}_bucket{} {}'.format(name, _labels(key, (('le', '+Inf'),)), value[-1]))
+                    lines.append('{}_sum{} {}'.format(name, _labels(key), value[-2]))
+                    lines.append('{}_count{} {}'.format(name, _labels(key), value[-1]))
+                else:
+                    lines.append('{}{} {}'.format(name, _labels(key), value))
+        return '\n'.join(lines) + '\n'
+
+
+def _queue_metrics():
+    gauges = [('picochess_queue_depth', {'queue': 'evt_queue'}, evt_queue.qsize()),
+              ('picochess_queue_depth', {'queue': 'dispatch_queue'}, dispatch_queue.qsize()),
+              ('picochess_threads', {}, active_count())]
+    for display in msgdisplay_devices:
+        gauges.append(('picochess_queue_depth', {'queue': 'msg_queue', 'display': type(display).__name__},
+                       display.msg_queue.qsize()))
+    for display in dgtdisplay_devices:
+        gauges.append(('picochess_queue_depth', {'queue': 'dgt_queue', 'display': display.get_name()},
+                       display.dgt_queue.qsize()))
+    return gauges
+
+
+metrics = Metrics()
+metrics.add_collector(_queue_metrics)
+
+
 class Observable(object):
 
     """Input devices are observable."""
@@ -54,7 +247,8 @@ class Observable(object):
     @staticmethod
     def fire(event):
         """Put an event on the Queue."""
-        evt_queue.put(copy.deepcopy(event))
+        trace_id = tracer.stamp(event, 'evt')
+        evt_queue.put(tracer.copy(event, trace_id))
 
 
 class DispatchDgt(object):
@@ -67,7 +261,10 @@ class DispatchDgt(object):
     @staticmethod
     def fire(dgt):
         """Put an event on the Queue."""
-        dispatch_queue.put(copy.deepcopy(dgt))
+        trace_id = tracer.stamp(dgt, 'dgt')
+        dgt_copy = tracer.copy(dgt, trace_id)
+        dgt_copy.fired = time.monotonic()
+        dispatch_queue.put(dgt_copy)
 
 
 class DisplayMsg(object):
@@ -82,8 +279,9 @@ class DisplayMsg(object):
     @staticmethod
     def show(message):
         """Send a message on each display device."""
+        trace_id = tracer.stamp(message, 'msg')
         for display in msgdisplay_devices:
-            display.msg_queue.put(copy.deepcopy(message))
+            display.msg_queue.put(tracer.copy(message, trace_id))
 
 
 class DisplayDgt(object):
@@ -101,6 +299,13 @@ class DisplayDgt(object):
         for display in dgtdisplay_devices:
             display.dgt_queue.put(copy.deepcopy(message))
 
+    @staticmethod
+    def show_dev(message, dev: str):
+        """Send a message only to the display device dev - the message is handed over, not copied."""
+        for display in dgtdisplay_devices:
+            if display.get_name() == dev:
+                display.dgt_queue.put(message)
+
 
 class RepeatedTimer(object):
 
@@ -141,6 +346,207 @@ class RepeatedTimer(object):
             logging.info('repeated timer already stopped - strange!')
 
 
+class DeadlineScheduler(object):
+
+    """Call functions at monotonic deadlines - one thread serves all clock timers."""
+
+    def __init__(self):
+        super(DeadlineScheduler, self).__init__()
+        self.heap = []  # (deadline, handle, function, args)
+        self.cancelled = set()
+        self.handles = itertools.count(1)
+        self.cond = Condition()
+        self.thread = None
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while True:
+                    while self.heap and self.heap[0][1] in self.cancelled:
+                        self.cancelled.discard(heapq.heappop(self.heap)[1])
+                    if not self.heap:
+                        self.cond.wait()
+                        continue
+                    delay = self.heap[0][0] - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self.cond.wait(delay)
+                _, _, function, args = heapq.heappop(self.heap)
+            try:
+                function(*args)
+            except Exception:  # dont let one bad timer stop all clocks
+                logging.exception('scheduled function %s failed', function)
+
+    def schedule_at(self, deadline: float, function, *args):
+        """Call function at the time.monotonic() deadline. Return a handle for cancel()."""
+        handle = next(self.handles)
+        with self.cond:
+            if self.thread is None:
+                self.thread = Thread(target=self._run, name='DeadlineScheduler', daemon=True)
+                self.thread.start()
+            heapq.heappush(self.heap, (deadline, handle, function, args))
+            self.cond.notify()
+        return handle
+
+    def schedule(self, delay: float, function, *args):
+        """Call function after delay secs. Return a handle for cancel()."""
+        return self.schedule_at(time.monotonic() + delay, function, *args)
+
+    def cancel(self, handle):
+        """Cancel a scheduled function (if its not already called)."""
+        with self.cond:
+            if any(entry[1] == handle for entry in self.heap):
+                self.cancelled.add(handle)
+                self.cond.notify()
+
+
+clock_scheduler = DeadlineScheduler()
+
+
+class IdleManager(object):
+
+    """Step picochess down if nobody plays: first stop the engine search, later slow down polling and timers."""
+
+    STATES = ('active', 'quiet', 'sleep')
+
+    def __init__(self):
+        super(IdleManager, self).__init__()
+        self.quiet_after = 0  # secs without user input until the search is stopped (0 = never)
+        self.sleep_after = 0  # secs without user input until polling & timers slow down (0 = never)
+        self.state = 'active'
+        self.last_input = time.monotonic()
+        self.cond = Condition()
+        self.timers = []  # (timer, interval, sleep interval)
+        self.check_timer = None
+
+    def configure(self, quiet_after: int, sleep_after: int):
+        """Set the idle times and start checking them."""
+        self.quiet_after = quiet_after
+        self.sleep_after = sleep_after
+        if (quiet_after or sleep_after) and self.check_timer is None:
+            self.check_timer = RepeatedTimer(5, self._check)
+            self.check_timer.start()
+
+    def touch(self, source: str):
+        """Somebody is using picochess - wake up if needed."""
+        self.last_input = time.monotonic()
+        if self.state != 'active':
+            logging.info('woken up by %s after state %s', source, self.state)
+            self._set_state('active')
+
+    def _check(self):
+        idle = time.monotonic() - self.last_input
+        if self.sleep_after and idle >= self.sleep_after:
+            state = 'sleep'
+        elif self.quiet_after and idle >= self.quiet_after:
+            state = 'quiet'
+        else:
+            return
+        if state != self.state:
+            logging.info('no user input for %i secs => state %s', idle, state)
+            self._set_state(state)
+
+    def _set_state(self, state: str):
+        self.state = state
+        metrics.set('picochess_idle_state', self.STATES.index(state))
+        for timer, interval, sleep_interval in self.timers:
+            timer.interval = sleep_interval if state == 'sleep' else interval  # used from its next run
+        if state == 'active':
+            with self.cond:
+                self.cond.notify_all()
+        Observable.fire(Event.IDLE(state=state))
+
+    def add_timer(self, timer: RepeatedTimer, sleep_interval: float):
+        """Run this timer with the sleep interval while sleeping."""
+        self.timers.append((timer, timer.interval, sleep_interval))
+
+    def is_sleeping(self):
+        """Return if polling should slow down."""
+        return self.state == 'sleep'
+
+    def wait(self, interval: float, sleep_interval: float):
+        """Sleep interval secs (sleep_interval while sleeping - but return at once on a wakeup)."""
+        if self.state == 'sleep':
+            with self.cond:
+                self.cond.wait(sleep_interval)
+        else:
+            time.sleep(interval)
+
+
+idle_manager = IdleManager()
+
+
+class JsonLogFormatter(logging.Formatter):
+
+    """Format a log record as one compact json line (see logview.py)."""
+
+    def format(self, record):
+        line = {'t': round(record.created, 3), 'l': record.levelname, 'm': record.module, 'f': record.funcName,
+                'th': record.threadName, 'msg': record.getMessage()}
+        if record.exc_info:
+            line['exc'] = self.formatException(record.exc_info)
+        return json.dumps(line, separators=(',', ':'))
+
+
+class LogWriter(Thread):
+
+    """Write the log records of all threads in batches from one background thread."""
+
+    def __init__(self, filename: str, formatter: logging.Formatter, max_bytes: int, backup_count: int, batch=200):
+        super(LogWriter, self).__init__(daemon=True)
+        self.records = queue.Queue()  # no SimpleQueue - it needs python 3.7
+        self.handler = logging.handlers.RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count)
+        self.handler.setFormatter(formatter)
+        self.max_bytes = max_bytes
+        self.batch = batch
+        self.stats = {'records': 0, 'batches': 0, 'rollovers': 0}
+
+    def get_handler(self):
+        """Return the (cheap) handler for the caller threads - it only puts the records on the queue."""
+        handler = logging.handlers.QueueHandler(self.records)
+        # prepare() formats the message with this formatter - the default one would prefix it with level & logger name
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        return handler
+
+    def _write(self, records: list):
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.handler.format(record))
+            except Exception:  # never let a bad record kill the writer
+                self.handler.handleError(record)
+        if self.handler.stream is None:
+            self.handler.stream = self.handler._open()
+        self.handler.stream.write(self.handler.terminator.join(lines) + self.handler.terminator)
+        self.handler.flush()
+        self.stats['records'] += len(records)
+        self.stats['batches'] += 1
+        if self.handler.stream.tell() >= self.max_bytes:
+            self.handler.doRollover()
+            self.stats['rollovers'] += 1
+
+    def run(self):
+        """Call by threading.Thread start() function."""
+        while True:
+            records = [self.records.get()]
+            while len(records) < self.batch:
+                try:
+                    records.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in records
+            self._write([record for record in records if record is not None])
+            if stop:
+                break
+
+    def stop(self):
+        """Write the pending records and end the thread."""
+        if self.is_alive():
+            self.records.put(None)
+            self.join(2)
+        self.handler.close()
+
+
 def get_opening_books():
     """Build an opening book lib."""
     config = configparser.ConfigParser()
@@ -172,14 +578,20 @@ def hms_time(seconds: int):
     return hours, mins, secs
 
 
-def do_popen(command, log=True, force_en_env=False):
+def do_popen(command, log=True, force_en_env=False, timeout=None):
     """Connect via Popen and log the result."""
     if force_en_env:  # force an english environment
         force_en_env = os.environ.copy()
         force_en_env['LC_ALL'] = 'C'
-        stdout, stderr = Popen(command, stdout=PIPE, stderr=PIPE, env=force_en_env).communicate()
+        process = Popen(command, stdout=PIPE, stderr=PIPE, env=force_en_env)
     else:
-        stdout, stderr = Popen(command, stdout=PIPE, stderr=PIPE).communicate()
+        process = Popen(command, stdout=PIPE, stderr=PIPE)
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except TimeoutExpired:
+        logging.warning('%s not finished after %i secs', command, timeout)
+        process.kill()
+        stdout, stderr = process.communicate()
     if log:
         logging.debug([output.decode(encoding='UTF-8') for output in [stdout, stderr]])
     return stdout.decode(encoding='UTF-8')
@@ -204,14 +616,14 @@ def checkout_tag(tag):
     do_popen(['pip3', 'install', '-r', 'requirements.txt'])
 
 
-def update_picochess(dgtpi: bool, auto_reboot: bool, dgttranslate: DgtTranslate):
-    """Update picochess from git."""
+def update_picochess(auto_reboot: bool, dgttranslate: DgtTranslate):
+    """Update picochess from git - the reboot is only requested, picochess does it once no game is running."""
     git = git_name()
 
     branch = do_popen([git, 'rev-parse', '--abbrev-ref', 'HEAD'], log=False).rstrip()
     if branch == 'stable' or branch == 'master':
         # Fetch remote repo
-        do_popen([git, 'remote', 'update'])
+        do_popen([git, 'remote', 'update'], timeout=60)
         # Check if update is needed - need to make sure, we get english answers
         output = do_popen([git, 'status', '-uno'], force_en_env=True)
         if 'up-to-date' not in output:
@@ -221,7 +633,7 @@ def update_picochess(dgtpi: bool, auto_reboot: bool, dgttranslate: DgtTranslate)
             do_popen([git, 'pull', 'origin', branch])
             do_popen(['pip3', 'install', '-r', 'requirements.txt'])
             if auto_reboot:
-                reboot(dgtpi, dev='web')
+                Observable.fire(Event.REBOOT(dev='update'))
             else:
                 time.sleep(2)  # give time to display the "update" message
         else:
@@ -256,11 +668,12 @@ def get_location():
     """Return the location of the user and the external and interal ip adr."""
     try:
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(2)
         sock.connect(('8.8.8.8', 80))
         int_ip = sock.getsockname()[0]
         sock.close()
 
-        response = urllib.request.urlopen('https://freegeoip.net/json/')
+        response = urllib.request.urlopen('https://freegeoip.net/json/', timeout=5)
         j = json.loads(response.read().decode())
         country_name = j['country_name'] + ' ' if 'country_name' in j else ''
         country_code = j['country_code'] + ' ' if 'country_code' in j else ''